@@ -45,12 +45,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'properties.metrics.MetricsMiddleware',  # first, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware should be at the top
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'properties.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -134,9 +136,149 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Listing images and their resized derivatives (properties.media). Uploads go
+# to MEDIA_STORAGE_BACKEND: LocalMediaStorage writes under MEDIA_ROOT (served at
+# MEDIA_BASE_URL + MEDIA_URL, by Django itself only when DEBUG is on), and
+# FirebaseMediaStorage uploads to FIREBASE_STORAGE_BUCKET. Derivatives are
+# rendered by MEDIA_PROCESS_WORKERS processes (0 = min(4, CPUs))
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', str(BASE_DIR / 'media'))
+MEDIA_BASE_URL = os.getenv('MEDIA_BASE_URL', 'http://localhost:8000')
+MEDIA_STORAGE_BACKEND = os.getenv('MEDIA_STORAGE_BACKEND', 'properties.media.LocalMediaStorage')
+FIREBASE_STORAGE_BUCKET = os.getenv('FIREBASE_STORAGE_BUCKET', '')
+MEDIA_PROCESS_WORKERS = int(os.getenv('MEDIA_PROCESS_WORKERS', '0'))
+MEDIA_WEBP_QUALITY = 80
+MEDIA_JPEG_QUALITY = 82
+MEDIA_MAX_UPLOAD_BYTES = int(os.getenv('MEDIA_MAX_UPLOAD_BYTES', str(15 * 1024 * 1024)))
+MEDIA_MAX_SOURCE_BYTES = int(os.getenv('MEDIA_MAX_SOURCE_BYTES', str(20 * 1024 * 1024)))
+MEDIA_FETCH_TIMEOUT = 20  # seconds
+
 # Firebase settings (can be set via environment variable)
 FIREBASE_CREDENTIALS_PATH = os.getenv('FIREBASE_CREDENTIALS_PATH', 'path/to/your/firebase/serviceAccountKey.json')  # Update with actual path or set env var
 
+# Firebase ID token authentication (properties.authentication). The verifier is
+# a dotted path so tests can swap in an offline fake
+FIREBASE_TOKEN_VERIFIER = 'firebase_config.verify_firebase_token'
+FIREBASE_TOKEN_CACHE_SIZE = 10000
+FIREBASE_USER_CACHE_SIZE = 10000
+FIREBASE_USER_CACHE_TTL = 300  # seconds
+
+# Caches. Anonymous property reads are cached in the 'responses' alias; point
+# RESPONSE_CACHE_BACKEND/LOCATION at a file or Redis cache to share it between
+# processes (locmem only invalidates within the process that did the write)
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+RESPONSE_CACHE_LOCATION = os.getenv('RESPONSE_CACHE_LOCATION', 'fabhomes-responses')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': RESPONSE_CACHE_BACKEND,
+        'LOCATION': RESPONSE_CACHE_LOCATION,
+        'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', '60')),
+    },
+    # Generation counters (properties.cache) never expire and are kept apart
+    # from the entries, so culling entries never resets a counter. Redis can
+    # share the responses' server; other backends need a location of their own
+    'response_generations': {
+        'BACKEND': RESPONSE_CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'RESPONSE_GENERATION_CACHE_LOCATION',
+            RESPONSE_CACHE_LOCATION if 'redis' in RESPONSE_CACHE_BACKEND else 'fabhomes-response-generations',
+        ),
+        'TIMEOUT': None,
+    },
+}
+if 'redis' not in RESPONSE_CACHE_BACKEND:
+    CACHES['responses']['OPTIONS'] = {'MAX_ENTRIES': 5000}
+    # Room for a counter per listing, user and agency; entries are a few bytes
+    CACHES['response_generations']['OPTIONS'] = {'MAX_ENTRIES': 1000000}
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_GENERATION_CACHE_ALIAS = 'response_generations'
+# Whether every process sees the same response cache. Only then are cached
+# detail documents served to signed-in users: with a per-process cache a user
+# who edits a listing could read another process's copy from before the edit
+RESPONSE_CACHE_SHARED = os.getenv(
+    'RESPONSE_CACHE_SHARED', str('locmem' not in RESPONSE_CACHE_BACKEND.lower())
+).lower() == 'true'
+# Property detail documents are cached for every client (see
+# RESPONSE_CACHE_SHARED) and invalidated by signals; the timeout only bounds how stale views_count can get
+PROPERTY_DETAIL_CACHE_TIMEOUT = int(os.getenv('PROPERTY_DETAIL_CACHE_TIMEOUT', '300'))
+
+# Buffered view counting: seconds between background flushes (0 disables the
+# timer) and the number of distinct listings buffered before a forced flush
+VIEW_COUNT_FLUSH_INTERVAL = float(os.getenv('VIEW_COUNT_FLUSH_INTERVAL', '5'))
+VIEW_COUNT_MAX_PENDING = int(os.getenv('VIEW_COUNT_MAX_PENDING', '1000'))
+
+# Per-user favorite id sets (properties.favorites), kept in the response cache
+# backend so every process sees toggles
+FAVORITES_CACHE_ALIAS = RESPONSE_CACHE_ALIAS
+FAVORITES_CACHE_TIMEOUT = int(os.getenv('FAVORITES_CACHE_TIMEOUT', '300'))
+
+# Background tasks (properties.taskqueue): jobs live in the properties_task
+# table. TASK_WORKER_IN_PROCESS runs them on a thread of each web process,
+# woken on commit; turn it off when `manage.py run_tasks` workers are deployed.
+# Failed jobs retry after TASK_RETRY_BASE_DELAY * 2^(attempt - 1) seconds (at
+# most TASK_RETRY_MAX_DELAY), and jobs left running for TASK_LOCK_TIMEOUT
+# seconds by a dead worker are picked up again
+TASK_WORKER_IN_PROCESS = os.getenv('TASK_WORKER_IN_PROCESS', 'true').lower() == 'true'
+TASK_BATCH_SIZE = int(os.getenv('TASK_BATCH_SIZE', '20'))
+TASK_POLL_INTERVAL = float(os.getenv('TASK_POLL_INTERVAL', '5'))
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', '5'))
+TASK_RETRY_BASE_DELAY = float(os.getenv('TASK_RETRY_BASE_DELAY', '5'))
+TASK_RETRY_MAX_DELAY = float(os.getenv('TASK_RETRY_MAX_DELAY', '3600'))
+TASK_LOCK_TIMEOUT = int(os.getenv('TASK_LOCK_TIMEOUT', '600'))
+TASK_RETENTION_DAYS = float(os.getenv('TASK_RETENTION_DAYS', '7'))
+
+# Notification email sent by background tasks; the console backend prints it
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'FabHomes <noreply@fabhomes.local>')
+
+# Serve property and agency reads from the async views in properties.async_views.
+# asgi.py turns this on; under WSGI every async view would need its own event loop
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'false').lower() == 'true'
+
+# Render listing cards (list, search, similar, favorites, agency properties)
+# from values() rows instead of model instances; see properties.cards
+FAST_LIST_SERIALIZATION = os.getenv('FAST_LIST_SERIALIZATION', 'true').lower() == 'true'
+
+# Lower bounds of the price buckets in ?facets= counts (the last is open-ended)
+FACET_PRICE_BUCKETS = (0, 100_000, 1_000_000, 10_000_000, 50_000_000)
+
+# Full-text search: dotted path to a properties.search backend (picked from the
+# database vendor when empty) and the Postgres text search configuration
+PROPERTY_SEARCH_BACKEND = os.getenv('PROPERTY_SEARCH_BACKEND', '')
+PROPERTY_SEARCH_CONFIG = 'english'
+
+# Seconds before the in-process similar-listings index is rebuilt from scratch (in
+# the background). Writes from other processes trigger a rebuild sooner when the
+# response cache backend is shared
+SIMILARITY_INDEX_MAX_AGE = int(os.getenv('SIMILARITY_INDEX_MAX_AGE', '3600'))
+
+# Request metrics served at /api/metrics/ (Prometheus format) to staff users,
+# scrapers sending "Authorization: Bearer <METRICS_TOKEN>" and, if listed,
+# METRICS_ALLOWED_IPS (empty by default: behind a reverse proxy every client
+# shares the proxy's address). SQL statements slower than SLOW_QUERY_THRESHOLD_MS
+# (0 disables) are logged as warnings by the properties.metrics logger
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip]
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '200'))
+
+# Request profiling (see properties/profiling.py): staff can send X-Profile: 1,
+# PROFILING_VIEWS lists view labels to always profile (e.g.
+# "PropertyViewSet.search,PropertyViewSet.list"), and PROFILING_SAMPLE_RATE
+# profiles a random fraction of requests. Only the newest PROFILING_MAX_FILES
+# profiles are kept in PROFILING_DIR
+PROFILING_ENGINE = os.getenv('PROFILING_ENGINE', 'cprofile')
+PROFILING_VIEWS = [view for view in os.getenv('PROFILING_VIEWS', '').split(',') if view]
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DIR = os.getenv('PROFILING_DIR', str(BASE_DIR / 'profiles'))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', '200'))
+
 # CORS settings - Allow frontend to access API
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # Vite default port
@@ -149,6 +291,11 @@ CORS_ALLOW_CREDENTIALS = True
 
 # REST Framework settings
 REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'properties.authentication.FirebaseAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
@@ -157,6 +304,11 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    # Same bytes as JSONRenderer, rendered by orjson (see properties.renderers)
+    'DEFAULT_RENDERER_CLASSES': [
+        'properties.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 12,
     'DEFAULT_THROTTLE_CLASSES': [
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse
@@ -22,3 +24,6 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('properties.urls')),
 ]
+
+# Locally stored listing images; production serves MEDIA_ROOT from the web server or a bucket
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,16 +1,19 @@
 from django.contrib import admin
+from django.utils import timezone
+from django.utils.html import format_html
 from .models import (
     Agency, UserProfile, Property, Inquiry,
-    Favorite, Review, Transaction
+    Favorite, Review, Transaction, PlatformStats, RequestProfile, Task
 )
+from .profiling import profile_summary
 
 
 @admin.register(Agency)
 class AgencyAdmin(admin.ModelAdmin):
-    list_display = ['name', 'email', 'verification_status', 'created_at']
+    list_display = ['name', 'email', 'verification_status', 'agents_count', 'properties_count', 'created_at']
     list_filter = ['verification_status', 'created_at']
     search_fields = ['name', 'email']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['agents_count', 'properties_count', 'created_at', 'updated_at']
 
 
 @admin.register(UserProfile)
@@ -89,3 +92,45 @@ class TransactionAdmin(admin.ModelAdmin):
     search_fields = ['property__title', 'buyer__email', 'seller__email']
     readonly_fields = ['created_at', 'updated_at']
 
+
+@admin.register(PlatformStats)
+class PlatformStatsAdmin(admin.ModelAdmin):
+    list_display = ['total_properties', 'available_properties', 'total_inquiries', 'total_users', 'as_of']
+    readonly_fields = PlatformStats.COUNTER_FIELDS + ['as_of']
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'method', 'path', 'view', 'status_code', 'duration_ms', 'query_count', 'sql_ms', 'trigger']
+    list_filter = ['view', 'trigger', 'status_code', 'created_at']
+    search_fields = ['path', 'view']
+    readonly_fields = [
+        'method', 'path', 'view', 'status_code', 'trigger', 'engine', 'duration_ms',
+        'query_count', 'sql_ms', 'file_name', 'user', 'created_at', 'report',
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Hot spots')
+    def report(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto">{}</pre>', profile_summary(obj))
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'last_error']
+    readonly_fields = ['attempts', 'locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at']
+    actions = ['retry']
+
+    @admin.action(description='Queue selected tasks to run again now')
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=timezone.now(), locked_by='', locked_at=None, finished_at=None,
+        )
+        self.message_user(request, f'{updated} task(s) queued.')
@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 
 class PropertiesConfig(AppConfig):
+    default_auto_field = 'django.db.models.AutoField'
     name = 'properties'
+
+    def ready(self):
+        from . import signals, tasks  # noqa: F401
@@ -0,0 +1,244 @@
+"""
+Async read endpoints for properties and agencies.
+
+With ASYNC_READ_VIEWS on (asgi.py turns it on by default), GET requests for
+the property list, search, detail and similar listings, and for the agency
+endpoints, are served by the coroutines below. Other methods fall through to
+the DRF viewsets.
+
+Each endpoint still uses its viewset for authentication, permissions,
+throttling, filtering, pagination and serialization. Response shapes, cache
+entries and metrics labels therefore match the sync path. Only data access
+differs: it goes through the async ORM, and independent queries are gathered.
+Those are a page and its count, a listing and its reviews, and an agency and
+its page of listings.
+
+Django runs one request's async ORM calls on that request's worker thread, so
+gathered queries still reach the database one after another. The event loop,
+though, keeps serving other requests while this one waits. Serializers must
+not touch the database here. A lazy relation raises SynchronousOnlyOperation
+instead of silently adding a query.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+from django.urls import path
+from rest_framework.response import Response
+
+from .cache import (
+    LIST_GENERATION, detail_generation, property_dependencies, response_cache
+)
+from .cards import ain_bulk
+from .facets import afacet_counts, requested_facets
+from .favorites import afavorite_ids_for
+from .fieldsets import requested_fieldset, wanted
+from .models import Property, Review, UserProfile
+from .serializers import PropertyListSerializer, UserProfileSerializer, RECENT_REVIEWS
+from .similarity import similarity_index
+from .views import AgencyViewSet, PropertyViewSet, card_rows, listing_queryset
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+async def gather(*awaitables):
+    """``asyncio.gather`` that cancels the other awaitables when one fails"""
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def _alist(queryset):
+    return [row async for row in queryset]
+
+
+async def aget_object(view):
+    """``GenericAPIView.get_object`` on the async ORM"""
+    queryset = view.filter_queryset(view.get_queryset())
+    lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+    try:
+        obj = await queryset.aget(**{view.lookup_field: view.kwargs[lookup_url_kwarg]})
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+    view.check_object_permissions(view.request, obj)
+    return obj
+
+
+async def paginated(view, queryset, serializer_class=None, facets=None, favorites=False, context=None):
+    """
+    A paginated response for ``queryset``. ``facets`` builds the queryset
+    for ``?facets=`` counts, and ``favorites`` adds ``is_favorite`` flags
+    for signed-in users; both are gathered with the page. ``context``
+    replaces the view's serializer context.
+    """
+    names = requested_facets(view.request) if facets is not None else ()
+    page, counts, favorite_ids = await gather(
+        view.paginator.apaginate_queryset(queryset, view.request, view=view),
+        afacet_counts(facets(), names) if names else _none(),
+        afavorite_ids_for(view.request) if favorites else _none(),
+    )
+
+    serializer_class = serializer_class or view.get_serializer_class()
+    context = view.get_serializer_context() if context is None else context
+    if favorites:
+        context['favorite_ids'] = favorite_ids
+    serializer = serializer_class(page, many=True, context=context)
+    response = view.get_paginated_response(serializer.data)
+    if names:
+        response.data['facets'] = counts
+    return response
+
+
+async def _none():
+    return None
+
+
+def async_read_view(viewset, actions, read, **initkwargs):
+    """
+    A URL view for one viewset route. ``read(view, request, **kwargs)`` serves
+    GET and HEAD; everything else goes to the viewset's own view.
+    """
+    fallback = viewset.as_view(actions, **initkwargs)
+    actions = dict(actions, head=actions['get'])
+
+    async def view(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return await sync_to_async(fallback)(request, *args, **kwargs)
+
+        self = viewset(action_map=actions, **initkwargs)
+        self.args, self.kwargs = args, kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            # Authentication and throttling are synchronous and may hit the database or cache
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            response = await read(self, request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    # Same labels in metrics.py, and DRF's own CSRF handling, as the viewset route
+    view.cls = viewset
+    view.actions = actions
+    view.initkwargs = initkwargs
+    view.csrf_exempt = True
+    return view
+
+
+async def list_properties(view, request):
+    async def compute():
+        queryset = card_rows(view.filter_queryset(view.get_queryset()), view.get_fieldset())
+        return await paginated(
+            view, queryset, facets=lambda: view.filter_queryset(Property.objects.all()),
+            favorites=wanted(view.get_fieldset(), 'is_favorite'),
+        )
+    return await response_cache.aserve(request, 'PropertyViewSet.list', [LIST_GENERATION], compute)
+
+
+async def search_properties(view, request):
+    async def compute():
+        queryset = card_rows(view.search_queryset(request, view.get_queryset()), view.get_fieldset())
+        return await paginated(
+            view, queryset, facets=lambda: view.search_queryset(request, Property.objects.all()),
+            favorites=wanted(view.get_fieldset(), 'is_favorite'),
+        )
+    return await response_cache.aserve(request, 'PropertyViewSet.search', [LIST_GENERATION], compute)
+
+
+async def retrieve_property(view, request, pk):
+    fieldset = view.get_fieldset()
+
+    async def load():
+        # The listing and its newest reviews only share the URL's id, so fetch them together
+        queryset = view.filter_queryset(view.get_queryset().prefetch_related(None))
+        reviews = Review.objects.filter(property_id=pk).select_related('reviewer')
+        try:
+            instance, recent_reviews = await gather(
+                queryset.aget(pk=pk), _alist(reviews[:RECENT_REVIEWS])
+            )
+        except Property.DoesNotExist:
+            raise Http404('No Property matches the given query.')
+        instance.recent_reviews = recent_reviews
+        return instance, property_dependencies(instance)
+
+    data, hit = await response_cache.adocument(
+        request, 'property-detail', detail_generation(pk), load, lambda instance: view.get_serializer(instance).data,
+        timeout=getattr(settings, 'PROPERTY_DETAIL_CACHE_TIMEOUT', 300),
+    )
+    response = Response(data if fieldset is None else fieldset.trim(data))
+    response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+
+async def similar_properties(view, request, pk):
+    async def compute():
+        # Loading the favorite set here lets get_serializer_context read it from the request
+        fieldset = view.get_fieldset()
+        property_obj, _ = await gather(
+            aget_object(view), afavorite_ids_for(request) if wanted(fieldset, 'is_favorite') else _none()
+        )
+        ids = await sync_to_async(similarity_index.similar)(property_obj, k=5)
+        similar = await ain_bulk(card_rows(listing_queryset(fieldset), fieldset), ids)
+        serializer = PropertyListSerializer(
+            [similar[i] for i in ids if i in similar], many=True, context=view.get_serializer_context()
+        )
+        return Response(serializer.data)
+    return await response_cache.aserve(
+        request, 'PropertyViewSet.similar', [LIST_GENERATION, detail_generation(pk)], compute
+    )
+
+
+async def list_agencies(view, request):
+    return await paginated(view, view.filter_queryset(view.get_queryset()))
+
+
+async def retrieve_agency(view, request, pk):
+    return Response(view.get_serializer(await aget_object(view)).data)
+
+
+async def agency_properties(view, request, pk):
+    fieldset = requested_fieldset(request, PropertyListSerializer)
+    properties = card_rows(listing_queryset(fieldset).filter(agency_id=pk, status='available'), fieldset)
+    _, response = await gather(aget_object(view), paginated(
+        view, properties, PropertyListSerializer, favorites=wanted(fieldset, 'is_favorite'),
+        context={'request': request, 'fieldset': fieldset},
+    ))
+    return response
+
+
+async def agency_agents(view, request, pk):
+    agents = UserProfile.objects.filter(agency_id=pk).select_related('user').order_by(
+        'user__first_name', 'user__last_name', 'pk'
+    )
+    _, response = await gather(aget_object(view), paginated(view, agents, UserProfileSerializer))
+    return response
+
+
+# Listed ahead of the router's routes, which they shadow for reads. Ids use the
+# uuid converter so that list actions such as clusters/ never match a detail route
+urlpatterns = [
+    path('properties/', async_read_view(
+        PropertyViewSet, {'get': 'list', 'post': 'create'}, list_properties, basename='property', detail=False)),
+    path('properties/search/', async_read_view(
+        PropertyViewSet, {'get': 'search'}, search_properties, basename='property', detail=False)),
+    path('properties/<uuid:pk>/', async_read_view(
+        PropertyViewSet, {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+        retrieve_property, basename='property', detail=True)),
+    path('properties/<uuid:pk>/similar/', async_read_view(
+        PropertyViewSet, {'get': 'similar'}, similar_properties, basename='property', detail=True)),
+    path('agencies/', async_read_view(
+        AgencyViewSet, {'get': 'list'}, list_agencies, basename='agency', detail=False)),
+    path('agencies/<uuid:pk>/', async_read_view(
+        AgencyViewSet, {'get': 'retrieve'}, retrieve_agency, basename='agency', detail=True)),
+    path('agencies/<uuid:pk>/properties/', async_read_view(
+        AgencyViewSet, {'get': 'properties'}, agency_properties, basename='agency', detail=True)),
+    path('agencies/<uuid:pk>/agents/', async_read_view(
+        AgencyViewSet, {'get': 'agents'}, agency_agents, basename='agency', detail=True)),
+]
@@ -0,0 +1,152 @@
+"""
+Firebase ID token authentication for DRF.
+
+Verifying a Firebase token means an RS256 signature check against Google's
+public certificates (which firebase_admin fetches once and keeps in its
+HTTP-cached session) plus a profile lookup. Both results are kept in bounded
+in-process caches: verified claims until the token's ``exp``, and the
+uid -> User mapping for FIREBASE_USER_CACHE_TTL seconds or until the user or
+profile changes (see signals.py).
+
+The verifier is configurable through FIREBASE_TOKEN_VERIFIER so tests can
+run offline with a fake.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework import authentication, exceptions
+
+from .models import UserProfile
+
+_MISSING = object()
+
+
+class ExpiringLRUCache:
+    """Thread-safe LRU mapping whose entries also carry an absolute expiry time"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [k for k, (_, value) in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+token_cache = ExpiringLRUCache(getattr(settings, 'FIREBASE_TOKEN_CACHE_SIZE', 10000))
+user_cache = ExpiringLRUCache(getattr(settings, 'FIREBASE_USER_CACHE_SIZE', 10000))
+
+
+def get_token_verifier():
+    return import_string(getattr(settings, 'FIREBASE_TOKEN_VERIFIER', 'firebase_config.verify_firebase_token'))
+
+
+def verify_token(id_token):
+    """Decoded claims for a Firebase ID token, or None when it does not verify"""
+    key = hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+    claims = token_cache.get(key)
+    if claims is not None:
+        return claims
+
+    claims = get_token_verifier()(id_token)
+    if not claims:
+        return None
+    expires_at = claims.get('exp')
+    if expires_at:
+        token_cache.set(key, claims, expires_at)
+    return claims
+
+
+def get_user_for_uid(uid):
+    """The Django user whose profile has ``firebase_uid``; None when there is no profile"""
+    user = user_cache.get(uid, _MISSING)
+    if user is _MISSING:
+        profile = UserProfile.objects.select_related('user').filter(firebase_uid=uid).first()
+        user = profile.user if profile else None
+        ttl = getattr(settings, 'FIREBASE_USER_CACHE_TTL', 300)
+        user_cache.set(uid, user, time.time() + ttl)
+    # Requests get their own copy so per-request attribute changes don't leak
+    return copy.copy(user) if user is not None else None
+
+
+class FirebaseAuthentication(authentication.BaseAuthentication):
+    """``Authorization: Bearer <Firebase ID token>``"""
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        header = authentication.get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        try:
+            id_token = header[1].decode('ascii')
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+
+        claims = verify_token(id_token)
+        if not claims or not claims.get('uid'):
+            raise exceptions.AuthenticationFailed('Invalid or expired token.')
+
+        user = get_user_for_uid(claims['uid'])
+        if user is None:
+            # Valid Firebase account without a FabHomes profile: stay anonymous
+            return None
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return user, claims
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+def staff_user(request):
+    """The staff user making the request, from the session or a Firebase bearer token"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user if user.is_staff else None
+    try:
+        result = FirebaseAuthentication().authenticate(request)
+    except exceptions.AuthenticationFailed:
+        return None
+    if result and result[0].is_staff:
+        return result[0]
+    return None
@@ -0,0 +1,215 @@
+"""
+Endpoint and serializer benchmarks with query-count budgets.
+
+Each case runs once to warm process-level state (similarity index, token
+caches), then ``repeat`` times under CaptureQueriesContext. The result records
+wall-clock timings and the largest number of queries seen. Endpoints run with
+the response cache and throttling switched off, so the numbers describe the
+view itself.
+
+Results are plain dicts, ready for JSON, and ``compare`` diffs two runs. See
+the ``benchmark`` management command and QueryBudgetTests.
+"""
+import contextlib
+import statistics
+import time
+from collections import namedtuple
+
+from django.db import connection
+from django.db.models import F, Prefetch
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from .cards import values_for
+from .models import Agency, UserProfile, Property, Inquiry, Favorite, Review, Transaction
+from .serializers import (
+    AgencySerializer, UserProfileSerializer, UserSerializer, PropertyListSerializer,
+    PropertyDetailSerializer, InquiryListSerializer, InquiryDetailSerializer,
+    FavoriteSerializer, ReviewSerializer, TransactionSerializer, RECENT_REVIEWS
+)
+from .view_counter import view_counter
+
+Endpoint = namedtuple('Endpoint', 'name path user budget method', defaults=('get',))
+SerializerCase = namedtuple('SerializerCase', 'name serializer_class queryset budget many', defaults=(True,))
+
+# ``path`` is formatted with the values from ``targets``; ``user`` names one of them
+ENDPOINTS = [
+    Endpoint('properties-list', '/api/properties/', None, 2),
+    Endpoint('properties-list-filtered', '/api/properties/?city__iexact=Nairobi&bedrooms__gte=2&ordering=-price', None, 2),
+    Endpoint('properties-list-cursor', '/api/properties/?cursor=', None, 1),
+    Endpoint('properties-list-search', '/api/properties/?search=garden', None, 2),
+    Endpoint('properties-list-near', '/api/properties/?near=-1.2864,36.8172&radius_km=25', None, 2),
+    Endpoint('properties-search', '/api/properties/search/?q=modern&listing=sale', None, 2),
+    Endpoint('properties-list-facets', '/api/properties/?facets=true&listing_type=sale', None, 3),
+    Endpoint('properties-search-facets', '/api/properties/search/?q=modern&facets=true', None, 3),
+    Endpoint('properties-clusters', '/api/properties/clusters/?zoom=6', None, 1),
+    Endpoint('properties-export', '/api/properties/export/', None, 1),
+    Endpoint('property-detail', '/api/properties/{property}/', None, 2),
+    Endpoint('property-similar', '/api/properties/{property}/similar/', None, 2),
+    Endpoint('property-increment-view', '/api/properties/{property}/increment_view/', None, 1, 'post'),
+    Endpoint('inquiries-list', '/api/inquiries/', 'inquirer', 2),
+    Endpoint('inquiries-list-cursor', '/api/inquiries/?cursor=', 'inquirer', 1),
+    Endpoint('inquiries-counts', '/api/inquiries/counts/', 'inquirer', 1),
+    Endpoint('inquiry-detail', '/api/inquiries/{inquiry}/', 'inquirer', 2),
+    Endpoint('inquiries-export', '/api/inquiries/export/', 'inquirer', 1),
+    Endpoint('favorites-list', '/api/favorites/', 'favoriter', 3),
+    Endpoint('favorites-status', '/api/favorites/status/?ids={property}', 'favoriter', 1),
+    Endpoint('properties-list-signed-in', '/api/properties/', 'favoriter', 3),
+    Endpoint('agencies-list', '/api/agencies/', None, 2),
+    Endpoint('agency-detail', '/api/agencies/{agency}/', None, 1),
+    Endpoint('agency-properties', '/api/agencies/{agency}/properties/', None, 3),
+    Endpoint('agency-agents', '/api/agencies/{agency}/agents/', None, 3),
+    Endpoint('analytics', '/api/analytics/', None, 1),
+]
+
+# Querysets are evaluated before timing; the budget covers queries made while rendering
+SERIALIZER_CASES = [
+    SerializerCase('PropertyListSerializer', PropertyListSerializer,
+                   lambda: Property.objects.for_listing()[:100], 0),
+    SerializerCase('PropertyDetailSerializer', PropertyDetailSerializer,
+                   lambda: Property.objects.for_listing().with_new_inquiries_count().select_related(
+                       'seller__profile', 'agent__profile').prefetch_related(
+                       Prefetch('reviews', queryset=Review.objects.select_related('reviewer')[:RECENT_REVIEWS],
+                                to_attr='recent_reviews'))[:20], 0),
+    SerializerCase('InquiryListSerializer', InquiryListSerializer,
+                   lambda: Inquiry.objects.annotate(property_title=F('property__title'))[:100], 0),
+    SerializerCase('InquiryDetailSerializer', InquiryDetailSerializer,
+                   lambda: Inquiry.objects.select_related('user__profile').prefetch_related(
+                       Prefetch('property', queryset=Property.objects.for_listing()))[:100], 0),
+    SerializerCase('FavoriteSerializer', FavoriteSerializer,
+                   lambda: Favorite.objects.prefetch_related(
+                       Prefetch('property', queryset=Property.objects.for_listing()))[:100], 0),
+    # The same pages as values() rows, rendered by properties.cards.RowMapper
+    SerializerCase('PropertyListSerializer[values]', PropertyListSerializer,
+                   lambda: values_for(Property.objects.with_favorites_count(), PropertyListSerializer)[:100], 0),
+    SerializerCase('FavoriteSerializer[values]', FavoriteSerializer,
+                   lambda: values_for(Favorite.objects.with_property_favorites_count(), FavoriteSerializer)[:100], 0),
+    SerializerCase('ReviewSerializer', ReviewSerializer,
+                   lambda: Review.objects.select_related('reviewer')[:100], 0),
+    SerializerCase('TransactionSerializer', TransactionSerializer,
+                   lambda: Transaction.objects.select_related('property', 'buyer', 'seller')[:100], 0),
+    SerializerCase('AgencySerializer', AgencySerializer,
+                   lambda: Agency.objects.all()[:100], 0),
+    SerializerCase('UserProfileSerializer', UserProfileSerializer,
+                   lambda: UserProfile.objects.select_related('user')[:100], 0),
+    SerializerCase('UserSerializer', UserSerializer,
+                   lambda: UserProfile.objects.select_related('user')[:100], 0),
+]
+
+
+def targets(data):
+    """Ids and users the endpoint paths refer to, picked from a SyntheticData"""
+    inquiry = next(inquiry for inquiry in data.inquiries if inquiry.user_id)
+    return {
+        'property': next(p for p in data.properties if p.status == 'available').pk,
+        'agency': next(a for a in data.agencies if a.verification_status == 'verified').pk,
+        'inquiry': inquiry.pk,
+        'inquirer': inquiry.user,
+        'favoriter': data.favorites[0].user,
+    }
+
+
+@contextlib.contextmanager
+def benchmark_settings():
+    """Measure views, not the response cache or the rate limiter"""
+    throttle_classes = APIView.throttle_classes
+    APIView.throttle_classes = []
+    try:
+        with override_settings(RESPONSE_CACHE_ENABLED=False):
+            yield
+    finally:
+        APIView.throttle_classes = throttle_classes
+        # Benchmark page views are not real traffic
+        view_counter.discard()
+
+
+def _summary(name, kind, timings, queries, budget):
+    timings = sorted(timings)
+    return {
+        'name': name,
+        'kind': kind,
+        'queries': queries,
+        'budget': budget,
+        'repeat': len(timings),
+        'min_ms': round(timings[0] * 1000, 3),
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+    }
+
+
+def measure(call, repeat):
+    """Run ``call`` once to warm up, then ``repeat`` times; returns (timings, max queries)"""
+    call()
+    timings, queries = [], 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - started)
+        queries = max(queries, len(context.captured_queries))
+    return timings, queries
+
+
+def run_endpoint(endpoint, target_values, repeat=5):
+    path = endpoint.path.format(**target_values)
+    client = APIClient()
+    if endpoint.user:
+        client.force_authenticate(target_values[endpoint.user])
+
+    def call():
+        response = getattr(client, endpoint.method)(path)
+        if response.status_code >= 400:
+            raise AssertionError(f'{endpoint.method.upper()} {path} returned {response.status_code}')
+        if response.streaming:
+            # Streamed rows are only queried while the body is consumed
+            b''.join(response.streaming_content)
+        return response
+
+    timings, queries = measure(call, repeat)
+    return _summary(endpoint.name, 'endpoint', timings, queries, endpoint.budget)
+
+
+def run_serializer(case, repeat=5):
+    instances = list(case.queryset())
+    if not case.many:
+        instances = instances[0]
+    timings, queries = measure(lambda: case.serializer_class(instances, many=case.many).data, repeat)
+    return _summary(case.name, 'serializer', timings, queries, case.budget)
+
+
+def run(data, repeat=5, endpoints=ENDPOINTS, serializer_cases=SERIALIZER_CASES):
+    """Benchmark every endpoint and serializer case against ``data``"""
+    target_values = targets(data)
+    results = []
+    with benchmark_settings():
+        for endpoint in endpoints:
+            results.append(run_endpoint(endpoint, target_values, repeat))
+    for case in serializer_cases:
+        results.append(run_serializer(case, repeat))
+    return results
+
+
+def over_budget(results):
+    return [r for r in results if r['budget'] is not None and r['queries'] > r['budget']]
+
+
+def compare(results, baseline, tolerance=0.25, min_delta_ms=1.0):
+    """
+    Regressions of ``results`` against a previous run: more queries, or a
+    median more than ``tolerance`` (and ``min_delta_ms``) slower.
+    """
+    previous = {(r['kind'], r['name']): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['kind'], result['name']))
+        if before is None:
+            continue
+        if result['queries'] > before['queries']:
+            regressions.append(f"{result['name']}: {before['queries']} -> {result['queries']} queries")
+        delta = result['median_ms'] - before['median_ms']
+        if delta > min_delta_ms and result['median_ms'] > before['median_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{result['name']}: median {before['median_ms']:.2f}ms -> {result['median_ms']:.2f}ms"
+            )
+    return regressions
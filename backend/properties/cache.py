@@ -0,0 +1,244 @@
+"""
+Versioned response cache for anonymous property reads.
+
+Cached entries are keyed on the view action, the normalized query string and
+one or more generation counters. Property detail documents are cached for
+every client and also record the generations of the users and agency they
+embed (``ResponseCache.document``). Writes never delete entries: signal handlers
+bump the relevant generation (see signals.py), which orphans every key built
+from the old value, and the cache backend's LRU/TTL eviction reclaims them.
+
+The backend is whatever ``CACHES[RESPONSE_CACHE_ALIAS]`` names (locmem, file,
+Redis...); run a shared one when several processes serve traffic. Generations
+live in ``CACHES[RESPONSE_GENERATION_CACHE_ALIAS]``, which must not evict them
+while entries built on them are alive: a counter that restarted at 0 could
+match an older entry again. With a per-process backend (RESPONSE_CACHE_SHARED
+off) another process may still hold a document a write has invalidated, so
+detail documents are then only served to anonymous clients, and a user who
+just edited a listing reads it fresh.
+"""
+import functools
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+LIST_GENERATION = 'properties'
+
+
+def detail_generation(property_id):
+    try:
+        property_id = uuid.UUID(str(property_id))
+    except ValueError:
+        pass
+    return f'property:{property_id}'
+
+
+def user_generation(user_id):
+    return f'user:{user_id}'
+
+
+def agency_generation(agency_id):
+    return f'agency:{agency_id}'
+
+
+def property_dependencies(instance):
+    """Scopes, besides the property's own, that its detail document embeds"""
+    scopes = [user_generation(instance.seller_id)]
+    if instance.agent_id is not None:
+        scopes.append(user_generation(instance.agent_id))
+    if instance.agency_id is not None:
+        scopes.append(agency_generation(instance.agency_id))
+    return scopes
+
+
+class ResponseCache:
+    key_prefix = 'resp'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'RESPONSE_CACHE_ENABLED', True)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+    @property
+    def generation_cache(self):
+        return caches[getattr(settings, 'RESPONSE_GENERATION_CACHE_ALIAS', None)
+                      or getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+    def serves_documents_to(self, request):
+        """Whether ``document`` may answer ``request`` from the cache"""
+        return self.enabled and (getattr(settings, 'RESPONSE_CACHE_SHARED', False) or not request.user.is_authenticated)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def generations(self, scopes):
+        keys = [f'{self.key_prefix}:gen:{scope}' for scope in scopes]
+        values = self.generation_cache.get_many(keys)
+        return [values.get(key, 0) for key in keys]
+
+    async def agenerations(self, scopes):
+        keys = [f'{self.key_prefix}:gen:{scope}' for scope in scopes]
+        values = await self.generation_cache.aget_many(keys)
+        return [values.get(key, 0) for key in keys]
+
+    def bump(self, *scopes):
+        """Invalidate every entry built on these generations"""
+        cache = self.generation_cache
+        for scope in scopes:
+            key = f'{self.key_prefix}:gen:{scope}'
+            try:
+                cache.incr(key)
+            except ValueError:
+                if not cache.add(key, 1, timeout=None):
+                    cache.incr(key)
+
+    def bump_on_commit(self, *scopes):
+        transaction.on_commit(lambda: self.bump(*scopes))
+
+    def make_key(self, request, name, scopes, generations=None):
+        if generations is None:
+            generations = self.generations(scopes)
+        params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+        raw = repr((request.get_host(), request.path, params, generations))
+        digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        return f'{self.key_prefix}:{name}:{digest}'
+
+    def serve(self, request, name, scopes, compute):
+        """Return a cached Response for anonymous GETs, computing and storing it on a miss"""
+        if not self.enabled or request.method != 'GET' or request.user.is_authenticated:
+            return compute()
+
+        key = self.make_key(request, name, scopes)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count(hit=True)
+            status_code, data = cached
+            response = Response(data, status=status_code)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        self._count(hit=False)
+        response = compute()
+        if response.status_code == 200:
+            self.cache.set(key, (response.status_code, response.data))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    async def aserve(self, request, name, scopes, compute):
+        """``serve`` for async views; ``compute`` is a coroutine function"""
+        if not self.enabled or request.method != 'GET' or request.user.is_authenticated:
+            return await compute()
+
+        key = self.make_key(request, name, scopes, await self.agenerations(scopes))
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            self._count(hit=True)
+            status_code, data = cached
+            response = Response(data, status=status_code)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        self._count(hit=False)
+        response = await compute()
+        if response.status_code == 200:
+            await self.cache.aset(key, (response.status_code, response.data))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def document(self, request, name, scope, load, render, timeout=DEFAULT_TIMEOUT):
+        """
+        A rendered document shared by every client ``serves_documents_to``,
+        cached on ``scope``.
+
+        ``load()`` returns ``(obj, dependency_scopes)`` and ``render(obj)`` the
+        data. Dependencies are checked on every hit, so bumping any of them
+        (a seller's profile, the agency) drops the entry without the writer
+        having to know which documents embed it. Returns ``(data, hit)``.
+        """
+        if not self.serves_documents_to(request):
+            return render(load()[0]), False
+
+        generation, = self.generations([scope])
+        key = f'{self.key_prefix}:{name}:{scope}:{generation}'
+        cached = self.cache.get(key)
+        if cached is not None:
+            data, dependencies = cached
+            if self.generations(list(dependencies)) == list(dependencies.values()):
+                self._count(hit=True)
+                return data, True
+
+        self._count(hit=False)
+        obj, dependency_scopes = load()
+        # Read the generations before rendering so a concurrent bump is never stored as current
+        dependencies = dict(zip(dependency_scopes, self.generations(dependency_scopes)))
+        data = render(obj)
+        self.cache.set(key, (data, dependencies), timeout)
+        return data, False
+
+    async def adocument(self, request, name, scope, load, render, timeout=DEFAULT_TIMEOUT):
+        """``document`` for async views; ``load`` is a coroutine function"""
+        if not self.serves_documents_to(request):
+            return render((await load())[0]), False
+
+        generation, = await self.agenerations([scope])
+        key = f'{self.key_prefix}:{name}:{scope}:{generation}'
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            data, dependencies = cached
+            if await self.agenerations(list(dependencies)) == list(dependencies.values()):
+                self._count(hit=True)
+                return data, True
+
+        self._count(hit=False)
+        obj, dependency_scopes = await load()
+        dependencies = dict(zip(dependency_scopes, await self.agenerations(dependency_scopes)))
+        data = render(obj)
+        await self.cache.aset(key, (data, dependencies), timeout)
+        return data, False
+
+
+response_cache = ResponseCache()
+
+
+def cached_response(listing=True, detail=False):
+    """
+    Cache a viewset action's response for anonymous clients.
+
+    ``listing`` actions are invalidated by any listing or favorite change;
+    ``detail`` actions by changes to the property in the URL or its favorites,
+    reviews and inquiries.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            scopes = [LIST_GENERATION] if listing else []
+            if detail:
+                scopes.append(detail_generation(kwargs.get(self.lookup_url_kwarg or self.lookup_field)))
+            name = f'{type(self).__name__}.{method.__name__}'
+            return response_cache.serve(
+                request, name, scopes, lambda: method(self, request, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
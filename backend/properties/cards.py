@@ -0,0 +1,209 @@
+"""
+Listing cards rendered straight from ``values()`` rows.
+
+A page of PropertyListSerializer output builds a model instance per row
+(plus one per joined seller, agent and agency). It then reads every key
+through ``Field.get_attribute`` and ``to_representation``. At 100 cards a
+page, and once more per favorite in FavoriteSerializer, that is where the
+list endpoints spend their CPU time.
+
+``RowMapper`` compiles a serializer once per fieldset into the ``values()``
+columns it reads and one getter per key. A column that the serializer
+returns unchanged (strings, integers) is read with ``itemgetter``. Other
+plain columns go through the field's own ``to_representation``. Keys that
+are not plain columns are listed in the serializer's ``value_fields``, with
+the function that renders their ``field_columns`` (the same columns
+``?fields=`` loads through only(); annotations are read by their own name).
+Views fetch pages through ``values_for``, and ``ValuesListSerializer`` (the
+list_serializer_class of PropertyListSerializer and FavoriteSerializer)
+renders those rows through the mapper. Model instances still go through
+ListSerializer.
+
+The output is the same as the serializers'; tests.py renders every
+endpoint both ways. Set FAST_LIST_SERIALIZATION to false to serve
+instances again. Expanded fieldsets (``?expand=``) always use instances,
+because they nest full serializers.
+"""
+import operator
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from rest_framework import serializers
+
+from .fieldsets import Fieldset, wanted
+
+# Annotations in card rows; values() names them without the relation prefix
+ANNOTATIONS = ('favorites_count', 'distance_km')
+
+
+def fast_path(fieldset=None):
+    """Whether cards for ``fieldset`` are served from values() rows"""
+    return getattr(settings, 'FAST_LIST_SERIALIZATION', True) and (fieldset is None or not fieldset.expand)
+
+
+def _column_getter(field, key):
+    if isinstance(field, (serializers.CharField, serializers.IntegerField)) or type(field) is serializers.ChoiceField:
+        # to_representation is str() or int() of what the database already returns
+        return operator.itemgetter(key)
+    to_representation = field.to_representation
+
+    def get(row):
+        value = row[key]
+        return None if value is None else to_representation(value)
+    return get
+
+
+def _derived_getter(keys, render):
+    if render is None:
+        return operator.itemgetter(*keys)
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda row: render(row[key])
+    values = operator.itemgetter(*keys)
+    return lambda row: render(*values(row))
+
+
+class RowMapper:
+    """
+    ``serializer_class`` compiled for ``fieldset``: ``columns`` are the
+    values() names to select, and ``render`` turns one row into what the
+    serializer returns for the matching instance. Nested serializers read
+    the same row, through their ``source`` as a relation prefix.
+    """
+
+    def __init__(self, serializer_class, fieldset=None, prefix=''):
+        serializer = serializer_class(context={'fieldset': fieldset})
+        value_fields = getattr(serializer_class, 'value_fields', {})
+        field_columns = getattr(serializer_class, 'field_columns', {})
+        self.pk = prefix + serializer_class.Meta.model._meta.pk.attname
+        self.getters = []
+        columns = [self.pk]
+        for name, field in serializer.fields.items():
+            if isinstance(field, serializers.BaseSerializer):
+                nested = RowMapper(type(field), prefix=f'{prefix}{field.source}__')
+                keys, getter = nested.columns, nested.render
+            elif name in value_fields:
+                if name in ANNOTATIONS:
+                    keys = (name,)
+                elif name in field_columns:
+                    keys = tuple(prefix + key for key in field_columns[name])
+                else:
+                    raise ImproperlyConfigured(f'{serializer_class.__name__}.{name} needs an entry in field_columns')
+                getter = _derived_getter(keys, value_fields[name])
+            elif isinstance(field, serializers.SerializerMethodField) or '.' in field.source or field.source == '*':
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name} needs an entry in value_fields')
+            else:
+                keys = (prefix + field.source,)
+                getter = _column_getter(field, keys[0])
+            columns.extend(keys)
+            self.getters.append((name, getter))
+        self.columns = tuple(dict.fromkeys(columns))
+
+        extra_fields = getattr(serializer_class, 'extra_fields', ())
+        self.distance = 'distance_km' in extra_fields and wanted(fieldset, 'distance_km')
+        self.is_favorite = 'is_favorite' in extra_fields and wanted(fieldset, 'is_favorite')
+
+    def render(self, row, context=None):
+        data = {name: get(row) for name, get in self.getters}
+        # The keys PropertyListSerializer.to_representation adds
+        if self.distance:
+            distance = row.get('distance_km')
+            if distance is not None:
+                data['distance_km'] = round(distance, 3)
+        if self.is_favorite and context:
+            favorite_ids = context.get('favorite_ids')
+            if favorite_ids is not None:
+                data['is_favorite'] = row[self.pk] in favorite_ids
+        return data
+
+
+@lru_cache(maxsize=128)
+def row_mapper(serializer_class, fields=None):
+    """The RowMapper for ``serializer_class`` limited to ``fields`` (None: all of them)"""
+    return RowMapper(serializer_class, None if fields is None else Fieldset(fields, frozenset()))
+
+
+class ValuesRows:
+    """
+    ``queryset`` whose rows come back from ``values(*columns)``. Counting,
+    filtering and ordering use the model queryset, so a paginator's count
+    leaves out the joins that only the row columns need.
+    """
+
+    def __init__(self, queryset, columns):
+        self.queryset = queryset
+        self.columns = columns
+        self.model = queryset.model
+
+    @property
+    def query(self):
+        return self.queryset.query
+
+    @property
+    def ordered(self):
+        return self.queryset.ordered
+
+    def filter(self, *args, **kwargs):
+        return ValuesRows(self.queryset.filter(*args, **kwargs), self.columns)
+
+    def order_by(self, *fields):
+        return ValuesRows(self.queryset.order_by(*fields), self.columns)
+
+    def count(self):
+        return self.queryset.count()
+
+    async def acount(self):
+        return await self.queryset.acount()
+
+    def rows(self):
+        return self.queryset.values(*self.columns)
+
+    def __getitem__(self, key):
+        return self.rows()[key]
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def __aiter__(self):
+        return self.rows().__aiter__()
+
+
+def values_for(queryset, serializer_class, fieldset=None, keep=()):
+    """
+    ``queryset`` as the ValuesRows that ValuesListSerializer renders for
+    ``serializer_class``; ``keep`` adds columns such as pagination's ordering fields
+    """
+    columns = row_mapper(serializer_class, fieldset and fieldset.fields).columns
+    return ValuesRows(queryset, tuple(dict.fromkeys(columns + tuple(keep))))
+
+
+def row_pk(row):
+    return row['id'] if isinstance(row, dict) else row.pk
+
+
+def in_bulk(queryset, ids):
+    """``queryset.in_bulk(ids)`` that also takes ValuesRows"""
+    if not ids:
+        return {}
+    return {row_pk(row): row for row in queryset.filter(pk__in=ids)}
+
+
+async def ain_bulk(queryset, ids):
+    if not ids:
+        return {}
+    return {row_pk(row): row async for row in queryset.filter(pk__in=ids)}
+
+
+class ValuesListSerializer(serializers.ListSerializer):
+    """ListSerializer that renders values() rows through the child's RowMapper"""
+
+    def to_representation(self, data):
+        rows = data.all() if isinstance(data, models.manager.BaseManager) else data
+        rows = rows if isinstance(rows, list) else list(rows)
+        if rows and isinstance(rows[0], dict):
+            fieldset = self.context.get('fieldset')
+            mapper = row_mapper(type(self.child), fieldset and fieldset.fields)
+            return [mapper.render(row, self.context) for row in rows]
+        return super().to_representation(rows)
@@ -0,0 +1,195 @@
+"""
+Facet counts for the property filter sidebar.
+
+``facet_counts`` counts every requested facet over the filtered queryset in
+one statement, with one grouping per facet: GROUPING SETS on PostgreSQL and
+a UNION ALL of single-column GROUP BYs elsewhere. Bedrooms and price are
+mapped to buckets by CASE expressions. City is filtered with ``iexact``, so
+it is grouped case-insensitively and labelled with one spelling of each
+group. Each facet returns at most one row per distinct value (or bucket),
+however many facets are requested and however many listings match.
+"""
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, Count, F, IntegerField, Min, Value, When
+from django.db.models.functions import Lower
+from rest_framework.exceptions import ValidationError
+
+FACETS_QUERY_PARAM = 'facets'
+VALUE_FACETS = ('property_type', 'listing_type', 'furnishing', 'city')
+BUCKET_FACETS = ('bedrooms', 'price')
+FACETS = VALUE_FACETS + BUCKET_FACETS
+# Value facets whose filter is ``<name>__iexact``; grouped on ``<name>_key``, LOWER() of the field
+CASE_INSENSITIVE_FACETS = ('city',)
+
+# Lower bounds; the last bucket is open-ended
+BEDROOM_BUCKETS = (0, 1, 2, 3, 4, 5)
+DEFAULT_PRICE_BUCKETS = (0, 100_000, 1_000_000, 10_000_000, 50_000_000)
+
+
+def price_buckets():
+    return tuple(getattr(settings, 'FACET_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS))
+
+
+def requested_facets(request):
+    """
+    Facet names asked for with ``?facets=true`` (all of them) or
+    ``?facets=city,bedrooms``; an empty tuple when facets were not requested
+    """
+    raw = request.query_params.get(FACETS_QUERY_PARAM, '').strip()
+    if not raw or raw in ('0', 'false'):
+        return ()
+    if raw in ('1', 'true'):
+        return FACETS
+    names = tuple(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in names if name not in FACETS]
+    if unknown:
+        raise ValidationError({
+            FACETS_QUERY_PARAM: f'Unknown facet(s) {", ".join(unknown)}. Choose from {", ".join(FACETS)}.'
+        })
+    return names
+
+
+def _bucket_expression(field, bounds):
+    """Index of the bucket ``field`` falls in, testing the highest bound first"""
+    whens = [When(**{f'{field}__gte': bound}, then=Value(index)) for index, bound in reversed(list(enumerate(bounds)))]
+    return Case(*whens, default=Value(None), output_field=IntegerField())
+
+
+def _bucket_entries(bounds, counts):
+    entries = []
+    for index, lower in enumerate(bounds):
+        upper = bounds[index + 1] if index + 1 < len(bounds) else None
+        label = f'{lower}+' if upper is None else (str(lower) if upper == lower + 1 else f'{lower}-{upper}')
+        entries.append({'value': label, 'min': lower, 'max': upper, 'count': counts.get(index, 0)})
+    return entries
+
+
+def _bucket_bounds():
+    return {'bedrooms': BEDROOM_BUCKETS, 'price': price_buckets()}
+
+
+def _column(name):
+    if name in BUCKET_FACETS:
+        return f'{name}_bucket'
+    return f'{name}_key' if name in CASE_INSENSITIVE_FACETS else name
+
+
+def _columns(names):
+    """
+    The grouped column of each requested facet: the field, ``<name>_bucket``
+    for bucket facets or ``<name>_key`` for case-insensitive ones
+    """
+    return [_column(name) for name in FACETS if name in names]
+
+
+def _column_expression(column):
+    name = column.removesuffix('_bucket').removesuffix('_key')
+    if name in BUCKET_FACETS:
+        return _bucket_expression(name, _bucket_bounds()[name])
+    return Lower(name) if name in CASE_INSENSITIVE_FACETS else F(name)
+
+
+def _uses_grouping_sets(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def _union_rows(queryset, columns):
+    """``(column index, value, count)`` rows from a UNION ALL of one GROUP BY per column"""
+    queryset = queryset.order_by()
+    # A group's value is its key, or for a case-insensitive key MIN() of the field
+    groups = [
+        queryset.annotate(facet=Value(index), facet_key=_column_expression(column))
+        .values('facet', 'facet_key')
+        .annotate(facet_value=Min(column.removesuffix('_key') if column.endswith('_key') else 'facet_key'),
+                  facet_count=Count('pk'))
+        .values_list('facet', 'facet_value', 'facet_count')
+        for index, column in enumerate(columns)
+    ]
+    return groups[0].union(*groups[1:], all=True) if len(groups) > 1 else groups[0]
+
+
+def _grouping_sets_rows(queryset, columns):
+    """``(column index, value, count)`` rows from one GROUP BY GROUPING SETS query (PostgreSQL)"""
+    annotations = {column: _column_expression(column) for column in columns if column.endswith(('_bucket', '_key'))}
+    # Each case-insensitive key's group is labelled with MIN() of the field
+    labels = {index: column.removesuffix('_key') for index, column in enumerate(columns) if column.endswith('_key')}
+    inner = queryset.order_by().annotate(**annotations).values(*columns, *labels.values())
+    inner_sql, params = inner.query.get_compiler(queryset.db).as_sql()
+    connection = connections[queryset.db]
+    qn = connection.ops.quote_name
+    quoted = [qn(column) for column in columns]
+    sql = (
+        'SELECT {values}, {groupings}, {labels}COUNT(*) FROM ({inner}) facet_rows GROUP BY GROUPING SETS ({sets})'
+    ).format(
+        values=', '.join(quoted),
+        groupings=', '.join(f'GROUPING({column})' for column in quoted),
+        labels=''.join(f'MIN({qn(field)}), ' for field in labels.values()),
+        inner=inner_sql,
+        sets=', '.join(f'({column})' for column in quoted),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    width = len(columns)
+    label_position = {index: 2 * width + offset for offset, index in enumerate(labels)}
+    # GROUPING(column) is 0 for the one column a row is grouped by
+    return [
+        (index, row[label_position.get(index, index)], row[-1])
+        for row in rows
+        for index in range(width) if row[width + index] == 0
+    ]
+
+
+def _summarize(rows, columns, names):
+    totals = {column: Counter() for column in columns}
+    for index, value, count in rows:
+        totals[columns[index]][value] += count
+
+    bucket_bounds = _bucket_bounds()
+    facets = {}
+    for name in names:
+        if name in bucket_bounds:
+            # Some backends return a UNION's mixed-type column as text
+            counts = {int(value): count for value, count in totals[f'{name}_bucket'].items() if value is not None}
+            facets[name] = _bucket_entries(bucket_bounds[name], counts)
+        else:
+            facets[name] = [
+                {'value': value, 'count': count}
+                for value, count in sorted(totals[_column(name)].items(), key=lambda item: (-item[1], str(item[0])))
+                if value not in (None, '')
+            ]
+    return facets
+
+
+def facet_counts(queryset, names=FACETS):
+    """
+    Counts per value of each facet in ``names`` over ``queryset``.
+
+    Value facets are lists of ``{'value', 'count'}``, most common first. Bucket
+    facets list every bucket in order, with ``min``/``max`` bounds (``max`` is
+    exclusive and ``None`` for the last bucket), including empty ones.
+    """
+    if not names:
+        return {}
+    columns = _columns(names)
+    if _uses_grouping_sets(queryset):
+        rows = _grouping_sets_rows(queryset, columns)
+    else:
+        rows = _union_rows(queryset, columns)
+    return _summarize(rows, columns, names)
+
+
+async def afacet_counts(queryset, names=FACETS):
+    """``facet_counts`` on the async ORM"""
+    if not names:
+        return {}
+    columns = _columns(names)
+    if _uses_grouping_sets(queryset):
+        rows = await sync_to_async(_grouping_sets_rows)(queryset, columns)
+    else:
+        rows = [row async for row in _union_rows(queryset, columns)]
+    return _summarize(rows, columns, names)
@@ -0,0 +1,144 @@
+"""
+Per-user favorite sets and the single-statement favorite toggle.
+
+Each user's favorite property ids are cached as a frozenset in the
+FAVORITES_CACHE_ALIAS cache (by default the response cache's backend). The
+set backs the ``is_favorite`` flag on listing cards and the batch status
+endpoint, so drawing hearts costs at most one query per user per
+FAVORITES_CACHE_TIMEOUT. ``toggle_favorite`` patches the cached set in
+place. Other Favorite writes drop it (see signals.py), and the next read
+reloads it.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from .cache import LIST_GENERATION, detail_generation, response_cache
+from .models import Favorite, Property
+
+
+class FavoriteSetCache:
+    key_prefix = 'fav'
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'FAVORITES_CACHE_ALIAS', getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default'))]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'FAVORITES_CACHE_TIMEOUT', 300)
+
+    def key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def _query(self, user_id):
+        return Favorite.objects.filter(user_id=user_id).values_list('property_id', flat=True)
+
+    def get(self, user_id):
+        """The user's favorite property ids, loading them on a miss"""
+        ids = self.cache.get(self.key(user_id))
+        if ids is None:
+            ids = frozenset(self._query(user_id))
+            self.cache.set(self.key(user_id), ids, self.timeout)
+        return ids
+
+    async def aget(self, user_id):
+        ids = await self.cache.aget(self.key(user_id))
+        if ids is None:
+            ids = frozenset([property_id async for property_id in self._query(user_id)])
+            await self.cache.aset(self.key(user_id), ids, self.timeout)
+        return ids
+
+    def peek(self, user_id):
+        """The cached set, or None without querying"""
+        return self.cache.get(self.key(user_id))
+
+    def update(self, user_id, property_id, is_favorite):
+        """Apply one toggle to a cached set; a missing set stays missing"""
+        key = self.key(user_id)
+        ids = self.cache.get(key)
+        if ids is not None:
+            self.cache.set(key, ids | {property_id} if is_favorite else ids - {property_id}, self.timeout)
+
+    def discard(self, user_id):
+        self.cache.delete(self.key(user_id))
+
+
+favorite_cache = FavoriteSetCache()
+
+
+def favorite_ids_for(request):
+    """The signed-in user's favorite ids, memoized on the request; None for anonymous clients"""
+    if not request.user.is_authenticated:
+        return None
+    if getattr(request, '_favorite_ids', None) is None:
+        request._favorite_ids = favorite_cache.get(request.user.pk)
+    return request._favorite_ids
+
+
+async def afavorite_ids_for(request):
+    """``favorite_ids_for`` for async views; the user must already be authenticated"""
+    if not request.user.is_authenticated:
+        return None
+    if getattr(request, '_favorite_ids', None) is None:
+        request._favorite_ids = await favorite_cache.aget(request.user.pk)
+    return request._favorite_ids
+
+
+def _insert(user_id, property_id):
+    """INSERT ... SELECT the favorite if the property exists and it is not already there"""
+    meta = Favorite._meta
+    qn = connection.ops.quote_name
+    columns = [meta.pk, meta.get_field('user'), meta.get_field('property'), meta.get_field('created_at')]
+    values = [uuid.uuid4(), user_id, property_id, timezone.now()]
+    params = [field.get_db_prep_save(value, connection) for field, value in zip(columns, values)]
+    pk = Property._meta.pk
+    sql = '{insert} {table} ({columns}) SELECT {placeholders} FROM {property_table} WHERE {property_pk} = %s {suffix}'.format(
+        insert=connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+        table=qn(meta.db_table),
+        columns=', '.join(qn(field.column) for field in columns),
+        placeholders=', '.join(['%s'] * len(columns)),
+        property_table=qn(Property._meta.db_table),
+        property_pk=qn(pk.column),
+        suffix=connection.ops.on_conflict_suffix_sql(columns, OnConflict.IGNORE, None, None) or '',
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [pk.get_db_prep_value(property_id, connection)])
+        return cursor.rowcount > 0
+
+
+def _delete(user_id, property_id):
+    meta = Favorite._meta
+    qn = connection.ops.quote_name
+    sql = 'DELETE FROM {table} WHERE {user} = %s AND {property} = %s'.format(
+        table=qn(meta.db_table), user=qn(meta.get_field('user').column), property=qn(meta.get_field('property').column),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, meta.get_field('property').get_db_prep_value(property_id, connection)])
+        return cursor.rowcount > 0
+
+
+def toggle_favorite(user_id, property_id):
+    """
+    Add or remove a favorite. Returns True when it was added, False when it
+    was removed and None when the property does not exist.
+
+    The cached set picks the statement that is expected to succeed, so the
+    usual toggle is a single INSERT or DELETE. A second statement runs only
+    when the set was cold or stale. These writes skip model signals, so the
+    favorite set and the response cache are updated here instead.
+    """
+    cached = favorite_cache.peek(user_id)
+    writes = (_delete, _insert) if cached is not None and property_id in cached else (_insert, _delete)
+    for write in writes:
+        if write(user_id, property_id):
+            added = write is _insert
+            transaction.on_commit(lambda: favorite_cache.update(user_id, property_id, added))
+            # favorites_count appears on list cards as well as the detail page
+            response_cache.bump_on_commit(LIST_GENERATION, detail_generation(property_id))
+            return added
+    return None
@@ -0,0 +1,131 @@
+"""
+Sparse fieldsets for property responses.
+
+``?fields=id,title,price`` limits a listing card or detail document to the
+named keys. ``?expand=seller,agency`` adds the nested representations that
+cards otherwise flatten to ``seller_name``/``agency_name``. For listing
+cards the fieldset also trims the query: ``restrict`` loads only the columns
+behind the requested fields through ``only()``, and joins only the
+relations they read. The favorites count subquery and the favorite-set
+lookup are skipped unless ``favorites_count`` or ``is_favorite`` is asked
+for.
+"""
+from rest_framework.exceptions import ValidationError
+
+FIELDS_QUERY_PARAM = 'fields'
+EXPAND_QUERY_PARAM = 'expand'
+
+
+class Fieldset:
+    """The keys a client asked for; ``fields`` is None when it kept the default set"""
+
+    def __init__(self, fields, expand):
+        self.fields = fields
+        self.expand = expand
+
+    def wants(self, name):
+        return self.fields is None or name in self.fields or name in self.expand
+
+    def trim(self, data):
+        """``data`` (a rendered document) without the keys the client did not ask for"""
+        return {key: value for key, value in data.items() if self.wants(key)}
+
+
+def wanted(fieldset, name):
+    """Whether ``name`` is rendered under ``fieldset``, where None is the default set"""
+    return fieldset is None or fieldset.wants(name)
+
+
+def _names(request, param):
+    raw = request.query_params.get(param, '')
+    return tuple(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+
+
+def requested_fieldset(request, serializer_class):
+    """
+    The Fieldset in ``?fields=``/``?expand=`` for ``serializer_class`` (a
+    SparseFieldsetMixin serializer), or None when neither parameter is given
+    """
+    fields, expand = _names(request, FIELDS_QUERY_PARAM), _names(request, EXPAND_QUERY_PARAM)
+    if not fields and not expand:
+        return None
+    errors = {}
+    for param, names, allowed in (
+        (FIELDS_QUERY_PARAM, fields, serializer_class.fieldset_names()),
+        (EXPAND_QUERY_PARAM, expand, tuple(serializer_class.expandable_fields)),
+    ):
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            errors[param] = (
+                f'Unknown field(s) {", ".join(unknown)}. Choose from {", ".join(allowed)}.'
+                if allowed else 'No fields can be expanded here.'
+            )
+    if errors:
+        raise ValidationError(errors)
+    return Fieldset(frozenset(fields) if fields else None, frozenset(expand))
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin that renders only the fields in ``context['fieldset']``
+    (a Fieldset), plus any ``expandable_fields`` it expands
+    """
+    # Nested serializers added by ?expand=, by field name
+    expandable_fields = {}
+    # Keys that to_representation adds outside the declared fields
+    extra_fields = ()
+    # only() paths behind each field, where they differ from the field's own name.
+    # properties.cards selects the same columns, in this order, for value_fields
+    field_columns = {}
+
+    @classmethod
+    def fieldset_names(cls):
+        return tuple(cls.Meta.fields) + tuple(cls.extra_fields)
+
+    @property
+    def fieldset(self):
+        return self.context.get('fieldset')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.fieldset
+        if fieldset is None:
+            return fields
+        for name in fieldset.expand:
+            fields[name] = self.expandable_fields[name](read_only=True)
+        return {name: field for name, field in fields.items() if fieldset.wants(name)}
+
+
+def _related_paths(model, path):
+    """The select_related paths that loading the only() path ``path`` joins through"""
+    joins, parts = [], path.split('__')
+    for index, part in enumerate(parts):
+        field = model._meta.get_field(part)
+        if not field.is_relation:
+            break
+        joins.append('__'.join(parts[:index + 1]))
+        model = field.related_model
+    return joins
+
+
+def restrict(queryset, serializer_class, fieldset, keep=()):
+    """
+    ``queryset`` loading only what ``fieldset``'s fields read: the columns in
+    ``field_columns`` (by default the field's own name) through only(), and
+    the relations those columns are on through select_related. ``keep``
+    names columns to load regardless, such as pagination's ordering fields.
+    """
+    names = serializer_class.fieldset_names() if fieldset.fields is None else fieldset.fields
+    paths = []
+    for name in list(names) + sorted(fieldset.expand):
+        paths.extend(serializer_class.field_columns.get(name, (name,)))
+
+    model = queryset.model
+    related = []
+    for path in paths:
+        related.extend(_related_paths(model, path))
+    if related:
+        queryset = queryset.select_related(*dict.fromkeys(related))
+    if fieldset.fields is not None:
+        queryset = queryset.only(model._meta.pk.name, *keep, *paths)
+    return queryset
@@ -0,0 +1,201 @@
+"""
+Geohash helpers and the map filters for property listings.
+
+Every listing with coordinates stores a geohash. A bounding box becomes a small
+set of geohash prefixes, and each prefix is an index range scan, so map
+queries never touch rows outside the viewport's cells.
+"""
+import math
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        interval, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def geohash_for(latitude, longitude):
+    """Geohash stored on Property; empty when the listing has no coordinates"""
+    if latitude is None or longitude is None:
+        return ''
+    return encode_geohash(float(latitude), float(longitude))
+
+
+def cell_size(precision):
+    """(lat_degrees, lon_degrees) covered by a geohash cell of ``precision`` chars"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = (5 * precision) // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def geohash_cover(min_lat, min_lon, max_lat, max_lon, max_cells=24):
+    """Geohash prefixes whose cells together cover the box, using the finest precision within ``max_cells``"""
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    if min_lon > max_lon:
+        # Crosses the antimeridian
+        return sorted(set(
+            geohash_cover(min_lat, min_lon, max_lat, 180.0, max_cells // 2 or 1) +
+            geohash_cover(min_lat, -180.0, max_lat, max_lon, max_cells // 2 or 1)
+        ))
+    for precision in range(8, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        lat_start = math.floor((min_lat + 90.0) / lat_step)
+        lat_end = math.floor(min(max_lat + 90.0, 180.0 - 1e-9) / lat_step)
+        lon_start = math.floor((min_lon + 180.0) / lon_step)
+        lon_end = math.floor(min(max_lon + 180.0, 360.0 - 1e-9) / lon_step)
+        if (lat_end - lat_start + 1) * (lon_end - lon_start + 1) > max_cells:
+            continue
+        return sorted({
+            encode_geohash(
+                (row + 0.5) * lat_step - 90.0,
+                (col + 0.5) * lon_step - 180.0,
+                precision,
+            )
+            for row in range(lat_start, lat_end + 1)
+            for col in range(lon_start, lon_end + 1)
+        })
+    return ['']
+
+
+def precision_for_zoom(zoom, cells_per_tile=4):
+    """Geohash length whose cells are at most 1/``cells_per_tile`` of a web map tile wide"""
+    target = 360.0 / (1 << zoom) / cells_per_tile
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        if cell_size(precision)[1] <= target:
+            return precision
+    return GEOHASH_PRECISION
+
+
+def geohash_q(prefixes, field='geohash'):
+    """OR of index range conditions, one per prefix"""
+    query = Q()
+    for prefix in prefixes:
+        if prefix:
+            query |= Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '~'})
+        else:
+            query |= Q(**{f'{field}__gt': ''})
+    return query
+
+
+def bbox_around(latitude, longitude, radius_km):
+    """(min_lat, min_lon, max_lat, max_lon) of the box enclosing a circle"""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(latitude))
+    if cos_lat < 1e-6 or radius_km / (KM_PER_DEGREE_LAT * cos_lat) >= 180.0:
+        return max(latitude - dlat, -90.0), -180.0, min(latitude + dlat, 90.0), 180.0
+    dlon = radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+    min_lon, max_lon = longitude - dlon, longitude + dlon
+    if min_lon < -180.0:
+        min_lon += 360.0
+    if max_lon > 180.0:
+        max_lon -= 360.0
+    return max(latitude - dlat, -90.0), min_lon, min(latitude + dlat, 90.0), max_lon
+
+
+def distance_km_expression(latitude, longitude):
+    """Haversine distance in km from a point to each row's latitude/longitude"""
+    lat = math.radians(latitude)
+    dlat = (Radians(F('latitude')) - lat) / 2
+    dlon = (Radians(F('longitude')) - math.radians(longitude)) / 2
+    a = Power(Sin(dlat), 2) + math.cos(lat) * Cos(Radians(F('latitude'))) * Power(Sin(dlon), 2)
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a), output_field=FloatField())
+
+
+def filter_bbox(queryset, min_lat, min_lon, max_lat, max_lon):
+    queryset = queryset.filter(geohash_q(geohash_cover(min_lat, min_lon, max_lat, max_lon)))
+    queryset = queryset.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+    if min_lon <= max_lon:
+        return queryset.filter(longitude__gte=min_lon, longitude__lte=max_lon)
+    return queryset.filter(Q(longitude__gte=min_lon) | Q(longitude__lte=max_lon))
+
+
+def _floats(value, count, name):
+    try:
+        numbers = [float(part) for part in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count or not all(math.isfinite(n) for n in numbers):
+        raise ValidationError({name: f'Expected {count} comma-separated numbers.'})
+    return numbers
+
+
+def parse_bbox(value):
+    """``min_lon,min_lat,max_lon,max_lat`` (GeoJSON order) to (min_lat, min_lon, max_lat, max_lon)"""
+    min_lon, min_lat, max_lon, max_lat = _floats(value, 4, 'bbox')
+    if min_lat > max_lat or not (-90 <= min_lat <= 90 and -90 <= max_lat <= 90):
+        raise ValidationError({'bbox': 'Latitudes must be within -90..90 with min_lat <= max_lat.'})
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValidationError({'bbox': 'Longitudes must be within -180..180.'})
+    return min_lat, min_lon, max_lat, max_lon
+
+
+class GeoFilter(filters.BaseFilterBackend):
+    """
+    Map filters for property lists.
+
+    - ``bbox=min_lon,min_lat,max_lon,max_lat`` keeps listings inside the box
+    - ``near=lat,lon`` with ``radius_km`` keeps listings within the radius,
+      annotates ``distance_km`` and orders by it unless ``ordering`` is given
+    """
+    bbox_param = 'bbox'
+    near_param = 'near'
+    radius_param = 'radius_km'
+    ordering_param = 'ordering'
+    default_radius_km = 10.0
+    max_radius_km = 500.0
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        bbox = params.get(self.bbox_param)
+        if bbox:
+            queryset = filter_bbox(queryset, *parse_bbox(bbox))
+
+        near = params.get(self.near_param)
+        if not near:
+            return queryset
+        latitude, longitude = _floats(near, 2, self.near_param)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError({self.near_param: 'Coordinates out of range.'})
+        try:
+            radius_km = float(params.get(self.radius_param, self.default_radius_km))
+        except ValueError:
+            raise ValidationError({self.radius_param: 'Expected a number.'})
+        if not 0 < radius_km <= self.max_radius_km:
+            raise ValidationError({self.radius_param: f'Must be between 0 and {self.max_radius_km}.'})
+
+        queryset = filter_bbox(queryset, *bbox_around(latitude, longitude, radius_km))
+        queryset = queryset.annotate(
+            distance_km=distance_km_expression(latitude, longitude)
+        ).filter(distance_km__lte=radius_km)
+        if params.get(self.ordering_param, 'distance') in ('distance', 'distance_km'):
+            queryset = queryset.order_by('distance_km', 'pk')
+        return queryset
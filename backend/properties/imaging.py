@@ -0,0 +1,75 @@
+"""
+Image resizing for listing media, run in worker processes.
+
+This module imports only Pillow, so spawned pool workers can load it without
+setting up Django. ``render_variants`` turns one original into a WebP and a
+JPEG at each width in ``VARIANTS``. It never upscales, and it keeps the
+aspect ratio.
+"""
+import hashlib
+import io
+
+from PIL import Image, ImageOps
+
+# Variant name and target width in pixels, smallest first
+VARIANTS = (
+    ('thumb', 320),
+    ('card', 640),
+    ('gallery', 1280),
+)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def digest(data):
+    """Content address for an original, used in derivative paths"""
+    return hashlib.sha256(data).hexdigest()[:20]
+
+
+def open_image(data):
+    """Decode ``data`` fully, raising InvalidImage for anything Pillow cannot read"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        raise InvalidImage(str(exc)) from exc
+    return image
+
+
+def _encode(image, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == 'JPEG':
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(buffer, fmt, quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffer, fmt, quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def render_variants(data, webp_quality=80, jpeg_quality=82):
+    """
+    ``(digest, (width, height), variants)`` for the original in ``data``.
+    ``variants`` maps each name in VARIANTS to ``{'width', 'height',
+    <format>: bytes}``.
+    """
+    image = ImageOps.exif_transpose(open_image(data))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    variants = {}
+    for name, target in VARIANTS:
+        width = min(target, image.width)
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        variant = {'width': width, 'height': height}
+        for key, (fmt, _) in FORMATS.items():
+            variant[key] = _encode(resized, fmt, webp_quality if fmt == 'WEBP' else jpeg_quality)
+        variants[name] = variant
+    return digest(data), image.size, variants
@@ -0,0 +1,333 @@
+"""
+Streaming bulk import of property listings from CSV or JSONL.
+
+Rows flow through a generator pipeline (read -> chunk -> validate -> resolve
+-> write), so only a few chunks are ever in memory. Validation uses
+PropertyCreateUpdateSerializer and needs no database, so it can run in a
+process pool. Seller, agent and agency references are resolved with one query
+per chunk for keys not seen before, and each chunk is written with
+bulk_create/bulk_update in its own transaction.
+
+Bulk writes skip model signals, so the importer refreshes the derived data
+itself: geohash, search index, similarity index, agency counts, the inquiry
+sellers and inbox counts of listings that changed hands, analytics snapshot
+and response cache generations.
+"""
+import csv
+import json
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import LIST_GENERATION, detail_generation, response_cache
+from .geo import geohash_for
+from .models import Agency, Inquiry, Property, PlatformStats, UserProfile
+from .search import get_search_backend
+from .serializers import PropertyCreateUpdateSerializer
+from .similarity import similarity_index
+
+JSON_LIST_FIELDS = ('property_features', 'utilities', 'image_urls')
+STATUSES = dict(Property.STATUS_CHOICES)
+
+
+def read_rows(path, fmt=None):
+    """
+    Yield ``(line_number, row)`` pairs from a CSV or JSONL file without loading
+    it. JSONL rows are left as raw strings so decoding happens in the workers.
+    """
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as handle:
+        if fmt == 'csv':
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(handle, start=1):
+                if line.strip():
+                    yield line_number, line
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _clean(row):
+    cleaned = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if value == '':
+                continue
+            if key in JSON_LIST_FIELDS:
+                value = json.loads(value) if value.startswith('[') else value.split('|')
+        cleaned[key] = value
+    return cleaned
+
+
+def validate_chunk(chunk):
+    """
+    Validate raw rows; returns ``[(line, data, errors)]`` with exactly one of
+    data/errors set. Runs in worker processes, so it must not touch the database.
+    """
+    results = []
+    for line, raw in chunk:
+        try:
+            row = json.loads(raw) if isinstance(raw, str) else raw
+            if isinstance(row, dict):
+                row = _clean(row)
+        except (TypeError, ValueError) as exc:
+            results.append((line, None, {'row': [f'Unreadable row: {exc}']}))
+            continue
+        if not isinstance(row, dict):
+            results.append((line, None, {'row': ['Expected a JSON object.']}))
+            continue
+
+        serializer = PropertyCreateUpdateSerializer(data=row)
+        if not serializer.is_valid():
+            results.append((line, None, {k: [str(e) for e in v] for k, v in serializer.errors.items()}))
+            continue
+
+        data = dict(serializer.validated_data)
+        errors = {}
+        if row.get('status', 'available') not in STATUSES:
+            errors['status'] = [f'"{row["status"]}" is not a valid choice.']
+        if 'id' in row:
+            try:
+                data['id'] = uuid.UUID(str(row['id']))
+            except ValueError:
+                errors['id'] = ['Must be a valid UUID.']
+        if errors:
+            results.append((line, None, errors))
+            continue
+        data['status'] = row.get('status', 'available')
+        for key in ('seller', 'agent', 'agency'):
+            data[key] = row.get(key)
+        results.append((line, data, None))
+    return results
+
+
+def _init_worker():
+    django.setup()
+
+
+class LookupCache:
+    """Memoizes key -> id lookups (misses included) and batches the queries for new keys"""
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.values = {}
+
+    def resolve(self, keys):
+        missing = {key for key in keys if key and key not in self.values}
+        if missing:
+            found = self.loader(missing)
+            for key in missing:
+                self.values[key] = found.get(key)
+
+    def get(self, key):
+        return self.values.get(key)
+
+
+def load_users(keys):
+    """Users by username or email"""
+    found = {}
+    for pk, username, email in User.objects.filter(
+        Q(username__in=keys) | Q(email__in=keys)
+    ).values_list('pk', 'username', 'email'):
+        found.setdefault(username, pk)
+        if email:
+            found.setdefault(email, pk)
+    return found
+
+
+def load_agencies(keys):
+    """Agencies by UUID or email"""
+    ids = []
+    for key in keys:
+        try:
+            ids.append(uuid.UUID(str(key)))
+        except ValueError:
+            pass
+    found = {}
+    for pk, email in Agency.objects.filter(Q(pk__in=ids) | Q(email__in=keys)).values_list('pk', 'email'):
+        found[str(pk)] = pk
+        found[email] = pk
+    for key in keys:
+        try:
+            key_id = uuid.UUID(str(key))
+        except ValueError:
+            continue
+        if str(key_id) in found:
+            found[key] = found[str(key_id)]
+    return found
+
+
+class ImportStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.processed = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+
+class PropertyImporter:
+    def __init__(self, batch_size=1000, workers=0, update=False, default_seller=None,
+                 dry_run=False, on_error=None, on_progress=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.update = update
+        self.default_seller = default_seller
+        self.dry_run = dry_run
+        self.on_error = on_error or (lambda line, errors: None)
+        self.on_progress = on_progress or (lambda stats: None)
+        self.users = LookupCache(load_users)
+        self.agencies = LookupCache(load_agencies)
+        self.search_backend = get_search_backend()
+        # --update replaces every importable field with the row's value (or its default)
+        self.update_fields = list(PropertyCreateUpdateSerializer.Meta.fields) + [
+            'status', 'seller', 'agent', 'agency', 'geohash', 'updated_at',
+        ]
+
+    def run(self, rows):
+        stats = ImportStats()
+        for results in self._validated(chunked(rows, self.batch_size)):
+            rows = []
+            for line, data, errors in self._resolve(results):
+                stats.processed += 1
+                if errors:
+                    stats.failed += 1
+                    self.on_error(line, errors)
+                else:
+                    rows.append((line, data))
+            if rows and not self.dry_run:
+                created, updated = self._write(rows, stats)
+                stats.created += created
+                stats.updated += updated
+            self.on_progress(stats)
+
+        if not self.dry_run and (stats.created or stats.updated):
+            Agency.recount()
+            PlatformStats.refresh()
+            response_cache.bump(LIST_GENERATION)
+            similarity_index.reset()
+        return stats
+
+    def _validated(self, chunks):
+        if self.workers <= 1:
+            for chunk in chunks:
+                yield validate_chunk(chunk)
+            return
+
+        # Forked workers must not share the parent's database sockets
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(validate_chunk, chunk))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _resolve(self, results):
+        valid = [data for _, data, _ in results if data]
+        self.users.resolve({data['seller'] or self.default_seller for data in valid} |
+                           {data['agent'] for data in valid})
+        self.agencies.resolve({data['agency'] for data in valid})
+
+        for line, data, errors in results:
+            if errors:
+                yield line, None, errors
+                continue
+            seller_key = data.pop('seller') or self.default_seller
+            agent_key = data.pop('agent')
+            agency_key = data.pop('agency')
+            data['seller_id'] = self.users.get(seller_key)
+            data['agent_id'] = self.users.get(agent_key)
+            data['agency_id'] = self.agencies.get(agency_key)
+
+            errors = {}
+            if data['seller_id'] is None:
+                errors['seller'] = [f'Unknown seller "{seller_key}".' if seller_key else 'This field is required.']
+            if agent_key and data['agent_id'] is None:
+                errors['agent'] = [f'Unknown agent "{agent_key}".']
+            if agency_key and data['agency_id'] is None:
+                errors['agency'] = [f'Unknown agency "{agency_key}".']
+            yield (line, None, errors) if errors else (line, data, None)
+
+    def _write(self, rows, stats):
+        now = timezone.now()
+        objs, lines = {}, {}
+        for line, data in rows:
+            obj = Property(**data)
+            obj.geohash = geohash_for(obj.latitude, obj.longitude)
+            obj.updated_at = now
+            if obj.pk in lines:
+                # One row per id: the first, or under --update the last, as a second import would leave it
+                dropped = lines[obj.pk] if self.update else line
+                stats.failed += 1
+                self.on_error(dropped, {'id': ['Duplicate id; another row in this batch has the same one.']})
+                if not self.update:
+                    continue
+                del objs[lines[obj.pk]]
+            objs[line] = obj
+            lines[obj.pk] = line
+
+        with transaction.atomic():
+            existing = dict(Property.objects.filter(
+                pk__in=[obj.pk for obj in objs.values()]
+            ).values_list('pk', 'seller_id'))
+            to_create, to_update = [], []
+            for line, obj in objs.items():
+                if obj.pk not in existing:
+                    to_create.append(obj)
+                elif self.update:
+                    to_update.append(obj)
+                else:
+                    stats.failed += 1
+                    self.on_error(line, {'id': ['Property already exists; pass --update to overwrite it.']})
+            Property.objects.bulk_create(to_create, batch_size=self.batch_size)
+            if to_update:
+                Property.objects.bulk_update(to_update, self.update_fields, batch_size=self.batch_size)
+                self._move_inquiries(existing, to_update)
+            self.search_backend.index_many(to_create + to_update)
+
+        if to_update:
+            response_cache.bump(*[detail_generation(obj.pk) for obj in to_update])
+        return len(to_create), len(to_update)
+
+    def _move_inquiries(self, previous_sellers, updated):
+        """What signals.move_inquiries_to_new_seller does, for listings whose seller an update changed"""
+        moved, sellers = {}, set()
+        for obj in updated:
+            if previous_sellers[obj.pk] != obj.seller_id:
+                moved.setdefault(obj.seller_id, []).append(obj.pk)
+                sellers |= {previous_sellers[obj.pk], obj.seller_id}
+        for seller_id, property_ids in moved.items():
+            Inquiry.objects.filter(property_id__in=property_ids).update(seller_id=seller_id)
+        if sellers:
+            UserProfile.recount(sellers)
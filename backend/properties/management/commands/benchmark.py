@@ -0,0 +1,93 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from properties import benchmarks, synthetic
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Time every API endpoint and serializer against seeded synthetic data in a throwaway '
+        'test database, check query budgets and optionally compare with a previous run'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Multiplier for the synthetic row counts (query budgets are set for 1)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case, after one warm-up run')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='JSON results of an earlier run to check for regressions')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative slowdown of a median before it counts as a regression')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as handle:
+                    baseline = json.load(handle)['results']
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f'Cannot read {options["compare"]}: {exc}')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            data = synthetic.generate(scale=options['scale'], seed=options['seed'])
+            results = benchmarks.run(data, repeat=options['repeat'])
+            counts = data.counts()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'commit': _git_commit(),
+                'created_at': timezone.now().isoformat(),
+                'scale': options['scale'],
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+                'rows': counts,
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
+
+        for result in results:
+            self.stdout.write(
+                f"{result['kind']:10} {result['name']:32} {result['queries']:4} queries "
+                f"{result['median_ms']:9.2f}ms median {result['p95_ms']:9.2f}ms p95"
+            )
+
+        problems = [
+            f"{r['name']}: {r['queries']} queries, budget {r['budget']}" for r in benchmarks.over_budget(results)
+        ]
+        if baseline is not None:
+            problems += benchmarks.compare(results, baseline, tolerance=options['tolerance'])
+        if problems:
+            for problem in problems:
+                self.stderr.write(problem)
+            raise CommandError(f'{len(problems)} benchmark regression(s)')
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} cases within budget'))
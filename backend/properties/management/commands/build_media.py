@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from properties import media
+from properties.models import Property
+
+
+class Command(BaseCommand):
+    help = (
+        'Build resized image derivatives for listings, e.g. after an import or when the '
+        'variant sizes change. Without ids, only listings that have images but no manifest'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('property_ids', nargs='*', help='Listings to rebuild (default: those missing derivatives)')
+        parser.add_argument('--force', action='store_true', help='Re-render images that already have derivatives')
+        parser.add_argument('--all', action='store_true', help='Every listing with images')
+
+    def handle(self, *args, **options):
+        queryset = Property.objects.exclude(Q(featured_image_url__isnull=True) | Q(featured_image_url=''), image_urls=[])
+        if options['property_ids']:
+            queryset = Property.objects.filter(pk__in=options['property_ids'])
+        elif not options['all'] and not options['force']:
+            queryset = queryset.filter(media={})
+
+        built = failed = 0
+        try:
+            for property_id in queryset.values_list('pk', flat=True).iterator():
+                manifest = media.build_media(property_id, force=options['force']) or {'images': []}
+                errors = [image for image in manifest['images'] if 'error' in image]
+                for image in errors:
+                    self.stderr.write(f"{property_id}: {image['source']}: {image['error']}")
+                built += 1
+                failed += len(errors)
+        finally:
+            media.shutdown_pool()
+        self.stdout.write(self.style.SUCCESS(f'Built derivatives for {built} listings ({failed} images failed)'))
@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from properties.importer import PropertyImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk import property listings from a CSV or JSONL file, streaming it in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or JSONL with one listing per line')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows validated and written per transaction')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Validate batches in this many processes (0 = in-process)')
+        parser.add_argument('--default-seller', help='Username or email used for rows without a seller')
+        parser.add_argument('--update', action='store_true', help='Overwrite listings whose id already exists')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and resolve references without writing')
+        parser.add_argument('--errors-file', help='Write rejected rows here as JSONL instead of to stderr')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        errors_file = open(options['errors_file'], 'w', encoding='utf-8') if options['errors_file'] else None
+
+        def on_error(line, errors):
+            if errors_file:
+                errors_file.write(json.dumps({'line': line, 'errors': errors}) + '\n')
+            else:
+                self.stderr.write(f'line {line}: {json.dumps(errors)}')
+
+        def on_progress(stats):
+            self.stdout.write(
+                f'{stats.processed} rows: {stats.created} created, {stats.updated} updated, '
+                f'{stats.failed} rejected ({stats.rate:.0f} rows/s)'
+            )
+
+        importer = PropertyImporter(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            update=options['update'],
+            default_seller=options['default_seller'],
+            dry_run=options['dry_run'],
+            on_error=on_error,
+            on_progress=on_progress,
+        )
+        try:
+            stats = importer.run(read_rows(options['path'], options['format']))
+        except OSError as exc:
+            raise CommandError(str(exc))
+        finally:
+            if errors_file:
+                errors_file.close()
+
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {stats.processed - stats.failed} of {stats.processed} rows in {stats.elapsed:.1f}s'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from properties.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the property full-text search index from scratch'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        indexed = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} properties with {type(backend).__name__}'
+        ))
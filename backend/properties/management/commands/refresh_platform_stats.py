@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from properties.models import Agency, PlatformStats, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Recount the PlatformStats snapshot served by /api/analytics/, the agency agent/listing '
+        'counts and the sellers\' inquiry counters (run periodically to correct drift from bulk writes)'
+    )
+
+    def handle(self, *args, **options):
+        agencies = Agency.recount()
+        profiles = UserProfile.recount()
+        stats = PlatformStats.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {stats}, the counts of {agencies} agencies and the inboxes of {profiles} users'
+        ))
@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from properties import taskqueue
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background tasks (inquiry and favorite notifications). Start one or more of '
+        'these next to the web processes, or leave TASK_WORKER_IN_PROCESS on to run them in-process'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due tasks and exit')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'TASK_BATCH_SIZE', 20))
+        parser.add_argument('--poll-interval', type=float, default=getattr(settings, 'TASK_POLL_INTERVAL', 5.0),
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--prune-days', type=float, default=getattr(settings, 'TASK_RETENTION_DAYS', 7),
+                            help='Delete finished tasks older than this many days (0 keeps them)')
+
+    def handle(self, *args, **options):
+        worker_id = taskqueue.default_worker_id()
+        retention = timedelta(days=options['prune_days']) if options['prune_days'] > 0 else None
+        processed = 0
+        last_prune = 0.0
+        try:
+            while True:
+                if retention is not None and time.monotonic() - last_prune > 3600:
+                    pruned = taskqueue.prune(retention)
+                    if pruned:
+                        self.stdout.write(f'Pruned {pruned} finished tasks')
+                    last_prune = time.monotonic()
+                claimed = taskqueue.run_batch(worker_id, options['batch_size'])
+                processed += claimed
+                if claimed:
+                    continue
+                if options['once']:
+                    break
+                connection.close()
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Ran {processed} tasks'))
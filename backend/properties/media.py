@@ -0,0 +1,341 @@
+"""
+Resized derivatives of listing images.
+
+Listing cards used to download full-size originals. ``build_media`` now
+turns each of a listing's images (``featured_image_url`` first, then
+``image_urls``) into WebP and JPEG variants at the widths in
+``imaging.VARIANTS``. It stores them through the MEDIA_STORAGE_BACKEND and
+records their URLs on ``Property.media``:
+
+    {"images": [{"source": <original url>, "digest": ..., "width": ..., "height": ...,
+                 "variants": {"card": {"width": 640, "height": 427,
+                                       "webp": <url>, "jpeg": <url>}, ...}}]}
+
+Resizing runs in a process pool (MEDIA_PROCESS_WORKERS spawned processes), so
+large JPEG decodes neither hold the GIL nor block the task worker's thread.
+Derivative paths are content addressed and served with a one-year cache
+lifetime. An image that is already in the manifest is not fetched or resized
+again. Rebuilds are queued by signals.py whenever a listing's image fields
+change.
+
+Image URLs come from listing owners, so ``fetch`` only speaks http and https
+and only connects to public addresses. Every hostname, including each
+redirect target, is resolved once. The connection goes to the address that
+was checked, so DNS cannot be rebound to an internal host in between.
+URLs under our own storage are read from it directly, but only files inside
+the storage root, and with the same MEDIA_MAX_SOURCE_BYTES limit.
+"""
+import http.client
+import ipaddress
+import mimetypes
+import multiprocessing
+import os
+import socket
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import imaging
+from .cache import LIST_GENERATION, detail_generation, response_cache
+from .models import Property
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+IMAGE_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp', 'GIF': 'image/gif'}
+FETCH_SCHEMES = ('http', 'https')
+
+
+class BlockedURL(ValueError):
+    """An image URL that ``fetch`` refuses: another scheme, a non-public address, or a path outside our storage"""
+
+
+class LocalMediaStorage:
+    """Files under MEDIA_ROOT, served at MEDIA_BASE_URL + MEDIA_URL (urls.py serves them when DEBUG is on)"""
+
+    def __init__(self):
+        self.root = Path(settings.MEDIA_ROOT)
+        self.base_url = urljoin(getattr(settings, 'MEDIA_BASE_URL', '') or '', settings.MEDIA_URL)
+
+    def save(self, name, content, content_type):
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}')
+        tmp.write_bytes(content)
+        os.replace(tmp, path)
+        return self.url(name)
+
+    def url(self, name):
+        return self.base_url + name
+
+    def name_for(self, url):
+        """The stored name behind ``url``, or None when the URL is not ours"""
+        return url[len(self.base_url):] if url.startswith(self.base_url) else None
+
+    def read(self, name, limit):
+        """Up to ``limit`` + 1 bytes of the file stored as ``name``, which must resolve to a file under the root"""
+        root = self.root.resolve()
+        path = (root / name).resolve()
+        if not path.is_relative_to(root) or not path.is_file():
+            raise BlockedURL(f'{name} is not a stored file')
+        with path.open('rb') as stored:
+            return stored.read(limit + 1)
+
+
+class FirebaseMediaStorage:
+    """Public objects in the FIREBASE_STORAGE_BUCKET bucket (firebase_config.py initializes the app)"""
+
+    def __init__(self):
+        import firebase_config  # noqa: F401
+        from firebase_admin import storage
+
+        self.bucket = storage.bucket(getattr(settings, 'FIREBASE_STORAGE_BUCKET', None) or None)
+        self.base_url = f'https://storage.googleapis.com/{self.bucket.name}/'
+
+    def save(self, name, content, content_type):
+        blob = self.bucket.blob(name)
+        blob.cache_control = IMMUTABLE_CACHE_CONTROL
+        blob.upload_from_string(content, content_type=content_type)
+        blob.make_public()
+        return self.url(name)
+
+    def url(self, name):
+        return self.base_url + name
+
+    def name_for(self, url):
+        return url[len(self.base_url):] if url.startswith(self.base_url) else None
+
+    def read(self, name, limit):
+        return self.bucket.blob(name).download_as_bytes(end=limit)
+
+
+_storage = None
+
+
+def get_media_storage():
+    """The storage named by MEDIA_STORAGE_BACKEND"""
+    global _storage
+    if _storage is None:
+        _storage = import_string(getattr(settings, 'MEDIA_STORAGE_BACKEND', 'properties.media.LocalMediaStorage'))()
+    return _storage
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The process pool that runs ``imaging.render_variants``, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the web process has threads (task worker, view counter)
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'MEDIA_PROCESS_WORKERS', None) or min(4, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def store_original(property_id, data):
+    """Validate an uploaded image and store it unchanged; returns its URL"""
+    image_format = imaging.open_image(data).format
+    if image_format not in IMAGE_TYPES:
+        raise imaging.InvalidImage(f'Unsupported image format {image_format}')
+    content_type = IMAGE_TYPES[image_format]
+    name = f'properties/{property_id}/originals/{imaging.digest(data)}{mimetypes.guess_extension(content_type)}'
+    return get_media_storage().save(name, data, content_type)
+
+
+def _check_scheme(url):
+    if urlsplit(url).scheme.lower() not in FETCH_SCHEMES:
+        raise BlockedURL(f'{url} is not an http or https URL')
+
+
+def _is_public(address):
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def _public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None, *args, **kwargs):
+    """``socket.create_connection`` that resolves ``address`` once and refuses non-public hosts"""
+    host, port = address
+    try:
+        resolved = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as exc:
+        raise BlockedURL(f'{host} cannot be resolved: {exc}')
+    blocked = [sockaddr[0] for *_, sockaddr in resolved if not _is_public(sockaddr[0])]
+    if blocked:
+        raise BlockedURL(f'{host} resolves to a non-public address ({", ".join(blocked)})')
+    family, socktype, proto, _, sockaddr = resolved[0]
+    sock = socket.socket(family, socktype, proto)
+    try:
+        if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            sock.settimeout(timeout)
+        if source_address:
+            sock.bind(source_address)
+        sock.connect(sockaddr)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _HTTPOnlyRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        _check_scheme(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def _opener():
+    # No proxies: the address checks must apply to the host we actually connect to
+    return urllib.request.build_opener(
+        urllib.request.ProxyHandler({}), _PublicHTTPHandler, _PublicHTTPSHandler, _HTTPOnlyRedirectHandler,
+    )
+
+
+def fetch(url):
+    """
+    Bytes of an original, read from our storage when we hold it, else over
+    HTTP(S) from a public address; raises BlockedURL for anything else
+    """
+    limit = getattr(settings, 'MEDIA_MAX_SOURCE_BYTES', 20 * 1024 * 1024)
+    storage = get_media_storage()
+    name = storage.name_for(url)
+    if name is not None:
+        data = storage.read(name, limit)
+    else:
+        _check_scheme(url)
+        request = urllib.request.Request(url, headers={'User-Agent': 'FabHomes media pipeline'})
+        with _opener().open(request, timeout=getattr(settings, 'MEDIA_FETCH_TIMEOUT', 20)) as response:
+            data = response.read(limit + 1)
+    if len(data) > limit:
+        raise imaging.InvalidImage(f'{url} is larger than {limit} bytes')
+    return data
+
+
+def sources(instance):
+    """The listing's image URLs, featured first, without duplicates"""
+    return source_urls(instance.featured_image_url, instance.image_urls)
+
+
+def source_urls(featured_image_url, image_urls):
+    urls = [featured_image_url] + list(image_urls or [])
+    return list(dict.fromkeys(url for url in urls if isinstance(url, str) and url))
+
+
+def _save_variants(storage, property_id, image_digest, variants):
+    saved = {}
+    for name, variant in variants.items():
+        entry = {'width': variant['width'], 'height': variant['height']}
+        for key, (_, content_type) in imaging.FORMATS.items():
+            path = f'properties/{property_id}/{image_digest}/{name}.{key}'
+            entry[key] = storage.save(path, variant[key], content_type)
+        saved[name] = entry
+    return saved
+
+
+def build_manifest(instance, force=False):
+    """
+    The ``media`` manifest for ``instance``'s current images. Entries for
+    images already in the manifest are reused unless ``force`` is set.
+    Images that cannot be fetched or decoded get an ``error`` instead of
+    ``variants``, and are tried again on the next build.
+    """
+    storage = get_media_storage()
+    known = {} if force else {image['source']: image for image in (instance.media or {}).get('images', [])
+                               if 'variants' in image}
+    urls = sources(instance)
+    pending, originals = [], []
+    for url in urls:
+        if url in known:
+            continue
+        try:
+            originals.append(fetch(url))
+            pending.append(url)
+        except (OSError, ValueError) as exc:
+            known[url] = {'source': url, 'error': str(exc)}
+
+    quality = (getattr(settings, 'MEDIA_WEBP_QUALITY', 80), getattr(settings, 'MEDIA_JPEG_QUALITY', 82))
+    futures = [get_pool().submit(imaging.render_variants, data, *quality) for data in originals]
+    for url, future in zip(pending, futures):
+        try:
+            image_digest, (width, height), variants = future.result()
+        except imaging.InvalidImage as exc:
+            known[url] = {'source': url, 'error': str(exc)}
+            continue
+        except BrokenProcessPool:
+            # A worker died (out of memory, killed); start a fresh pool for the retry
+            shutdown_pool()
+            raise
+        known[url] = {
+            'source': url, 'digest': image_digest, 'width': width, 'height': height,
+            'variants': _save_variants(storage, instance.pk, image_digest, variants),
+        }
+    return {'images': [known[url] for url in urls]}
+
+
+def build_media(property_id, force=False):
+    """Rebuild a listing's derivatives and store the manifest; returns it (None if the listing is gone)"""
+    instance = Property.objects.filter(pk=property_id).only(
+        'id', 'featured_image_url', 'image_urls', 'media'
+    ).first()
+    if instance is None:
+        return None
+    manifest = build_manifest(instance, force=force)
+    if manifest != instance.media:
+        # update() skips the image-change signal that queued this build
+        Property.objects.filter(pk=property_id).update(media=manifest)
+        response_cache.bump_on_commit(LIST_GENERATION, detail_generation(property_id))
+    return manifest
+
+
+def featured_variants(instance, names):
+    """``{name: variant}`` for the featured image, or None until its derivatives are built"""
+    return featured_variants_of(instance.featured_image_url, instance.image_urls, instance.media, names)
+
+
+def featured_variants_of(featured_image_url, image_urls, media, names):
+    """``featured_variants`` from the three column values, e.g. a values() row"""
+    urls = source_urls(featured_image_url, image_urls)
+    for image in (media or {}).get('images') or ():
+        if urls and image['source'] == urls[0] and 'variants' in image:
+            return {name: image['variants'][name] for name in names if name in image['variants']}
+    return None
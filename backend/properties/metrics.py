@@ -0,0 +1,302 @@
+"""
+Per-endpoint request metrics in Prometheus text format.
+
+MetricsMiddleware times each request and, through a database execute wrapper,
+counts its SQL queries and SQL time. Samples are keyed by the resolved view
+and action (``PropertyViewSet.search``, ``analytics``), so label cardinality
+stays bounded by the URLconf. Queries slower than SLOW_QUERY_THRESHOLD_MS are
+logged to the ``properties.metrics`` logger.
+
+The registry is per process and costs a few counter increments under one
+lock per request. Scrape every worker, or run one worker per metrics target.
+"""
+import bisect
+import hmac
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNRESOLVED = 'unresolved'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class Histogram:
+    """Cumulative-on-render bucket counts plus a running sum"""
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        if index < len(self.bounds):
+            self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, **labels):
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}'
+        yield f'{name}_bucket{_labels(**labels, le="+Inf")} {self.count}'
+        yield f'{name}_sum{_labels(**labels)} {self.total}'
+        yield f'{name}_count{_labels(**labels)} {self.count}'
+
+
+class MetricsRegistry:
+    def __init__(self, latency_buckets=None):
+        self.latency_buckets = tuple(latency_buckets or DEFAULT_LATENCY_BUCKETS)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._requests = Counter()
+            self._latency = defaultdict(lambda: Histogram(self.latency_buckets))
+            self._query_counts = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+            self._queries = Counter()
+            self._sql_seconds = Counter()
+            self._slow_queries = Counter()
+
+    def observe(self, view, method, status, seconds, queries, sql_seconds, slow_queries=0):
+        with self._lock:
+            self._requests[view, method, f'{status // 100}xx'] += 1
+            self._latency[view].observe(seconds)
+            self._query_counts[view].observe(queries)
+            self._queries[view] += queries
+            self._sql_seconds[view] += sql_seconds
+            if slow_queries:
+                self._slow_queries[view] += slow_queries
+
+    def render(self):
+        """The registry (plus cache, view-buffer and task queue gauges) in Prometheus exposition format"""
+        from . import taskqueue
+        from .cache import response_cache
+        from .view_counter import view_counter
+
+        with self._lock:
+            lines = [
+                '# HELP fabhomes_http_requests_total Requests handled, by view and action.',
+                '# TYPE fabhomes_http_requests_total counter',
+            ]
+            for (view, method, status), count in sorted(self._requests.items()):
+                lines.append(f'fabhomes_http_requests_total{_labels(view=view, method=method, status=status)} {count}')
+
+            lines += [
+                '# HELP fabhomes_http_request_duration_seconds Request latency, by view and action.',
+                '# TYPE fabhomes_http_request_duration_seconds histogram',
+            ]
+            for view in sorted(self._latency):
+                lines.extend(self._latency[view].render('fabhomes_http_request_duration_seconds', view=view))
+
+            lines += [
+                '# HELP fabhomes_db_queries_per_request SQL queries issued per request.',
+                '# TYPE fabhomes_db_queries_per_request histogram',
+            ]
+            for view in sorted(self._query_counts):
+                lines.extend(self._query_counts[view].render('fabhomes_db_queries_per_request', view=view))
+
+            for name, help_text, values in (
+                ('fabhomes_db_queries_total', 'SQL queries issued.', self._queries),
+                ('fabhomes_db_query_duration_seconds_total', 'Time spent in SQL.', self._sql_seconds),
+                ('fabhomes_db_slow_queries_total', 'Queries slower than SLOW_QUERY_THRESHOLD_MS.', self._slow_queries),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                lines += [f'{name}{_labels(view=view)} {value}' for view, value in sorted(values.items())]
+
+        cache_stats = response_cache.stats()
+        lines += [
+            '# HELP fabhomes_response_cache_requests_total Anonymous reads served from or added to the response cache.',
+            '# TYPE fabhomes_response_cache_requests_total counter',
+            f'fabhomes_response_cache_requests_total{_labels(result="hit")} {cache_stats["hits"]}',
+            f'fabhomes_response_cache_requests_total{_labels(result="miss")} {cache_stats["misses"]}',
+            '# HELP fabhomes_view_count_pending Property views buffered and not yet written.',
+            '# TYPE fabhomes_view_count_pending gauge',
+            f'fabhomes_view_count_pending {view_counter.pending_total()}',
+        ]
+
+        depth, oldest_age = taskqueue.depth()
+        lines += [
+            '# HELP fabhomes_task_queue_depth Background jobs waiting or running, by task and status.',
+            '# TYPE fabhomes_task_queue_depth gauge',
+        ]
+        lines += [
+            f'fabhomes_task_queue_depth{_labels(task=name, status=status)} {count}'
+            for (name, status), count in sorted(depth.items())
+        ]
+        lines += [
+            '# HELP fabhomes_task_queue_oldest_age_seconds Time the oldest due job has been waiting.',
+            '# TYPE fabhomes_task_queue_oldest_age_seconds gauge',
+            f'fabhomes_task_queue_oldest_age_seconds {oldest_age:.3f}',
+            '# HELP fabhomes_tasks_total Background jobs finished by this process, by task and outcome.',
+            '# TYPE fabhomes_tasks_total counter',
+        ]
+        lines += [
+            f'fabhomes_tasks_total{_labels(task=name, outcome=outcome)} {count}'
+            for (name, outcome), count in sorted(taskqueue.stats.outcomes().items())
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry(getattr(settings, 'METRICS_LATENCY_BUCKETS', None))
+
+
+def scrape_allowed(request):
+    """
+    The METRICS_TOKEN bearer token, a staff user (session or Firebase token), or
+    a client address listed in METRICS_ALLOWED_IPS. Everything else is refused.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(header) == 2 and header[0].lower() == 'bearer' and hmac.compare_digest(header[1], token):
+            return True
+    from .authentication import staff_user
+    if staff_user(request) is not None:
+        return True
+    # REMOTE_ADDR behind a reverse proxy is the proxy's, so this is opt-in only
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+
+
+def view_label(request, view_func):
+    """``ViewSet.action`` for DRF viewsets, otherwise the view's name"""
+    cls = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None)
+    if cls is not None and actions:
+        return f'{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+    if cls is not None and cls.__name__ != 'WrappedAPIView':
+        return cls.__name__
+    match = getattr(request, 'resolver_match', None)
+    if match is not None and match.view_name:
+        return match.view_name
+    return getattr(view_func, '__name__', UNRESOLVED)
+
+
+class QueryRecorder:
+    """Database execute wrapper that counts queries and SQL time for one request"""
+    __slots__ = ('queries', 'sql_seconds', 'slow_queries', 'slow_threshold', 'view')
+
+    def __init__(self, slow_threshold):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slow_queries = 0
+        self.slow_threshold = slow_threshold
+        self.view = UNRESOLVED
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql_seconds += elapsed
+            if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+                self.slow_queries += 1
+                logger.warning(
+                    'Slow query (%.1f ms) in %s on %s: %s',
+                    elapsed * 1000, self.view, context['connection'].alias, sql[:2000],
+                )
+
+    def instrument(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+class MetricsMiddleware:
+    """Records latency and SQL usage for every request; see ``metrics_registry``"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        threshold_ms = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200)
+        self.slow_threshold = threshold_ms / 1000 if threshold_ms else None
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        recorder = QueryRecorder(self.slow_threshold)
+        request._query_recorder = recorder
+        started = time.perf_counter()
+        with recorder.instrument():
+            response = self.get_response(request)
+        if response.streaming:
+            # The body (and its queries) is produced after we return
+            response.streaming_content = self._stream(response.streaming_content, request, response, recorder, started)
+        else:
+            self._observe(request, response, recorder, started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        recorder = QueryRecorder(self.slow_threshold)
+        request._query_recorder = recorder
+        started = time.perf_counter()
+        # The async ORM runs this request's queries on one worker thread; instrument its connections
+        instrumented = await sync_to_async(recorder.instrument)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(instrumented.close)()
+        if response.streaming:
+            stream = self._astream if response.is_async else self._stream
+            response.streaming_content = stream(response.streaming_content, request, response, recorder, started)
+        else:
+            self._observe(request, response, recorder, started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        recorder = getattr(request, '_query_recorder', None)
+        if recorder is not None:
+            recorder.view = view_label(request, view_func)
+
+    def _stream(self, content, request, response, recorder, started):
+        try:
+            with recorder.instrument():
+                yield from content
+        finally:
+            self._observe(request, response, recorder, started)
+
+    async def _astream(self, content, request, response, recorder, started):
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            self._observe(request, response, recorder, started)
+
+    def _observe(self, request, response, recorder, started):
+        metrics_registry.observe(
+            recorder.view, request.method, response.status_code, time.perf_counter() - started,
+            recorder.queries, recorder.sql_seconds, recorder.slow_queries,
+        )
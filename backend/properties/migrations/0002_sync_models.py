@@ -0,0 +1,402 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:34
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Agency',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('phone', models.CharField(max_length=20)),
+                ('logo_url', models.URLField(blank=True, null=True)),
+                ('description', models.TextField(blank=True)),
+                ('address', models.CharField(blank=True, max_length=300)),
+                ('website', models.URLField(blank=True, null=True)),
+                ('verification_status', models.CharField(choices=[('pending', 'Pending Verification'), ('verified', 'Verified'), ('rejected', 'Rejected')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Agencies',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Favorite',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Review',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('rating', models.PositiveIntegerField(choices=[(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)])),
+                ('comment', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('transaction_type', models.CharField(choices=[('sale', 'Sale'), ('rental', 'Rental')], max_length=20)),
+                ('offer_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('final_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('status', models.CharField(choices=[('negotiating', 'Negotiating'), ('accepted', 'Accepted'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='negotiating', max_length=20)),
+                ('transaction_date', models.DateTimeField(blank=True, null=True)),
+                ('closing_date', models.DateTimeField(blank=True, null=True)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('firebase_uid', models.CharField(max_length=128, unique=True)),
+                ('phone', models.CharField(blank=True, max_length=20)),
+                ('profile_image_url', models.URLField(blank=True, null=True)),
+                ('bio', models.TextField(blank=True)),
+                ('role', models.CharField(choices=[('buyer', 'Buyer'), ('seller', 'Seller'), ('agent', 'Real Estate Agent'), ('admin', 'Administrator')], default='buyer', max_length=20)),
+                ('is_verified', models.BooleanField(default=False)),
+                ('is_agent', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='inquiry',
+            options={'ordering': ['-created_at']},
+        ),
+        migrations.AlterModelOptions(
+            name='property',
+            options={'ordering': ['-created_at']},
+        ),
+        migrations.RemoveField(
+            model_name='property',
+            name='area',
+        ),
+        migrations.RemoveField(
+            model_name='property',
+            name='images',
+        ),
+        migrations.AddField(
+            model_name='inquiry',
+            name='email',
+            field=models.EmailField(default='', max_length=254),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='inquiry',
+            name='inquiry_type',
+            field=models.CharField(choices=[('general', 'General Inquiry'), ('viewing_request', 'Viewing Request'), ('offer', 'Make Offer')], default='general', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='inquiry',
+            name='name',
+            field=models.CharField(default='', max_length=200),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='inquiry',
+            name='phone',
+            field=models.CharField(default='', max_length=20),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='inquiry',
+            name='status',
+            field=models.CharField(choices=[('new', 'New'), ('contacted', 'Contacted'), ('resolved', 'Resolved'), ('closed', 'Closed')], default='new', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='inquiry',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='properties_managed', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='city',
+            field=models.CharField(default='', max_length=100),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='country',
+            field=models.CharField(default='', max_length=100),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='featured_image_url',
+            field=models.URLField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='furnishing',
+            field=models.CharField(choices=[('unfurnished', 'Unfurnished'), ('partially_furnished', 'Partially Furnished'), ('fully_furnished', 'Fully Furnished')], default='unfurnished', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='garage_spaces',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='image_urls',
+            field=models.JSONField(blank=True, default=list, help_text='Array of Firebase Storage URLs'),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='lease_term',
+            field=models.CharField(blank=True, help_text="e.g., '12 months'", max_length=100),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='listed_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='listing_type',
+            field=models.CharField(choices=[('sale', 'For Sale'), ('rent', 'For Rent')], default='', max_length=10),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='monthly_rent',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='property_features',
+            field=models.JSONField(blank=True, default=list, help_text="e.g., ['swimming_pool', 'gym', 'garden']"),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='security_deposit',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='seller',
+            field=models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, related_name='properties_sold', to=settings.AUTH_USER_MODEL),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='state',
+            field=models.CharField(default='', max_length=100),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='status',
+            field=models.CharField(choices=[('available', 'Available'), ('sold', 'Sold'), ('pending', 'Pending'), ('rented', 'Rented')], default='available', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='total_area',
+            field=models.PositiveIntegerField(default=0, help_text='Total area in sqft'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='utilities',
+            field=models.JSONField(blank=True, default=list, help_text="e.g., ['water', 'electricity', 'gas']"),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='views_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='year_built',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='zip_code',
+            field=models.CharField(default='', max_length=20),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='inquiry',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='inquiry',
+            name='property',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inquiries', to='properties.property'),
+        ),
+        migrations.AlterField(
+            model_name='inquiry',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inquiries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='property',
+            name='bathrooms',
+            field=models.DecimalField(decimal_places=1, max_digits=3),
+        ),
+        migrations.AlterField(
+            model_name='property',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='property',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='property',
+            name='property_type',
+            field=models.CharField(choices=[('house', 'House'), ('apartment', 'Apartment'), ('condo', 'Condo'), ('townhouse', 'Townhouse'), ('land', 'Land')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['property', 'status'], name='properties__propert_8d7fce_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['-created_at'], name='properties__created_126f8a_idx'),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='agency',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='properties', to='properties.agency'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['listing_type', 'status'], name='properties__listing_c2c341_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['city', 'price'], name='properties__city_55b879_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['-created_at'], name='properties__created_9ef325_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['-views_count'], name='properties__views_c_0b3478_idx'),
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='property',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorited_by', to='properties.property'),
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='agency',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='properties.agency'),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reviews_received', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='property',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='properties.property'),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='reviewer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews_given', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions_handled', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='buyer',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchases', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='property',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='properties.property'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='agency',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='agents', to='properties.agency'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='favorite',
+            unique_together={('user', 'property')},
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['property', 'status'], name='properties__propert_2f5ee8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-created_at'], name='properties__created_3fbc1a_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+from django.db import migrations
+
+SQLITE_FTS_TABLE = 'properties_property_fts'
+POSTGRES_SEARCH_TABLE = 'properties_property_search'
+
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(location, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(city, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(state, '')), 'C') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'D')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {SQLITE_FTS_TABLE} USING fts5("
+            "property_id UNINDEXED, title, description, location, city, state, "
+            "tokenize='porter unicode61', prefix='2 3')"
+        )
+        Property = apps.get_model('properties', 'Property')
+        rows = [
+            [p.pk.int & ((1 << 62) - 1), p.pk.hex, p.title, p.description, p.location, p.city, p.state]
+            for p in Property.objects.all().iterator()
+        ]
+        if rows:
+            with schema_editor.connection.cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO {SQLITE_FTS_TABLE} '
+                    '(rowid, property_id, title, description, location, city, state) '
+                    'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                    rows,
+                )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE {POSTGRES_SEARCH_TABLE} ('
+            'property_id uuid PRIMARY KEY REFERENCES properties_property (id) '
+            'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX {POSTGRES_SEARCH_TABLE}_document_gin '
+            f'ON {POSTGRES_SEARCH_TABLE} USING gin (document)'
+        )
+        schema_editor.execute(
+            f'INSERT INTO {POSTGRES_SEARCH_TABLE} (property_id, document) '
+            f'SELECT id, {POSTGRES_DOCUMENT} FROM properties_property'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {POSTGRES_SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0002_sync_models'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
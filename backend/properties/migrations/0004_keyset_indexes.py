@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0003_property_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='inquiry',
+            name='properties__created_126f8a_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='property',
+            name='properties__created_9ef325_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='property',
+            name='properties__views_c_0b3478_idx',
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='properties__user_id_e1c3f6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['-created_at', '-id'], name='properties__created_42e638_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['-created_at', '-id'], name='properties__created_388d9e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['-views_count', '-id'], name='properties__views_c_cb50fa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['price', 'id'], name='properties__price_b10c54_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+from properties.geo import geohash_for
+
+
+def backfill_geohash(apps, schema_editor):
+    Property = apps.get_model('properties', 'Property')
+    batch = []
+    for obj in Property.objects.exclude(latitude=None).exclude(longitude=None).only('latitude', 'longitude').iterator():
+        obj.geohash = geohash_for(obj.latitude, obj.longitude)
+        batch.append(obj)
+        if len(batch) >= 1000:
+            Property.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    Property.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0004_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='geohash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['geohash'], name='properties__geohash_260a12_idx'),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0005_property_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_properties', models.IntegerField(default=0)),
+                ('available_properties', models.IntegerField(default=0)),
+                ('for_sale', models.IntegerField(default=0)),
+                ('for_rent', models.IntegerField(default=0)),
+                ('total_inquiries', models.IntegerField(default=0)),
+                ('total_users', models.IntegerField(default=0)),
+                ('verified_agencies', models.IntegerField(default=0)),
+                ('total_reviews', models.IntegerField(default=0)),
+                ('completed_transactions', models.IntegerField(default=0)),
+                ('as_of', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Platform stats',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    Agency = apps.get_model('properties', 'Agency')
+    UserProfile = apps.get_model('properties', 'UserProfile')
+    Property = apps.get_model('properties', 'Property')
+
+    def count(model):
+        rows = model.objects.filter(agency=OuterRef('pk')).order_by().values('agency').annotate(n=Count('pk'))
+        return Coalesce(Subquery(rows.values('n')), 0)
+
+    Agency.objects.update(agents_count=count(UserProfile), properties_count=count(Property))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0008_request_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agency',
+            name='agents_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='agency',
+            name='properties_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
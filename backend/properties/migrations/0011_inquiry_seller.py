@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_sellers(apps, schema_editor):
+    Inquiry = apps.get_model('properties', 'Inquiry')
+    Property = apps.get_model('properties', 'Property')
+    UserProfile = apps.get_model('properties', 'UserProfile')
+
+    Inquiry.objects.update(
+        seller=Subquery(Property.objects.filter(pk=OuterRef('property_id')).values('seller_id')[:1])
+    )
+
+    def count(condition):
+        rows = (
+            Inquiry.objects.filter(condition, seller=OuterRef('user_id'))
+            .order_by().values('seller').annotate(n=Count('pk'))
+        )
+        return Coalesce(Subquery(rows.values('n')), 0)
+
+    UserProfile.objects.update(
+        inquiries_received_count=count(Q()), new_inquiries_count=count(Q(status='new'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0010_task'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inquiry',
+            name='seller',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inquiries_received', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='inquiries_received_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='new_inquiries_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['seller', 'status', '-created_at'], name='properties__seller__540d34_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['user', '-created_at'], name='properties__user_id_d1e8fd_idx'),
+        ),
+        migrations.RunPython(backfill_sellers, migrations.RunPython.noop),
+        # (user, -created_at) replaces the foreign key's own index
+        migrations.AlterField(
+            model_name='inquiry',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inquiries', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
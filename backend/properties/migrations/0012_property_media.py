@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0011_inquiry_seller'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='media',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
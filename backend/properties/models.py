@@ -1,8 +1,63 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import User
 import uuid
 
-class Agency(models.Model):
+from .geo import geohash_for
+
+
+def _count_subquery(queryset, field, outer='pk'):
+    """Correlated COUNT(*) of ``queryset`` rows whose ``field`` points at the outer row's ``outer``"""
+    counts = (
+        queryset.filter(**{field: OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+class TrackedFieldsMixin:
+    """
+    Remembers the database values of ``tracked_fields`` so signal handlers can
+    see transitions. signals.py reads them through ``tracked_snapshot`` before
+    each save and moves them forward once the save's handlers have run.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._tracked_initial = {
+            name: value for name, value in zip(field_names, values) if name in cls.tracked_fields
+        }
+        return instance
+
+    def tracked_snapshot(self):
+        """
+        The stored values of ``tracked_fields``, reading any that were not
+        loaded (``only()``/``defer()``) from the row; None when there is no row
+        """
+        snapshot = dict(getattr(self, '_tracked_initial', {}))
+        missing = [name for name in self.tracked_fields if name not in snapshot]
+        if missing:
+            row = type(self)._base_manager.filter(pk=self.pk).values(*missing).first()
+            if row is None:
+                return None
+            snapshot.update(row)
+        return snapshot
+
+    def remember_tracked_fields(self):
+        """Take the loaded tracked values as the stored ones, e.g. after a save"""
+        self._tracked_initial = {
+            name: self.__dict__[name] for name in self.tracked_fields if name in self.__dict__
+        }
+
+
+class Agency(TrackedFieldsMixin, models.Model):
     """Real Estate Agency Model"""
     VERIFICATION_STATUS = [
         ('pending', 'Pending Verification'),
@@ -19,9 +74,14 @@ class Agency(models.Model):
     address = models.CharField(max_length=300, blank=True)
     website = models.URLField(blank=True, null=True)
     verification_status = models.CharField(max_length=20, choices=VERIFICATION_STATUS, default='pending')
+    # Denormalized, kept current by signals.py; see recount()
+    agents_count = models.IntegerField(default=0, editable=False)
+    properties_count = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    tracked_fields = ('verification_status',)
+
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "Agencies"
@@ -29,8 +89,17 @@ class Agency(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def recount(cls, agency_ids=None):
+        """Recompute agents_count and properties_count, e.g. after bulk writes that skip signals"""
+        agencies = cls.objects.all() if agency_ids is None else cls.objects.filter(pk__in=agency_ids)
+        return agencies.update(
+            agents_count=_count_subquery(UserProfile.objects.all(), 'agency'),
+            properties_count=_count_subquery(Property.objects.all(), 'agency'),
+        )
+
 
-class UserProfile(models.Model):
+class UserProfile(TrackedFieldsMixin, models.Model):
     """Extended User Profile"""
     ROLE_CHOICES = [
         ('buyer', 'Buyer'),
@@ -48,14 +117,44 @@ class UserProfile(models.Model):
     is_verified = models.BooleanField(default=False)
     is_agent = models.BooleanField(default=False)
     agency = models.ForeignKey(Agency, on_delete=models.SET_NULL, null=True, blank=True, related_name='agents')
+    # Inquiries on the user's listings; denormalized, kept current by signals.py; see recount()
+    inquiries_received_count = models.IntegerField(default=0, editable=False)
+    new_inquiries_count = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    tracked_fields = ('agency_id',)
+
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}"
 
+    @classmethod
+    def recount(cls, user_ids=None):
+        """Recompute the inquiry counters, e.g. after bulk writes that skip signals"""
+        profiles = cls.objects.all() if user_ids is None else cls.objects.filter(user_id__in=user_ids)
+        return profiles.update(
+            inquiries_received_count=_count_subquery(Inquiry.objects.all(), 'seller', 'user_id'),
+            new_inquiries_count=_count_subquery(Inquiry.objects.filter(status='new'), 'seller', 'user_id'),
+        )
+
+
+class PropertyQuerySet(models.QuerySet):
+    """Query helpers that keep list/detail endpoints at a fixed number of queries"""
+
+    def with_favorites_count(self):
+        return self.annotate(favorites_count=_count_subquery(Favorite.objects.all(), 'property'))
+
+    def with_new_inquiries_count(self):
+        return self.annotate(
+            new_inquiries_count=_count_subquery(Inquiry.objects.filter(status='new'), 'property')
+        )
+
+    def for_listing(self):
+        """Columns and counts needed by PropertyListSerializer"""
+        return self.select_related('seller', 'agent', 'agency').with_favorites_count()
+
 
-class Property(models.Model):
+class Property(TrackedFieldsMixin, models.Model):
     """Property Listing Model"""
     PROPERTY_TYPE_CHOICES = [
         ('house', 'House'),
@@ -106,6 +205,7 @@ class Property(models.Model):
     country = models.CharField(max_length=100)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False)
     
     # Property Details
     bedrooms = models.PositiveIntegerField()
@@ -122,6 +222,8 @@ class Property(models.Model):
     # Media
     featured_image_url = models.URLField(blank=True, null=True)
     image_urls = models.JSONField(default=list, blank=True, help_text="Array of Firebase Storage URLs")
+    # Resized derivatives of the images above, written by properties.media.build_media
+    media = models.JSONField(default=dict, blank=True, editable=False)
     
     # Relations
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='properties_sold')
@@ -136,24 +238,39 @@ class Property(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     listed_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PropertyQuerySet.as_manager()
+
+    tracked_fields = ('status', 'listing_type', 'agency_id', 'seller_id', 'featured_image_url', 'image_urls')
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['listing_type', 'status']),
             models.Index(fields=['city', 'price']),
-            models.Index(fields=['-created_at']),
-            models.Index(fields=['-views_count']),
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['-views_count', '-id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['geohash']),
+            models.Index(fields=['updated_at', 'id']),
         ]
 
     def __str__(self):
         return f"{self.title} - {self.get_listing_type_display()}"
 
-    def increment_views(self):
-        self.views_count += 1
-        self.save(update_fields=['views_count'])
+    def save(self, *args, **kwargs):
+        self.geohash = geohash_for(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'}.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
 
+    def increment_views(self, by=1):
+        """Write-through increment; request paths use properties.view_counter instead"""
+        Property.objects.filter(pk=self.pk).update(views_count=models.F('views_count') + by)
+        self.views_count += by
 
-class Inquiry(models.Model):
+
+class Inquiry(TrackedFieldsMixin, models.Model):
     """Property Inquiry/Lead Model"""
     INQUIRY_TYPE_CHOICES = [
         ('general', 'General Inquiry'),
@@ -170,7 +287,15 @@ class Inquiry(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='inquiries')
-    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='inquiries')
+    # Indexed by (user, -created_at) below
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='inquiries', db_index=False
+    )
+    # The property's seller, copied on save so the seller's inbox needs no join; see signals.py
+    seller = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name='inquiries_received',
+        db_index=False, editable=False,
+    )
     
     # Guest info (for non-authenticated inquiries)
     name = models.CharField(max_length=200)
@@ -184,16 +309,35 @@ class Inquiry(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    tracked_fields = ('status', 'seller_id', 'property_id')
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['property', 'status']),
-            models.Index(fields=['-created_at']),
+            models.Index(fields=['-created_at', '-id']),
+            # The two halves of the inbox (see views.InquiryViewSet.list)
+            models.Index(fields=['seller', 'status', '-created_at']),
+            models.Index(fields=['user', '-created_at']),
         ]
 
     def __str__(self):
         return f"Inquiry for {self.property.title} by {self.name}"
 
+    def save(self, *args, **kwargs):
+        # Also when the inquiry is moved to another listing, which may have another seller
+        stored_property_id = getattr(self, '_tracked_initial', {}).get('property_id', self.property_id)
+        if self.property_id is not None and (self.seller_id is None or self.property_id != stored_property_id):
+            self.seller_id = self.property.seller_id
+        super().save(*args, **kwargs)
+
+
+class FavoriteQuerySet(models.QuerySet):
+
+    def with_property_favorites_count(self):
+        """Each row's listing's ``favorites_count``, as PropertyQuerySet.with_favorites_count computes it"""
+        return self.annotate(favorites_count=_count_subquery(Favorite.objects.all(), 'property', 'property_id'))
+
 
 class Favorite(models.Model):
     """User Favorite Properties"""
@@ -202,9 +346,14 @@ class Favorite(models.Model):
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='favorited_by')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = FavoriteQuerySet.as_manager()
+
     class Meta:
         unique_together = ['user', 'property']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.property.title}"
@@ -232,7 +381,7 @@ class Review(models.Model):
         return f"Review by {self.reviewer.username} for {target}"
 
 
-class Transaction(models.Model):
+class Transaction(TrackedFieldsMixin, models.Model):
     """Property Transaction Record"""
     TRANSACTION_TYPE_CHOICES = [
         ('sale', 'Sale'),
@@ -264,6 +413,8 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    tracked_fields = ('status',)
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -274,3 +425,144 @@ class Transaction(models.Model):
     def __str__(self):
         return f"{self.get_transaction_type_display()} - {self.property.title}"
 
+
+class PlatformStats(models.Model):
+    """Single-row snapshot of platform counters served by the analytics endpoint"""
+    SINGLETON_ID = 1
+
+    total_properties = models.IntegerField(default=0)
+    available_properties = models.IntegerField(default=0)
+    for_sale = models.IntegerField(default=0)
+    for_rent = models.IntegerField(default=0)
+    total_inquiries = models.IntegerField(default=0)
+    total_users = models.IntegerField(default=0)
+    verified_agencies = models.IntegerField(default=0)
+    total_reviews = models.IntegerField(default=0)
+    completed_transactions = models.IntegerField(default=0)
+    as_of = models.DateTimeField(default=timezone.now)
+
+    COUNTER_FIELDS = [
+        'total_properties', 'total_inquiries', 'available_properties', 'for_sale',
+        'for_rent', 'total_users', 'verified_agencies', 'total_reviews',
+        'completed_transactions',
+    ]
+
+    class Meta:
+        verbose_name_plural = "Platform stats"
+
+    def __str__(self):
+        return f"Platform stats as of {self.as_of:%Y-%m-%d %H:%M:%S}"
+
+    @staticmethod
+    def compute():
+        """Recount everything: one conditional aggregate per table"""
+        available = Q(status='available')
+        counts = Property.objects.order_by().aggregate(
+            total_properties=Count('pk'),
+            available_properties=Count('pk', filter=available),
+            for_sale=Count('pk', filter=available & Q(listing_type='sale')),
+            for_rent=Count('pk', filter=available & Q(listing_type='rent')),
+        )
+        counts['total_inquiries'] = Inquiry.objects.order_by().count()
+        counts['total_users'] = UserProfile.objects.order_by().count()
+        counts['verified_agencies'] = Agency.objects.filter(verification_status='verified').order_by().count()
+        counts['total_reviews'] = Review.objects.order_by().count()
+        counts['completed_transactions'] = Transaction.objects.filter(status='completed').order_by().count()
+        return counts
+
+    @classmethod
+    def refresh(cls):
+        stats, _ = cls.objects.update_or_create(
+            pk=cls.SINGLETON_ID, defaults=dict(cls.compute(), as_of=timezone.now())
+        )
+        return stats
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=cls.SINGLETON_ID).first() or cls.refresh()
+
+    @classmethod
+    def apply(cls, **deltas):
+        """
+        Add deltas to the snapshot once the current transaction commits. The
+        UPDATE runs on its own, so writers never hold the single row's lock
+        until their commit; deltas of a rolled back write are never applied.
+        A failed update only leaves the counters stale until the next
+        ``refresh_platform_stats``.
+        """
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if deltas:
+            transaction.on_commit(lambda: cls._add(deltas), robust=True)
+
+    @classmethod
+    def _add(cls, deltas):
+        """Atomically add ``deltas``; builds the snapshot from scratch if it doesn't exist yet"""
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(
+            as_of=timezone.now(), **{name: F(name) + delta for name, delta in deltas.items()}
+        )
+        if not updated:
+            cls.refresh()
+
+
+class RequestProfile(models.Model):
+    """A profiled API request; the profile itself lives in PROFILING_DIR (see profiling.py)"""
+    TRIGGER_CHOICES = [
+        ('header', 'Staff header'),
+        ('sample', 'Random sample'),
+        ('view', 'View allowlist'),
+    ]
+
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view = models.CharField(max_length=200)
+    status_code = models.PositiveSmallIntegerField()
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    engine = models.CharField(max_length=20)
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    sql_ms = models.FloatField()
+    file_name = models.CharField(max_length=200)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['view', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+class Task(models.Model):
+    """A queued background job; see taskqueue.py"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_at', 'id']
+        indexes = [
+            # Claiming scans ready rows in run_at order
+            models.Index(fields=['status', 'run_at', 'id']),
+            models.Index(fields=['locked_by']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
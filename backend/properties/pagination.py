@@ -0,0 +1,346 @@
+import asyncio
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        ``paginate_queryset`` on the async ORM. Unless the last page is asked
+        for, the count and the page rows are fetched concurrently.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        page_number = request.query_params.get(self.page_query_param) or 1
+        if page_number in self.last_page_strings:
+            paginator.count = await queryset.acount()
+            page_number = paginator.num_pages
+            rows = None
+        else:
+            try:
+                bottom = (max(int(page_number), 1) - 1) * page_size
+            except (TypeError, ValueError):
+                bottom = 0
+            rows, paginator.count = await asyncio.gather(
+                _alist(queryset[bottom:bottom + page_size]), queryset.acount()
+            )
+        try:
+            page_number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        if rows is None:
+            bottom = (page_number - 1) * page_size
+            rows = await _alist(queryset[bottom:bottom + page_size])
+
+        self.page = paginator._get_page(rows, page_number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return rows
+
+
+async def _alist(queryset):
+    return [row async for row in queryset]
+
+
+def _encode_value(value):
+    # isoformat keeps microseconds, which the keyset comparison needs to be exact
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over ``(ordering field, id)``.
+
+    Each page is a range scan that starts after the last row of the previous
+    one, so deep pages cost the same as the first. The ordering field is taken
+    from ``?ordering=`` when it is one of the view's ``ordering_fields``;
+    other orderings are rejected (see ``get_ordering``). ``count`` is only
+    computed when the client sends ``?count=true``.
+    """
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    count_query_param = 'count'
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self._page_queryset(queryset, request, view)
+        self.count = queryset.count() if self._wants_count(request) else None
+        return self._set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` on the async ORM, counting alongside the page query"""
+        page_queryset = self._page_queryset(queryset, request, view)
+        if self._wants_count(request):
+            rows, self.count = await asyncio.gather(_alist(page_queryset), queryset.acount())
+        else:
+            rows, self.count = await _alist(page_queryset), None
+        return self._set_page(rows)
+
+    def _wants_count(self, request):
+        return request.query_params.get(self.count_query_param) in ('1', 'true')
+
+    def _page_queryset(self, queryset, request, view):
+        """Decode the cursor and build the query for the page plus one look-ahead row"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.field_name = self.ordering.lstrip('-')
+        self.field = queryset.model._meta.get_field(self.field_name)
+        self.pk_field = queryset.model._meta.pk
+        cursor = self.decode_cursor(request)
+
+        self.reverse = bool(cursor and cursor.get('r'))
+        self.after_cursor = cursor is not None
+        descending = self.ordering.startswith('-') != self.reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field_name}', f'{prefix}pk')
+        if cursor:
+            queryset = queryset.filter(self._after(cursor['v'], cursor['id'], descending))
+        return queryset[:self.page_size + 1]
+
+    def _set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.after_cursor
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        """
+        The one field pages are ordered by: ``?ordering=``, else the
+        queryset's leading ordering. A cursor cannot carry an ordering on
+        several fields, on a field outside the view's ``ordering_fields``, or
+        on an annotation (``?near=`` distance, search relevance), so those are
+        a 400 rather than being swapped for the default.
+        """
+        allowed = {
+            field.lstrip('-') for field in getattr(view, 'ordering_fields', None) or ()
+        }
+        allowed.add(self.default_ordering.lstrip('-'))
+        param = request.query_params.get(self.ordering_param)
+        if param is not None:
+            terms = [term.strip() for term in param.split(',') if term.strip()]
+        else:
+            terms = list(queryset.query.order_by[:1])
+        if not terms:
+            return self.default_ordering
+        if len(terms) == 1 and isinstance(terms[0], str) and terms[0].lstrip('-') in allowed:
+            return terms[0]
+        raise ValidationError({self.ordering_param: (
+            f'Cursor pages can only be ordered by one of {", ".join(sorted(allowed))}. '
+            'Use page numbers for other orderings.'
+        )})
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            cursor = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            if cursor['o'] != self.ordering:
+                raise ValueError
+            cursor['v'] = self.field.to_python(cursor['v'])
+            cursor['id'] = self.pk_field.to_python(cursor['id'])
+            return cursor
+        except (TypeError, ValueError, KeyError, DjangoValidationError, binascii.Error, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        if isinstance(row, dict):
+            # A values() page (see properties.cards)
+            value, pk = row[self.field.attname], row[self.pk_field.attname]
+        else:
+            value, pk = getattr(row, self.field.attname), row.pk
+        cursor = {'o': self.ordering, 'v': _encode_value(value), 'id': str(pk)}
+        if reverse:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('ascii'))
+        return encoded.decode('ascii').rstrip('=')
+
+    def _link(self, row, reverse):
+        url = replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(row, reverse))
+        return remove_query_param(url, 'page')
+
+    def _after(self, value, pk, descending):
+        op = 'lt' if descending else 'gt'
+        return Q(**{f'{self.field_name}__{op}': value}) | Q(**{self.field_name: value, f'pk__{op}': pk})
+
+
+class ListPagination(BasePagination):
+    """
+    Page-number pagination by default; keyset pagination when the request
+    carries ``?cursor=`` (send it empty to fetch the first page).
+    """
+    page_number_class = StandardResultsSetPagination
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self._paginator_for(queryset, request)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.paginator = self._paginator_for(queryset, request)
+        return await self.paginator.apaginate_queryset(queryset, request, view)
+
+    def _paginator_for(self, queryset, request):
+        use_keyset = (
+            self.keyset_class.cursor_query_param in request.query_params
+            and not queryset.query.is_sliced
+        )
+        return self.keyset_class() if use_keyset else self.page_number_class()
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number_class().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return self.page_number_class().get_schema_operation_parameters(view)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    @property
+    def display_page_controls(self):
+        paginator = getattr(self, 'paginator', None)
+        return getattr(paginator, 'display_page_controls', False)
+
+
+class MergedQuerySet:
+    """
+    The UNION of ``queryset`` narrowed by each of ``conditions``, shaped for
+    the paginators above (ordering, filtering, bounded slices and ``count``).
+
+    A slice is one UNION query whose branches are each ordered and limited to
+    the slice's end. With an index per condition, every branch is a short
+    range scan and the database merges at most ``stop * len(conditions)``
+    rows, however many match in total. Rows matching more than one condition
+    appear once. ``annotate`` adds columns to the rows fetched, not to the
+    scans that pick them.
+    """
+    ordered = True
+
+    def __init__(self, queryset, conditions, ordering=None, annotations=None):
+        self.queryset = queryset
+        self.conditions = list(conditions)
+        ordering = ordering or queryset.query.order_by or queryset.model._meta.ordering
+        self.ordering = tuple(ordering)
+        self.annotations = annotations or {}
+        self.model = queryset.model
+        # ListPagination checks query.is_sliced
+        self.query = queryset.query
+
+    def _clone(self, **changes):
+        state = {'queryset': self.queryset, 'conditions': self.conditions,
+                 'ordering': self.ordering, 'annotations': self.annotations}
+        return MergedQuerySet(**dict(state, **changes))
+
+    def order_by(self, *fields):
+        return self._clone(ordering=fields)
+
+    def filter(self, *args, **kwargs):
+        return self._clone(queryset=self.queryset.filter(*args, **kwargs))
+
+    def annotate(self, **annotations):
+        return self._clone(annotations=dict(self.annotations, **annotations))
+
+    def count(self):
+        first, *rest = (self.queryset.filter(condition).order_by().values('pk') for condition in self.conditions)
+        return first.union(*rest).count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.stop is None or key.step is not None:
+            raise TypeError('MergedQuerySet only supports slices with an end')
+        return list(self._union(limit=key.stop).order_by(*self.ordering)[key])
+
+    def __iter__(self):
+        return iter(self._union().order_by(*self.ordering))
+
+    def _branch(self, condition, limit):
+        branch = self.queryset.filter(condition)
+        if limit is None:
+            return branch.annotate(**self.annotations).order_by()
+        if connections[self.queryset.db].features.supports_slicing_ordering_in_compound:
+            return branch.annotate(**self.annotations).order_by(*self.ordering)[:limit]
+        # SQLite rejects LIMIT inside UNION branches but not inside IN (...)
+        ids = branch.order_by(*self.ordering).values('pk')[:limit]
+        return self.model._default_manager.filter(pk__in=ids).annotate(**self.annotations).order_by()
+
+    def _union(self, limit=None):
+        first, *rest = (self._branch(condition, limit) for condition in self.conditions)
+        return first.union(*rest)
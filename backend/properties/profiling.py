@@ -0,0 +1,232 @@
+"""
+On-demand request profiling.
+
+ProfilingMiddleware profiles a request when one of these applies:
+
+- a staff user sends the PROFILING_HEADER header (``X-Profile: 1``);
+- the resolved view is listed in PROFILING_VIEWS (labels as in metrics.py,
+  e.g. ``PropertyViewSet.search``);
+- the request is picked at random with probability PROFILING_SAMPLE_RATE.
+
+The profile goes to PROFILING_DIR, which keeps only the newest
+PROFILING_MAX_FILES files. A RequestProfile row records the path, the view,
+the timing and the query count, so the admin can list profiles and show their
+hot spots. The default engine is cProfile. Set PROFILING_ENGINE to
+'pyinstrument' to use the sampling profiler when it is installed.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import time
+import uuid
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from .metrics import QueryRecorder, view_label
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+logger = logging.getLogger(__name__)
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', Path(settings.BASE_DIR) / 'profiles'))
+
+
+class CProfileEngine:
+    name = 'cprofile'
+    suffix = '.prof'
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def save(self, path):
+        self.profiler.dump_stats(path)
+
+
+class PyinstrumentEngine:
+    name = 'pyinstrument'
+    suffix = '.txt'
+
+    def __init__(self):
+        self.profiler = pyinstrument.Profiler(interval=getattr(settings, 'PROFILING_INTERVAL', 0.001))
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def save(self, path):
+        Path(path).write_text(self.profiler.output_text(unicode=True, show_all=False), encoding='utf-8')
+
+
+def make_engine():
+    if getattr(settings, 'PROFILING_ENGINE', 'cprofile') == 'pyinstrument':
+        if pyinstrument is not None:
+            return PyinstrumentEngine()
+        logger.warning('PROFILING_ENGINE is pyinstrument but it is not installed; using cProfile')
+    return CProfileEngine()
+
+
+def profile_summary(profile, limit=40):
+    """Text report of a stored profile: top functions by cumulative time for cProfile dumps"""
+    path = profile_dir() / profile.file_name
+    if not path.exists():
+        return 'Profile file has been rotated out.'
+    if path.suffix != '.prof':
+        return path.read_text(encoding='utf-8')
+    stream = io.StringIO()
+    stats = pstats.Stats(str(path), stream=stream)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+def rotate(directory, keep):
+    """Delete all but the newest ``keep`` profile files, and their RequestProfile rows"""
+    from .models import RequestProfile
+
+    files = sorted(directory.iterdir(), key=lambda path: path.stat().st_mtime, reverse=True)
+    stale = [path for path in files[keep:] if path.is_file()]
+    for path in stale:
+        path.unlink(missing_ok=True)
+    if stale:
+        RequestProfile.objects.filter(file_name__in=[path.name for path in stale]).delete()
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.header = 'HTTP_' + getattr(settings, 'PROFILING_HEADER', 'X-Profile').upper().replace('-', '_')
+        self.views = set(getattr(settings, 'PROFILING_VIEWS', ()))
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        trigger, user = self.trigger_for(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        engine = make_engine()
+        recorder = QueryRecorder(slow_threshold=None)
+        started = time.perf_counter()
+        with recorder.instrument():
+            engine.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                engine.stop()
+        duration = time.perf_counter() - started
+
+        try:
+            profile = self.save(request, response, engine, recorder, trigger, user, duration)
+        except Exception:
+            logger.exception('Saving the profile of %s failed', request.path)
+        else:
+            response['X-Profile-Id'] = str(profile.pk)
+        return response
+
+    async def __acall__(self, request):
+        """
+        The profile covers the event loop thread: time spent in the async
+        ORM's worker thread shows up as awaits, but its queries are counted.
+        """
+        if request.META.get(self.header):
+            # Authenticating the staff user may query the database
+            trigger, user = await sync_to_async(self.trigger_for)(request)
+        else:
+            trigger, user = self.trigger_for(request)
+        if trigger is None:
+            return await self.get_response(request)
+
+        engine = make_engine()
+        recorder = QueryRecorder(slow_threshold=None)
+        started = time.perf_counter()
+        instrumented = await sync_to_async(recorder.instrument)()
+        engine.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            engine.stop()
+            await sync_to_async(instrumented.close)()
+        duration = time.perf_counter() - started
+
+        try:
+            profile = await sync_to_async(self.save)(request, response, engine, recorder, trigger, user, duration)
+        except Exception:
+            logger.exception('Saving the profile of %s failed', request.path)
+        else:
+            response['X-Profile-Id'] = str(profile.pk)
+        return response
+
+    def trigger_for(self, request):
+        if request.META.get(self.header):
+            from .authentication import staff_user
+            user = staff_user(request)
+            if user is not None:
+                return 'header', user
+        if self.views and self._view(request) in self.views:
+            return 'view', None
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample', None
+        return None, None
+
+    def _view(self, request):
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        request.resolver_match = match
+        return view_label(request, match.func)
+
+    def save(self, request, response, engine, recorder, trigger, user, duration):
+        from .models import RequestProfile
+
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        match = getattr(request, 'resolver_match', None)
+        view = view_label(request, match.func) if match is not None else 'unresolved'
+        file_name = f'{timezone.now():%Y%m%dT%H%M%S}-{view.replace(".", "-")}-{uuid.uuid4().hex[:8]}{engine.suffix}'
+        engine.save(os.fspath(directory / file_name))
+
+        if user is None:
+            request_user = getattr(request, 'user', None)
+            user = request_user if request_user is not None and request_user.is_authenticated else None
+        profile = RequestProfile.objects.create(
+            method=request.method,
+            path=request.get_full_path()[:500],
+            view=view,
+            status_code=response.status_code,
+            trigger=trigger,
+            engine=engine.name,
+            duration_ms=duration * 1000,
+            query_count=recorder.queries,
+            sql_ms=recorder.sql_seconds * 1000,
+            file_name=file_name,
+            user=user,
+        )
+        rotate(directory, getattr(settings, 'PROFILING_MAX_FILES', 200))
+        return profile
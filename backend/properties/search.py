@@ -0,0 +1,248 @@
+"""
+Full-text search over property listings.
+
+Each backend keeps a side index in sync with ``Property`` (see signals.py) and
+narrows a queryset to ranked matches. The queryset gains a ``search_rank``
+column where higher means more relevant, so callers can order by
+``-search_rank`` regardless of the database in use.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Value, FloatField
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+from .models import Property
+
+SQLITE_FTS_TABLE = 'properties_property_fts'
+POSTGRES_SEARCH_TABLE = 'properties_property_search'
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    """Split free text into lowercase word tokens, dropping FTS operators"""
+    return _TERM_RE.findall(query.lower())
+
+
+def _index_values(obj):
+    return [obj.title, obj.description, obj.location, obj.city, obj.state]
+
+
+class SearchBackend:
+    """Base class for property full-text search backends"""
+
+    def index(self, property_obj):
+        """Add or refresh a single listing in the index"""
+
+    def index_many(self, property_objs):
+        """Add or refresh a batch of listings, e.g. after ``bulk_create``"""
+        for property_obj in property_objs:
+            self.index(property_obj)
+
+    def remove(self, property_id):
+        """Drop a listing from the index"""
+
+    def rebuild(self):
+        """Re-index every listing; returns the number of rows indexed"""
+        return 0
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+
+class BasicSearchBackend(SearchBackend):
+    """Unindexed ``icontains`` fallback for databases without full-text support"""
+
+    def search(self, queryset, query):
+        for term in search_terms(query):
+            queryset = queryset.filter(
+                Q(title__icontains=term) |
+                Q(description__icontains=term) |
+                Q(location__icontains=term) |
+                Q(city__icontains=term) |
+                Q(state__icontains=term)
+            )
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """FTS5 virtual table keyed by a stable integer derived from the listing UUID"""
+
+    table = SQLITE_FTS_TABLE
+    # bm25 column weights: property_id, title, description, location, city, state
+    weights = (0.0, 10.0, 1.0, 4.0, 2.0, 2.0)
+
+    @staticmethod
+    def rowid(property_id):
+        # The low 62 bits of a uuid4 are random; FTS5 rowids must fit in a signed int64
+        return property_id.int & ((1 << 62) - 1)
+
+    def _row(self, property_obj):
+        property_id = Property._meta.pk.get_db_prep_value(property_obj.pk, connection)
+        return [self.rowid(property_obj.pk), property_id] + _index_values(property_obj)
+
+    def index(self, property_obj):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [self.rowid(property_obj.pk)])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, property_id, title, description, location, city, state) '
+                'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                self._row(property_obj),
+            )
+
+    def index_many(self, property_objs):
+        rows = [self._row(obj) for obj in property_objs]
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [row[:1] for row in rows])
+            self._insert_many(cursor, rows)
+
+    def remove(self, property_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [self.rowid(property_id)])
+
+    def rebuild(self, chunk_size=2000):
+        fields = ['pk', 'title', 'description', 'location', 'city', 'state']
+        indexed = 0
+        batch = []
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            for obj in Property.objects.only(*fields).order_by().iterator(chunk_size=chunk_size):
+                batch.append(self._row(obj))
+                if len(batch) >= chunk_size:
+                    indexed += self._insert_many(cursor, batch)
+                    batch = []
+            indexed += self._insert_many(cursor, batch)
+        return indexed
+
+    def _insert_many(self, cursor, rows):
+        if rows:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, property_id, title, description, location, city, state) '
+                'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                rows,
+            )
+        return len(rows)
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        # Every term must match, and the last one may be a prefix of a longer word
+        match = ' '.join(f'"{term}"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+        weights = ', '.join(str(w) for w in self.weights)
+        return queryset.extra(
+            tables=[self.table],
+            where=[
+                f'{self.table}.property_id = {Property._meta.db_table}.id',
+                f'{self.table} MATCH %s',
+            ],
+            params=[match],
+            select={'search_rank': f'-bm25({self.table}, {weights})'},
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Weighted ``tsvector`` documents in a side table with a GIN index"""
+
+    table = POSTGRES_SEARCH_TABLE
+
+    @property
+    def config(self):
+        return getattr(settings, 'PROPERTY_SEARCH_CONFIG', 'english')
+
+    def _document_sql(self, prefix=''):
+        columns = [('title', 'A'), ('location', 'B'), ('city', 'B'), ('state', 'C'), ('description', 'D')]
+        return ' || '.join(
+            f"setweight(to_tsvector(%s::regconfig, coalesce({prefix}{column}, '')), '{weight}')"
+            for column, weight in columns
+        ), [self.config] * len(columns)
+
+    def index(self, property_obj):
+        self.index_many([property_obj])
+
+    def index_many(self, property_objs):
+        document, params = self._document_sql(prefix='p.')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.table} (property_id, document) '
+                f'SELECT p.id, {document} FROM {Property._meta.db_table} p WHERE p.id = ANY(%s) '
+                'ON CONFLICT (property_id) DO UPDATE SET document = EXCLUDED.document',
+                params + [[obj.pk for obj in property_objs]],
+            )
+
+    def remove(self, property_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE property_id = %s', [property_id])
+
+    def rebuild(self):
+        document, params = self._document_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (property_id, document) '
+                f'SELECT id, {document} FROM {Property._meta.db_table}',
+                params,
+            )
+            return cursor.rowcount
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        tsquery = ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+        return queryset.extra(
+            tables=[self.table],
+            where=[
+                f'{self.table}.property_id = {Property._meta.db_table}.id',
+                f'{self.table}.document @@ to_tsquery(%s::regconfig, %s)',
+            ],
+            params=[self.config, tsquery],
+            select={'search_rank': f'ts_rank({self.table}.document, to_tsquery(%s::regconfig, %s))'},
+            select_params=[self.config, tsquery],
+        )
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTS5Backend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """Backend named by PROPERTY_SEARCH_BACKEND, else the one for the current database"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'PROPERTY_SEARCH_BACKEND', '')
+        backend_class = import_string(path) if path else VENDOR_BACKENDS.get(connection.vendor, BasicSearchBackend)
+        _backend = backend_class()
+    return _backend
+
+
+class PropertySearchFilter(filters.SearchFilter):
+    """DRF ``?search=`` backed by the full-text index instead of ``icontains``"""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return get_search_backend().search(queryset, ' '.join(terms))
+
+
+class RelevanceOrderingFilter(filters.OrderingFilter):
+    """Orders search results by relevance unless the client asks for another ordering"""
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if not params and _has_search_rank(queryset):
+            return ['-search_rank'] + list(self.get_default_ordering(view) or [])
+        return super().get_ordering(request, queryset, view)
+
+
+def _has_search_rank(queryset):
+    return 'search_rank' in queryset.query.extra_select or 'search_rank' in queryset.query.annotations
@@ -4,6 +4,14 @@ from .models import (
     Agency, UserProfile, Property, Inquiry, 
     Favorite, Review, Transaction
 )
+from .cards import ValuesListSerializer
+from .fieldsets import SparseFieldsetMixin, wanted
+from .media import featured_variants, featured_variants_of
+
+# Reviews embedded in PropertyDetailSerializer, newest first
+RECENT_REVIEWS = 5
+# Image derivatives embedded in PropertyListSerializer (see properties.imaging.VARIANTS)
+CARD_VARIANTS = ('thumb', 'card')
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -30,8 +38,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class AgencySerializer(serializers.ModelSerializer):
-    agents_count = serializers.SerializerMethodField()
-    properties_count = serializers.SerializerMethodField()
+    """``agents_count`` and ``properties_count`` are denormalized columns on Agency"""
 
     class Meta:
         model = Agency
@@ -41,41 +48,107 @@ class AgencySerializer(serializers.ModelSerializer):
             'properties_count', 'created_at', 'updated_at'
         ]
 
-    def get_agents_count(self, obj):
-        return obj.agents.count()
 
-    def get_properties_count(self, obj):
-        return obj.properties.count()
+def _favorites_count(obj):
+    """Prefer the ``favorites_count`` annotation from PropertyQuerySet.with_favorites_count"""
+    count = getattr(obj, 'favorites_count', None)
+    if count is None:
+        return obj.favorited_by.count()
+    return count
+
+
+def _full_name(first_name, last_name):
+    """User.get_full_name from values() columns; None when an optional relation is empty"""
+    if first_name is None:
+        return None
+    return f'{first_name} {last_name}'.strip()
 
 
-class PropertyListSerializer(serializers.ModelSerializer):
+def _card_variants(featured_image_url, image_urls, media):
+    return featured_variants_of(featured_image_url, image_urls, media, CARD_VARIANTS)
+
+
+class PropertyListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Simplified serializer for property listings"""
     seller_name = serializers.CharField(source='seller.get_full_name', read_only=True)
     agent_name = serializers.CharField(source='agent.get_full_name', read_only=True, allow_null=True)
     agency_name = serializers.CharField(source='agency.name', read_only=True, allow_null=True)
     favorites_count = serializers.SerializerMethodField()
+    featured_image = serializers.SerializerMethodField()
 
     class Meta:
         model = Property
         fields = [
             'id', 'title', 'property_type', 'listing_type', 'price',
             'location', 'city', 'bedrooms', 'bathrooms', 'total_area',
-            'featured_image_url', 'seller_name', 'agent_name', 'agency_name',
+            'featured_image_url', 'featured_image', 'seller_name', 'agent_name', 'agency_name',
             'views_count', 'favorites_count', 'status', 'created_at'
         ]
+        list_serializer_class = ValuesListSerializer
+
+    expandable_fields = {'seller': UserSerializer, 'agent': UserSerializer, 'agency': AgencySerializer}
+    extra_fields = ('distance_km', 'is_favorite')
+    field_columns = {
+        'featured_image': ('featured_image_url', 'image_urls', 'media'),
+        'seller_name': ('seller__first_name', 'seller__last_name'),
+        'agent_name': ('agent__first_name', 'agent__last_name'),
+        'agency_name': ('agency__name',),
+        'seller': ('seller__email', 'seller__first_name', 'seller__last_name', 'seller__profile'),
+        'agent': ('agent__email', 'agent__first_name', 'agent__last_name', 'agent__profile'),
+        'agency': ('agency',),
+        # Annotations (with_favorites_count, GeoFilter) and serializer context
+        'favorites_count': (),
+        'distance_km': (),
+        'is_favorite': (),
+    }
+    # How the keys that are not plain columns render their field_columns from values() rows (see properties.cards)
+    value_fields = {
+        'seller_name': _full_name,
+        'agent_name': _full_name,
+        'agency_name': None,
+        'favorites_count': None,
+        'featured_image': _card_variants,
+    }
 
     def get_favorites_count(self, obj):
-        return obj.favorited_by.count()
-
-
-class PropertyDetailSerializer(serializers.ModelSerializer):
-    """Detailed serializer for property details"""
+        return _favorites_count(obj)
+
+    def get_featured_image(self, obj):
+        # Card-sized derivatives; null until properties.media has built them
+        return featured_variants(obj, CARD_VARIANTS)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Present when the list was filtered with ?near= (see properties.geo.GeoFilter)
+        distance = getattr(instance, 'distance_km', None)
+        if distance is not None and wanted(self.fieldset, 'distance_km'):
+            data['distance_km'] = round(distance, 3)
+        # Signed-in clients get their heart state (see properties.favorites.favorite_ids_for)
+        favorite_ids = self.context.get('favorite_ids')
+        if favorite_ids is not None and wanted(self.fieldset, 'is_favorite'):
+            data['is_favorite'] = instance.pk in favorite_ids
+        return data
+
+
+class PropertyClusterSerializer(serializers.Serializer):
+    """Aggregated map cell produced by PropertyViewSet.clusters"""
+    key = serializers.CharField(source='cell')
+    count = serializers.IntegerField()
+    latitude = serializers.FloatField()
+    longitude = serializers.FloatField()
+    min_price = serializers.DecimalField(max_digits=12, decimal_places=2)
+    max_price = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class PropertyDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Detailed serializer for property details; PropertyViewSet.retrieve trims ?fields= from the cached document"""
     seller = UserSerializer(read_only=True)
     agent = UserSerializer(read_only=True)
     agency = AgencySerializer(read_only=True)
     inquiries_count = serializers.SerializerMethodField()
     favorites_count = serializers.SerializerMethodField()
     reviews = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Property
@@ -85,21 +158,33 @@ class PropertyDetailSerializer(serializers.ModelSerializer):
             'location', 'city', 'state', 'zip_code', 'country',
             'latitude', 'longitude', 'bedrooms', 'bathrooms', 'total_area',
             'garage_spaces', 'year_built', 'furnishing', 'property_features',
-            'utilities', 'featured_image_url', 'image_urls', 'status',
+            'utilities', 'featured_image_url', 'image_urls', 'images', 'status',
             'seller', 'agent', 'agency', 'views_count', 'favorites_count',
             'inquiries_count', 'reviews', 'created_at', 'updated_at', 'listed_at'
         ]
 
     def get_inquiries_count(self, obj):
-        return obj.inquiries.filter(status='new').count()
+        count = getattr(obj, 'new_inquiries_count', None)
+        if count is None:
+            return obj.inquiries.filter(status='new').count()
+        return count
 
     def get_favorites_count(self, obj):
-        return obj.favorited_by.count()
+        return _favorites_count(obj)
 
     def get_reviews(self, obj):
-        reviews = obj.reviews.all()[:5]
+        reviews = getattr(obj, 'recent_reviews', None)
+        if reviews is None:
+            reviews = obj.reviews.select_related('reviewer')[:RECENT_REVIEWS]
         return ReviewSerializer(reviews, many=True).data
 
+    def get_images(self, obj):
+        """Derivatives of every listing image, in image_urls order with the featured image first"""
+        return [
+            {'source': image['source'], 'width': image['width'], 'height': image['height'], 'variants': image['variants']}
+            for image in (obj.media or {}).get('images', ()) if 'variants' in image
+        ]
+
 
 class PropertyCreateUpdateSerializer(serializers.ModelSerializer):
     """Serializer for creating/updating properties"""
@@ -116,7 +201,8 @@ class PropertyCreateUpdateSerializer(serializers.ModelSerializer):
 
 
 class InquiryListSerializer(serializers.ModelSerializer):
-    property_title = serializers.CharField(source='property.title', read_only=True)
+    # Annotated by InquiryViewSet.get_queryset, so rows need no Property join beyond the title
+    property_title = serializers.CharField(read_only=True)
 
     class Meta:
         model = Inquiry
@@ -150,6 +236,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Favorite
         fields = ['id', 'property', 'created_at']
+        list_serializer_class = ValuesListSerializer
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -0,0 +1,305 @@
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .cache import LIST_GENERATION, agency_generation, detail_generation, response_cache, user_generation
+from .favorites import favorite_cache
+from .models import (
+    Agency, UserProfile, Property, Inquiry,
+    Favorite, Review, Transaction, PlatformStats
+)
+from .search import get_search_backend
+from .similarity import similarity_index
+from .taskqueue import enqueue
+from .tasks import build_property_media
+
+SEARCH_INDEXED_FIELDS = {'title', 'description', 'location', 'city', 'state'}
+# User columns embedded in property detail documents (UserSerializer)
+DOCUMENT_USER_FIELDS = {'email', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Property)
+def index_property(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the full-text index in step with listing edits"""
+    if raw:
+        return
+    if update_fields is not None and not SEARCH_INDEXED_FIELDS.intersection(update_fields):
+        return
+    get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Property)
+def unindex_property(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Property)
+def refresh_similarity_vector(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: similarity_index.upsert(instance))
+
+
+@receiver(post_delete, sender=Property)
+def drop_similarity_vector(sender, instance, **kwargs):
+    transaction.on_commit(lambda: similarity_index.remove(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Property)
+def invalidate_property_responses(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    response_cache.bump_on_commit(LIST_GENERATION, detail_generation(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+def invalidate_favorite_responses(sender, instance, raw=False, **kwargs):
+    # favorites_count appears on list cards as well as the detail page
+    if raw:
+        return
+    response_cache.bump_on_commit(LIST_GENERATION, detail_generation(instance.property_id))
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+def forget_favorite_set(sender, instance, raw=False, **kwargs):
+    # toggle_favorite writes without signals and patches the set itself
+    if not raw:
+        user_id = instance.user_id
+        transaction.on_commit(lambda: favorite_cache.discard(user_id))
+
+
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=Inquiry)
+def invalidate_detail_responses(sender, instance, raw=False, **kwargs):
+    if raw or instance.property_id is None:
+        return
+    response_cache.bump_on_commit(detail_generation(instance.property_id))
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_documents(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Logins save last_login alone and do not show up in any document
+    if raw or (update_fields is not None and not DOCUMENT_USER_FIELDS.intersection(update_fields)):
+        return
+    response_cache.bump_on_commit(user_generation(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_profile_documents(sender, instance, raw=False, **kwargs):
+    if not raw:
+        response_cache.bump_on_commit(user_generation(instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=Agency)
+def invalidate_agency_documents(sender, instance, raw=False, **kwargs):
+    if not raw:
+        response_cache.bump_on_commit(agency_generation(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def forget_profile_user(sender, instance, **kwargs):
+    user_cache.discard(instance.firebase_uid)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    user_cache.discard_where(lambda user: user is not None and user.pk == instance.pk)
+
+
+AGENCY_COUNTERS = {
+    UserProfile: 'agents_count',
+    Property: 'properties_count',
+}
+
+
+def _shift_agency_count(field, old_agency_id, new_agency_id):
+    if old_agency_id == new_agency_id:
+        return
+    if old_agency_id is not None:
+        Agency.objects.filter(pk=old_agency_id).update(**{field: F(field) - 1})
+    if new_agency_id is not None:
+        Agency.objects.filter(pk=new_agency_id).update(**{field: F(field) + 1})
+    # The counts are part of every detail document that embeds the agency
+    response_cache.bump_on_commit(*(
+        agency_generation(agency_id) for agency_id in (old_agency_id, new_agency_id) if agency_id is not None
+    ))
+
+
+def update_agency_counts(instance, created, before):
+    old_agency_id = None if created else before['agency_id']
+    _shift_agency_count(AGENCY_COUNTERS[type(instance)], old_agency_id, instance.agency_id)
+
+
+@receiver(post_delete)
+def update_agency_counts_on_delete(sender, instance, **kwargs):
+    if sender in AGENCY_COUNTERS:
+        _shift_agency_count(AGENCY_COUNTERS[sender], instance.agency_id, None)
+
+
+def _shift_inbox_counts(seller_id, received, new):
+    if seller_id is None or not (received or new):
+        return
+    UserProfile.objects.filter(user_id=seller_id).update(
+        inquiries_received_count=F('inquiries_received_count') + received,
+        new_inquiries_count=F('new_inquiries_count') + new,
+    )
+
+
+def update_inbox_counts(instance, created, before):
+    is_new = int(instance.status == 'new')
+    if created:
+        _shift_inbox_counts(instance.seller_id, 1, is_new)
+        return
+    was_new = int(before['status'] == 'new')
+    if before['seller_id'] != instance.seller_id:
+        _shift_inbox_counts(before['seller_id'], -1, -was_new)
+        _shift_inbox_counts(instance.seller_id, 1, is_new)
+    else:
+        _shift_inbox_counts(instance.seller_id, 0, is_new - was_new)
+
+
+def invalidate_previous_listing(instance, created, before):
+    # invalidate_detail_responses only sees the listing the inquiry is on now
+    if not created and before['property_id'] not in (None, instance.property_id):
+        response_cache.bump_on_commit(detail_generation(before['property_id']))
+
+
+@receiver(post_delete, sender=Inquiry)
+def update_inbox_counts_on_delete(sender, instance, **kwargs):
+    _shift_inbox_counts(instance.seller_id, -1, -int(instance.status == 'new'))
+
+
+def count_inbox_of_new_profile(instance, created, before):
+    # Inquiries reach the seller's User, which may have listings before it has a profile
+    if created:
+        UserProfile.recount([instance.user_id])
+        instance.refresh_from_db(fields=['inquiries_received_count', 'new_inquiries_count'])
+
+
+def move_inquiries_to_new_seller(instance, created, before):
+    if created or before['seller_id'] == instance.seller_id:
+        return
+    Inquiry.objects.filter(property=instance).update(seller_id=instance.seller_id)
+    UserProfile.recount([before['seller_id'], instance.seller_id])
+
+
+MEDIA_SOURCE_FIELDS = ('featured_image_url', 'image_urls')
+
+
+def queue_media_build(instance, created, before):
+    """Build image derivatives in the background when a listing's images change"""
+    if created:
+        changed = bool(instance.featured_image_url or instance.image_urls)
+    else:
+        changed = any(before[name] != getattr(instance, name) for name in MEDIA_SOURCE_FIELDS)
+    if changed:
+        enqueue(build_property_media, property_id=str(instance.pk))
+
+
+def _property_counters(status, listing_type):
+    available = status == 'available'
+    return {
+        'total_properties': 1,
+        'available_properties': int(available),
+        'for_sale': int(available and listing_type == 'sale'),
+        'for_rent': int(available and listing_type == 'rent'),
+    }
+
+
+def _property_stats(instance):
+    return _property_counters(instance.status, instance.listing_type)
+
+
+def _agency_stats(instance):
+    return {'verified_agencies': int(instance.verification_status == 'verified')}
+
+
+def _transaction_stats(instance):
+    return {'completed_transactions': int(instance.status == 'completed')}
+
+
+TRACKED_STATS = {
+    Property: _property_stats,
+    Agency: _agency_stats,
+    Transaction: _transaction_stats,
+}
+
+COUNTED_STATS = {
+    Inquiry: 'total_inquiries',
+    UserProfile: 'total_users',
+    Review: 'total_reviews',
+}
+
+
+def update_platform_stats(instance, created, before):
+    """Move the snapshot from the row's stored state to its saved state"""
+    counters = TRACKED_STATS[type(instance)]
+    new = counters(instance)
+    if created:
+        PlatformStats.apply(**new)
+    else:
+        old = counters(SimpleNamespace(**before))
+        PlatformStats.apply(**{name: new[name] - old[name] for name in new})
+
+
+# What runs after a tracked model is saved, in order. Each handler gets
+# (instance, created, before), where ``before`` holds the stored values of
+# the model's tracked_fields as they were ahead of the save (None when created)
+TRACKED_SAVE_HANDLERS = {
+    Agency: [update_platform_stats],
+    UserProfile: [update_agency_counts, count_inbox_of_new_profile],
+    Property: [update_agency_counts, move_inquiries_to_new_seller, queue_media_build, update_platform_stats],
+    Inquiry: [update_inbox_counts, invalidate_previous_listing],
+    Transaction: [update_platform_stats],
+}
+
+
+@receiver(pre_save)
+def snapshot_tracked_fields(sender, instance, raw=False, **kwargs):
+    if raw or sender not in TRACKED_SAVE_HANDLERS:
+        return
+    instance._tracked_before = None if instance._state.adding else instance.tracked_snapshot()
+
+
+@receiver(post_save)
+def run_tracked_save_handlers(sender, instance, created=False, raw=False, **kwargs):
+    """
+    The handlers above, with the snapshot ``snapshot_tracked_fields`` took.
+    They only read it; it is moved forward here once they have all run.
+    """
+    if raw or sender not in TRACKED_SAVE_HANDLERS:
+        return
+    before = instance.__dict__.pop('_tracked_before', None)
+    if created or before is not None:
+        for handler in TRACKED_SAVE_HANDLERS[sender]:
+            handler(instance, created, before)
+    instance.remember_tracked_fields()
+
+
+@receiver(pre_delete)
+def load_tracked_fields(sender, instance, **kwargs):
+    """The delete handlers read tracked fields, which cannot be loaded once the row is gone"""
+    if sender in TRACKED_SAVE_HANDLERS:
+        deferred = instance.get_deferred_fields()
+        missing = [name for name in sender.tracked_fields if name in deferred]
+        if missing:
+            instance.refresh_from_db(fields=missing)
+
+
+@receiver(post_save)
+def update_platform_stats_on_save(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and created and sender in COUNTED_STATS:
+        PlatformStats.apply(**{COUNTED_STATS[sender]: 1})
+
+
+@receiver(post_delete)
+def update_platform_stats_on_delete(sender, instance, **kwargs):
+    if sender in TRACKED_STATS:
+        counters = TRACKED_STATS[sender](instance)
+        PlatformStats.apply(**{name: -value for name, value in counters.items()})
+    elif sender in COUNTED_STATS:
+        PlatformStats.apply(**{COUNTED_STATS[sender]: -1})
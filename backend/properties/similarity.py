@@ -0,0 +1,340 @@
+"""
+Vectorized similar-listing engine.
+
+Available listings are encoded into a float32 matrix: z-scored numeric columns
+(log price and area, bedrooms, bathrooms, year built, coordinates) and one-hot
+``property_features``/``utilities`` tags. Each column is pre-scaled by the
+square root of its weight, so a plain squared euclidean distance is the
+weighted score. Listing type is a hard filter. A different property type or
+city only adds a penalty, so sparse cities still fall back to the nearest
+listings elsewhere.
+
+Each process holds one index. The first lookup builds it. After that, Property
+signals update it in place, and every write bumps a generation shared through
+the response cache backend. A lookup that sees another process's bump (the
+importer, other workers), an index older than SIMILARITY_INDEX_MAX_AGE
+seconds, or too many removed rows rebuilds the index on a background thread.
+The rebuild also refits the scaling and tag vocabulary. Lookups keep using the
+current index until the new one is swapped in, and writes made during the
+build are replayed onto it.
+"""
+import math
+import threading
+import time
+import warnings
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .cache import response_cache
+from .models import Property
+
+NUMERIC_FIELDS = ['price', 'bedrooms', 'bathrooms', 'total_area', 'year_built', 'latitude', 'longitude']
+LOG_FIELDS = {'price', 'total_area'}
+NUMERIC_WEIGHTS = {
+    'price': 3.0, 'bedrooms': 1.5, 'bathrooms': 1.0, 'total_area': 1.0,
+    'year_built': 0.5, 'latitude': 1.5, 'longitude': 1.5,
+}
+TAG_WEIGHT = 0.25
+MAX_TAGS = 256
+PROPERTY_TYPE_PENALTY = 4.0
+CITY_PENALTY = 2.0
+
+INDEX_FIELDS = ['pk', 'listing_type', 'property_type', 'city'] + NUMERIC_FIELDS + ['property_features', 'utilities']
+GENERATION_KEY = 'similarity:generation'
+
+
+def _row_from_instance(obj):
+    return tuple(getattr(obj, name) for name in INDEX_FIELDS)
+
+
+def _tags(features, utilities):
+    return [f'f:{tag}' for tag in features or ()] + [f'u:{tag}' for tag in utilities or ()]
+
+
+def _numeric_columns(rows):
+    """(len(rows), len(NUMERIC_FIELDS)) floats, log-scaled where needed, NaN where missing"""
+    columns = np.array([row[4:4 + len(NUMERIC_FIELDS)] for row in rows], dtype=object)
+    columns = columns.reshape(len(rows), len(NUMERIC_FIELDS))
+    columns[columns == None] = math.nan  # noqa: E711 (elementwise)
+    columns = columns.astype(np.float64)
+    for j, name in enumerate(NUMERIC_FIELDS):
+        if name in LOG_FIELDS:
+            columns[:, j] = np.log1p(np.maximum(columns[:, j], 0.0))
+    return columns
+
+
+class _Index:
+    """One fitted index: listing vectors plus the scaling and tag vocabulary they were encoded with"""
+
+    def __init__(self, rows):
+        numeric = _numeric_columns(rows)
+        with warnings.catch_warnings():
+            # All-NaN columns (e.g. no listing has a year_built yet) fall back to 0/1 below
+            warnings.simplefilter('ignore', RuntimeWarning)
+            means = np.nanmean(numeric, axis=0) if len(rows) else np.zeros(len(NUMERIC_FIELDS))
+            stds = np.nanstd(numeric, axis=0) if len(rows) else np.ones(len(NUMERIC_FIELDS))
+        self.means = np.nan_to_num(means)
+        self.stds = np.where(np.nan_to_num(stds) > 0, np.nan_to_num(stds), 1.0)
+        self.scales = np.sqrt([NUMERIC_WEIGHTS[name] for name in NUMERIC_FIELDS])
+
+        row_tags = [_tags(row[-2], row[-1]) for row in rows]
+        tag_counts = Counter(tag for tags in row_tags for tag in set(tags))
+        self.tags = {tag: i for i, (tag, _) in enumerate(tag_counts.most_common(MAX_TAGS))}
+        self.dim = len(NUMERIC_FIELDS) + len(self.tags)
+
+        capacity = max(16, len(rows) * 2)
+        self.matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        self.sq_norms = np.zeros(capacity, dtype=np.float32)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.listing_type = np.zeros(capacity, dtype=np.int32)
+        self.property_type = np.zeros(capacity, dtype=np.int32)
+        self.city = np.zeros(capacity, dtype=np.int32)
+        self.codes = {}
+        self.ids = [row[0] for row in rows]
+        self.positions = {property_id: position for position, property_id in enumerate(self.ids)}
+        self.size = len(rows)
+        self.removed = 0
+
+        vectors = self.encode(rows, numeric, row_tags)
+        self.matrix[:self.size] = vectors
+        self.sq_norms[:self.size] = np.einsum('ij,ij->i', vectors, vectors)
+        self.active[:self.size] = True
+        for name, values in self.categories(rows).items():
+            getattr(self, name)[:self.size] = values
+
+    def encode(self, rows, numeric=None, row_tags=None):
+        if numeric is None:
+            numeric = _numeric_columns(rows)
+        if row_tags is None:
+            row_tags = [_tags(row[-2], row[-1]) for row in rows]
+        vectors = np.zeros((len(rows), self.dim), dtype=np.float32)
+        # Missing values sit at the mean, i.e. contribute nothing to the distance
+        vectors[:, :len(NUMERIC_FIELDS)] = np.nan_to_num((numeric - self.means) / self.stds) * self.scales
+        hits = [
+            (i, len(NUMERIC_FIELDS) + self.tags[tag])
+            for i, tags in enumerate(row_tags) for tag in tags if tag in self.tags
+        ]
+        if hits:
+            tag_rows, tag_columns = zip(*hits)
+            vectors[list(tag_rows), list(tag_columns)] = math.sqrt(TAG_WEIGHT)
+        return vectors
+
+    def categories(self, rows):
+        """The listing type, property type and (case-folded) city codes of ``rows``"""
+        return {
+            'listing_type': self.code_column('listing_type', (row[1] for row in rows), len(rows)),
+            'property_type': self.code_column('property_type', (row[2] for row in rows), len(rows)),
+            'city': self.code_column('city', ((row[3] or '').lower() for row in rows), len(rows)),
+        }
+
+    def code_column(self, kind, values, count):
+        codes = self.codes.setdefault(kind, {})
+        return np.fromiter((codes.setdefault(value, len(codes)) for value in values), np.int32, count)
+
+    def apply(self, property_id, row):
+        """Upsert ``row``, or remove ``property_id`` when ``row`` is None"""
+        position = self.positions.get(property_id)
+        if row is None:
+            if position is not None and self.active[position]:
+                self.active[position] = False
+                self.removed += 1
+            return
+        if position is None:
+            if self.size == len(self.matrix):
+                self.grow()
+            position = self.size
+            self.size += 1
+            self.ids.append(property_id)
+            self.positions[property_id] = position
+        elif not self.active[position]:
+            self.removed -= 1
+        vector = self.encode([row])[0]
+        self.matrix[position] = vector
+        self.sq_norms[position] = float(vector @ vector)
+        self.active[position] = True
+        for name, values in self.categories([row]).items():
+            getattr(self, name)[position] = values[0]
+
+    def grow(self):
+        capacity = len(self.matrix) * 2
+        for name in ('matrix', 'sq_norms', 'active', 'listing_type', 'property_type', 'city'):
+            current = getattr(self, name)
+            grown = np.zeros((capacity,) + current.shape[1:], dtype=current.dtype)
+            grown[:len(current)] = current
+            setattr(self, name, grown)
+
+    def nearest(self, rows, k):
+        n = self.size
+        if not rows or n == 0:
+            return [[] for _ in rows]
+        queries = self.encode(rows)
+        codes = {name: values[:, None] for name, values in self.categories(rows).items()}
+
+        distances = (
+            self.sq_norms[:n][None, :]
+            - 2.0 * (queries @ self.matrix[:n].T)
+            + np.einsum('ij,ij->i', queries, queries)[:, None]
+        )
+        distances += PROPERTY_TYPE_PENALTY * (self.property_type[:n][None, :] != codes['property_type'])
+        distances += CITY_PENALTY * (self.city[:n][None, :] != codes['city'])
+        excluded = ~self.active[:n][None, :] | (self.listing_type[:n][None, :] != codes['listing_type'])
+        for i, row in enumerate(rows):
+            position = self.positions.get(row[0])
+            if position is not None:
+                distances[i, position] = np.inf
+        distances[excluded] = np.inf
+
+        k = min(k, n)
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        results = []
+        for i in range(len(rows)):
+            candidates = nearest[i][np.argsort(distances[i, nearest[i]], kind='stable')]
+            results.append([self.ids[position] for position in candidates if np.isfinite(distances[i, position])])
+        return results
+
+
+class SimilarityIndex:
+    """
+    The process's index. ``background=False`` rebuilds stale indexes on the
+    calling thread instead of a worker thread.
+    """
+
+    def __init__(self, background=True):
+        self.background = background
+        self._lock = threading.Lock()  # guards the index, its generation and in-place writes
+        self._build_lock = threading.Lock()  # one build at a time
+        self._index = None
+        self._generation = 0
+        self._built_at = None
+        self._changes = None  # (property_id, row) writes made while a build runs
+        self._rebuilding = False
+
+    @property
+    def max_age(self):
+        return getattr(settings, 'SIMILARITY_INDEX_MAX_AGE', 3600)
+
+    @property
+    def is_built(self):
+        return self._index is not None
+
+    def shared_generation(self):
+        return response_cache.cache.get(GENERATION_KEY)
+
+    def bump_generation(self):
+        """Tell other processes the listings changed; returns the new generation"""
+        cache = response_cache.cache
+        try:
+            return cache.incr(GENERATION_KEY)
+        except ValueError:
+            if cache.add(GENERATION_KEY, 1, timeout=None):
+                return 1
+            return cache.incr(GENERATION_KEY)
+
+    def build(self):
+        """Fit a new index from the database and swap it in"""
+        with self._build_lock:
+            with self._lock:
+                self._changes = []
+            generation = self.shared_generation() or 0
+            try:
+                rows = list(Property.objects.filter(status='available').order_by().values_list(*INDEX_FIELDS))
+                index = _Index(rows)
+            except BaseException:
+                with self._lock:
+                    self._changes = None
+                raise
+            with self._lock:
+                # Writes committed after the rows were read would otherwise be lost
+                for property_id, row in self._changes:
+                    index.apply(property_id, row)
+                writes, self._changes = len(self._changes), None
+                self._index, self._generation, self._built_at = index, generation, time.monotonic()
+            if writes and self.shared_generation() == generation + writes:
+                # Every bump since the read was one of the replayed writes
+                with self._lock:
+                    if self._generation == generation:
+                        self._generation += writes
+
+    def reset(self):
+        """Forget the index here and in other processes, e.g. after bulk writes; the next lookup rebuilds it"""
+        with self._lock:
+            self._index = None
+            self._built_at = None
+        self.bump_generation()
+
+    def is_stale(self):
+        with self._lock:
+            index = self._index
+            if index is None:
+                return True
+            if time.monotonic() - self._built_at > self.max_age or index.removed > max(100, index.size // 4):
+                return True
+            known = self._generation
+        generation = self.shared_generation()
+        # A missing generation (evicted, cache cleared) carries no news; the age limit still applies
+        return generation is not None and generation != known
+
+    def ensure_fresh(self):
+        """Build the index if there is none; rebuild it in the background when stale"""
+        if self._index is None:
+            with self._build_lock:
+                pass  # wait for a build already under way
+            if self._index is None:
+                self.build()
+            return
+        if not self.is_stale():
+            return
+        if not self.background:
+            self.build()
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, name='similarity-index-build', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+    def upsert(self, obj):
+        """Refresh one listing in place; unavailable listings leave the index"""
+        self._write(obj.pk, _row_from_instance(obj) if obj.status == 'available' else None)
+
+    def remove(self, property_id):
+        self._write(property_id, None)
+
+    def _write(self, property_id, row):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((property_id, row))
+            if self._index is not None:
+                self._index.apply(property_id, row)
+            known = self._generation
+        generation = self.bump_generation()
+        with self._lock:
+            # Only our own bump since the last sync: this index already has the write
+            if generation == known + 1 and self._generation == known:
+                self._generation = generation
+
+    def similar(self, property_obj, k=5):
+        """Ids of the ``k`` listings closest to ``property_obj``, nearest first"""
+        return self.similar_many([property_obj], k)[0]
+
+    def similar_many(self, property_objs, k=5):
+        """Batched nearest-neighbour lookup, one result list per input listing"""
+        self.ensure_fresh()
+        rows = [_row_from_instance(obj) for obj in property_objs]
+        with self._lock:
+            if self._index is None:  # reset() since ensure_fresh
+                return [[] for _ in rows]
+            return self._index.nearest(rows, k)
+
+
+similarity_index = SimilarityIndex()
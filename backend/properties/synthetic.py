@@ -0,0 +1,203 @@
+"""
+Seeded synthetic data for benchmarks and query-budget tests.
+
+``generate(scale, seed)`` bulk-creates a small marketplace: BASE_COUNTS rows
+per model times ``scale``. The same seed always produces the same rows (apart
+from ids and timestamps, which the database assigns). Bulk writes skip
+signals, so derived data (geohashes, search index, agency counts, analytics
+snapshot) is filled in directly.
+"""
+import random
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .cache import LIST_GENERATION, response_cache
+from .geo import geohash_for
+from .models import (
+    Agency, UserProfile, Property, Inquiry,
+    Favorite, Review, Transaction, PlatformStats
+)
+from .search import get_search_backend
+from .similarity import similarity_index
+
+BASE_COUNTS = {
+    'agencies': 3,
+    'users': 30,
+    'properties': 100,
+    'inquiries': 200,
+    'favorites': 200,
+    'reviews': 100,
+    'transactions': 20,
+}
+
+# name, state, latitude, longitude
+CITIES = [
+    ('Nairobi', 'Nairobi', -1.2864, 36.8172),
+    ('Mombasa', 'Mombasa', -4.0435, 39.6682),
+    ('Kisumu', 'Kisumu', -0.0917, 34.7680),
+    ('Nakuru', 'Nakuru', -0.3031, 36.0800),
+    ('Eldoret', 'Uasin Gishu', 0.5143, 35.2698),
+]
+NEIGHBOURHOODS = ['Westlands', 'Kilimani', 'Karen', 'Nyali', 'Milimani', 'Runda', 'Lavington', 'Section 58']
+ADJECTIVES = ['Spacious', 'Modern', 'Cosy', 'Luxury', 'Sunny', 'Quiet', 'Renovated', 'Family']
+FEATURES = ['swimming_pool', 'gym', 'garden', 'balcony', 'borehole', 'backup_generator', 'cctv', 'lift']
+UTILITIES = ['water', 'electricity', 'gas', 'internet']
+
+
+class SyntheticData:
+    """The rows created by ``generate``, grouped by model"""
+
+    def __init__(self):
+        self.agencies = []
+        self.users = []
+        self.profiles = []
+        self.properties = []
+        self.inquiries = []
+        self.favorites = []
+        self.reviews = []
+        self.transactions = []
+
+    def counts(self):
+        return {name: len(rows) for name, rows in vars(self).items()}
+
+
+def generate(scale=1, seed=0):
+    rng = random.Random(seed)
+    counts = {name: max(1, int(count * scale)) for name, count in BASE_COUNTS.items()}
+    data = SyntheticData()
+
+    with transaction.atomic():
+        data.agencies = Agency.objects.bulk_create([
+            Agency(
+                name=f'{rng.choice(ADJECTIVES)} Realty {i}',
+                email=f'agency{seed}-{i}@example.com',
+                phone=f'+2547{rng.randrange(10 ** 8):08d}',
+                description='Synthetic agency',
+                address=f'{rng.choice(NEIGHBOURHOODS)}, {rng.choice(CITIES)[0]}',
+                verification_status='pending' if i % 3 == 2 else 'verified',
+            )
+            for i in range(counts['agencies'])
+        ])
+
+        data.users = User.objects.bulk_create([
+            User(
+                username=f'synthetic{seed}-{i}',
+                email=f'user{seed}-{i}@example.com',
+                first_name=f'First{i}',
+                last_name=f'Last{i}',
+            )
+            for i in range(counts['users'])
+        ])
+        # A fifth of the users are agents spread over the agencies
+        agents = data.users[::5]
+        agent_ids = {user.pk for user in agents}
+        data.profiles = UserProfile.objects.bulk_create([
+            UserProfile(
+                user=user,
+                firebase_uid=f'synthetic{seed}-{i}',
+                role='agent' if user.pk in agent_ids else rng.choice(['buyer', 'seller']),
+                is_agent=user.pk in agent_ids,
+                is_verified=rng.random() < 0.5,
+                agency=data.agencies[i % len(data.agencies)] if user.pk in agent_ids else None,
+            )
+            for i, user in enumerate(data.users)
+        ])
+
+        properties = []
+        for i in range(counts['properties']):
+            city, state, latitude, longitude = rng.choice(CITIES)
+            listing_type = rng.choice(['sale', 'sale', 'rent'])
+            price = Decimal(rng.randrange(20, 2000) * (1000 if listing_type == 'sale' else 50))
+            obj = Property(
+                title=f'{rng.choice(ADJECTIVES)} {rng.randint(1, 6)} bedroom home in {rng.choice(NEIGHBOURHOODS)}',
+                description='Synthetic listing with ' + ', '.join(rng.sample(FEATURES, 3)).replace('_', ' '),
+                property_type=rng.choice([choice for choice, _ in Property.PROPERTY_TYPE_CHOICES]),
+                listing_type=listing_type,
+                status=rng.choice(['available'] * 6 + ['sold', 'pending', 'rented']),
+                price=price,
+                monthly_rent=price if listing_type == 'rent' else None,
+                location=rng.choice(NEIGHBOURHOODS),
+                city=city,
+                state=state,
+                zip_code=f'{rng.randrange(100, 999)}00',
+                country='Kenya',
+                latitude=round(latitude + rng.uniform(-0.15, 0.15), 6),
+                longitude=round(longitude + rng.uniform(-0.15, 0.15), 6),
+                bedrooms=rng.randint(0, 6),
+                bathrooms=Decimal(rng.randint(2, 8)) / 2,
+                total_area=rng.randrange(300, 6000),
+                garage_spaces=rng.randint(0, 3),
+                year_built=rng.randint(1970, 2024),
+                property_features=rng.sample(FEATURES, rng.randint(0, 4)),
+                utilities=rng.sample(UTILITIES, rng.randint(1, 4)),
+                seller=rng.choice(data.users),
+                agent=rng.choice(agents) if rng.random() < 0.6 else None,
+                agency=rng.choice(data.agencies) if rng.random() < 0.6 else None,
+                views_count=rng.randrange(0, 5000),
+            )
+            obj.geohash = geohash_for(obj.latitude, obj.longitude)
+            properties.append(obj)
+        data.properties = Property.objects.bulk_create(properties)
+
+        inquirers = data.users + [None]
+        data.inquiries = Inquiry.objects.bulk_create([
+            Inquiry(
+                property=listing,
+                seller_id=listing.seller_id,
+                user=user,
+                name=f'{user.first_name} {user.last_name}' if user else 'Guest',
+                email=user.email if user else f'guest{i}@example.com',
+                phone=f'+2547{rng.randrange(10 ** 8):08d}',
+                message='Is this still available?',
+                inquiry_type=rng.choice([choice for choice, _ in Inquiry.INQUIRY_TYPE_CHOICES]),
+                status=rng.choice([choice for choice, _ in Inquiry.STATUS_CHOICES]),
+            )
+            for i, (user, listing) in enumerate(
+                (rng.choice(inquirers), rng.choice(data.properties)) for _ in range(counts['inquiries'])
+            )
+        ])
+
+        pairs = set()
+        favorites_wanted = min(counts['favorites'], len(data.users) * len(data.properties))
+        while len(pairs) < favorites_wanted:
+            pairs.add((rng.randrange(len(data.users)), rng.randrange(len(data.properties))))
+        data.favorites = Favorite.objects.bulk_create([
+            Favorite(user=data.users[u], property=data.properties[p]) for u, p in sorted(pairs)
+        ])
+
+        reviews = []
+        for _ in range(counts['reviews']):
+            target = rng.choice(['property', 'property', 'agent', 'agency'])
+            reviews.append(Review(
+                reviewer=rng.choice(data.users),
+                property=rng.choice(data.properties) if target == 'property' else None,
+                agent=rng.choice(agents) if target == 'agent' else None,
+                agency=rng.choice(data.agencies) if target == 'agency' else None,
+                rating=rng.randint(1, 5),
+                comment='Synthetic review',
+            ))
+        data.reviews = Review.objects.bulk_create(reviews)
+
+        transactions = []
+        for property_obj in rng.sample(data.properties, min(counts['transactions'], len(data.properties))):
+            transactions.append(Transaction(
+                property=property_obj,
+                buyer=rng.choice(data.users),
+                seller=property_obj.seller,
+                agent=property_obj.agent,
+                transaction_type='sale' if property_obj.listing_type == 'sale' else 'rental',
+                offer_price=property_obj.price,
+                final_price=property_obj.price,
+                status=rng.choice([choice for choice, _ in Transaction.STATUS_CHOICES]),
+            ))
+        data.transactions = Transaction.objects.bulk_create(transactions)
+
+        get_search_backend().index_many(data.properties)
+        Agency.recount()
+        UserProfile.recount()
+        PlatformStats.refresh()
+    response_cache.bump(LIST_GENERATION)
+    similarity_index.reset()
+    return data
@@ -0,0 +1,248 @@
+"""
+Database-backed background tasks.
+
+``enqueue`` inserts a Task row in the caller's transaction. The job therefore
+exists only if the write that caused it commits, and the request pays for a
+single INSERT. Workers claim ready rows in batches:
+
+- on PostgreSQL (and other backends with ``SKIP LOCKED``), with
+  ``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent workers never wait on
+  each other's rows;
+- on SQLite, with one ``UPDATE ... WHERE id IN (SELECT ... LIMIT n)``.
+  SQLite serializes writers, which makes that statement an atomic claim.
+
+Every claim stamps the rows with a unique token. Failed jobs are retried
+with exponential backoff until ``max_attempts``. Rows left ``running`` longer
+than TASK_LOCK_TIMEOUT (a crashed worker) are claimed again. A worker only
+records an outcome on rows that still carry its token, so a slow worker
+whose job was reclaimed cannot overwrite the new owner's state.
+
+Jobs run in a daemon thread of the web process, woken when an enqueueing
+transaction commits (TASK_WORKER_IN_PROCESS), or in dedicated
+``manage.py run_tasks`` processes. Handlers are plain functions registered
+with ``@task`` (see tasks.py). They must be idempotent, since a job can run
+more than once if a worker dies mid-batch.
+"""
+import atexit
+import logging
+import os
+import random
+import socket
+import threading
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(name=None, max_attempts=None):
+    """Register a function as a task handler; it is called with the payload as keyword arguments"""
+    def decorator(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        func.max_attempts = max_attempts
+        registry[func.task_name] = func
+        return func
+    return decorator
+
+
+def enqueue(handler, delay=None, **payload):
+    """Queue ``handler`` (a ``@task`` function or its name) to run with ``payload`` after commit"""
+    name = getattr(handler, 'task_name', handler)
+    if name not in registry:
+        raise ValueError(f'Unknown task {name!r}')
+    max_attempts = registry[name].max_attempts or getattr(settings, 'TASK_MAX_ATTEMPTS', 5)
+    job = Task.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay or 0),
+    )
+    if getattr(settings, 'TASK_WORKER_IN_PROCESS', True):
+        transaction.on_commit(worker.wake)
+    return job
+
+
+def backoff(attempts):
+    """Seconds before retry number ``attempts``: exponential, capped, with up to 10% jitter"""
+    base = getattr(settings, 'TASK_RETRY_BASE_DELAY', 5.0)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'TASK_RETRY_MAX_DELAY', 3600.0))
+    return delay * (1 + random.random() * 0.1)
+
+
+def _ready(now):
+    stale = now - timedelta(seconds=getattr(settings, 'TASK_LOCK_TIMEOUT', 600))
+    return Task.objects.filter(
+        Q(status='queued', run_at__lte=now) | Q(status='running', locked_at__lt=stale)
+    ).order_by('run_at', 'id')
+
+
+def claim(worker_id, batch_size):
+    """Lock up to ``batch_size`` ready tasks for ``worker_id`` and return them"""
+    now = timezone.now()
+    token = f'{worker_id}:{uuid.uuid4().hex[:12]}'[:100]
+    claimed = {'status': 'running', 'locked_by': token, 'locked_at': now, 'attempts': F('attempts') + 1}
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(_ready(now).select_for_update(skip_locked=True).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return []
+            Task.objects.filter(id__in=ids).update(**claimed)
+    else:
+        if not Task.objects.filter(id__in=_ready(now).values('id')[:batch_size]).update(**claimed):
+            return []
+    return list(Task.objects.filter(locked_by=token).order_by('run_at', 'id'))
+
+
+class TaskQueueStats:
+    """Per-process counts of finished jobs, by task name and outcome, for metrics.py"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._outcomes = Counter()
+
+    def record(self, name, outcome):
+        with self._lock:
+            self._outcomes[name, outcome] += 1
+
+    def outcomes(self):
+        with self._lock:
+            return dict(self._outcomes)
+
+
+stats = TaskQueueStats()
+
+
+def depth():
+    """Queued and running jobs per task name, and the age in seconds of the oldest ready job"""
+    now = timezone.now()
+    rows = (
+        Task.objects.filter(status__in=('queued', 'running')).order_by()
+        .values('name', 'status')
+        .annotate(count=Count('id'), oldest=Min('run_at'))
+    )
+    counts, oldest = {}, None
+    for row in rows:
+        counts[row['name'], row['status']] = row['count']
+        if row['status'] == 'queued' and row['oldest'] <= now:
+            oldest = min(oldest or row['oldest'], row['oldest'])
+    return counts, (now - oldest).total_seconds() if oldest else 0.0
+
+
+def _finish(job, outcome, **fields):
+    """
+    Write a job's outcome if this worker still owns it. Returns False, and
+    counts the job as ``lost``, when the row was reclaimed in the meantime.
+    """
+    if Task.objects.filter(pk=job.pk, locked_by=job.locked_by).update(**fields):
+        stats.record(job.name, outcome)
+        return True
+    logger.warning('Task %s #%s was reclaimed by another worker; its %s outcome is dropped', job.name, job.pk, outcome)
+    stats.record(job.name, 'lost')
+    return False
+
+
+def run_task(job):
+    """Run one claimed job and record its outcome; returns True when it succeeded"""
+    handler = registry.get(job.name)
+    if handler is None:
+        _finish(job, 'failed', status='failed', last_error='Unknown task', finished_at=timezone.now())
+        return False
+    try:
+        handler(**job.payload)
+    except Exception as exc:
+        error = f'{type(exc).__name__}: {exc}'
+        if job.attempts >= job.max_attempts:
+            logger.exception('Task %s #%s failed for good after %d attempts', job.name, job.pk, job.attempts)
+            _finish(job, 'failed', status='failed', last_error=error, finished_at=timezone.now())
+        else:
+            logger.warning('Task %s #%s failed (attempt %d): %s', job.name, job.pk, job.attempts, error)
+            _finish(
+                job, 'retried', status='queued', last_error=error, locked_by='', locked_at=None,
+                run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)),
+            )
+        return False
+    return _finish(job, 'done', status='done', finished_at=timezone.now())
+
+
+def run_batch(worker_id, batch_size):
+    """Claim and run one batch; returns the number of jobs claimed"""
+    jobs = claim(worker_id, batch_size)
+    for job in jobs:
+        run_task(job)
+    return len(jobs)
+
+
+def prune(older_than):
+    """Delete finished jobs older than ``older_than`` (a timedelta); returns the number deleted"""
+    deleted, _ = Task.objects.filter(
+        status__in=('done', 'failed'), finished_at__lt=timezone.now() - older_than
+    ).delete()
+    return deleted
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class InProcessWorker:
+    """Daemon thread that drains the queue when woken by a commit, and polls otherwise"""
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def poll_interval(self):
+        return getattr(settings, 'TASK_POLL_INTERVAL', 5.0)
+
+    def wake(self):
+        self._ensure_thread()
+        self._wake.set()
+
+    def shutdown(self):
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=max(self.poll_interval, 1))
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='task-worker', daemon=True)
+            self._thread.start()
+        atexit.register(self.shutdown)
+
+    def _run(self):
+        worker_id = default_worker_id()
+        batch_size = getattr(settings, 'TASK_BATCH_SIZE', 20)
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                while not self._stop.is_set() and run_batch(worker_id, batch_size):
+                    pass
+            except Exception:
+                logger.exception('Task worker batch failed')
+            finally:
+                connection.close()
+
+
+worker = InProcessWorker()
@@ -0,0 +1,73 @@
+"""
+Follow-up work for inquiries, favorites and listing images, run by the task queue.
+
+Views and signals enqueue these jobs with ``taskqueue.enqueue`` and return straight away.
+Each handler reloads its rows, so a job that runs late (or twice) sees the
+current state and does nothing if the row has gone.
+"""
+from django.conf import settings
+from django.core.mail import send_mail
+
+from . import media
+from .models import Inquiry, Property
+from .taskqueue import task
+
+
+def _site_name():
+    return getattr(settings, 'SITE_NAME', 'FabHomes')
+
+
+@task('inquiry.notify_seller')
+def notify_seller_of_inquiry(inquiry_id):
+    """Email the listing's seller (and agent, if any) about a new inquiry"""
+    inquiry = (
+        Inquiry.objects.select_related('property__seller', 'property__agent')
+        .filter(pk=inquiry_id).first()
+    )
+    if inquiry is None:
+        return
+    listing = inquiry.property
+    recipients = [user.email for user in (listing.seller, listing.agent) if user is not None and user.email]
+    if not recipients:
+        return
+    send_mail(
+        f'[{_site_name()}] New {inquiry.get_inquiry_type_display().lower()} for {listing.title}',
+        f'{inquiry.name} ({inquiry.email}, {inquiry.phone}) wrote:\n\n{inquiry.message}',
+        None,
+        list(dict.fromkeys(recipients)),
+    )
+
+
+@task('inquiry.notify_status')
+def notify_inquirer_of_status(inquiry_id, status):
+    """Tell the person who asked that their inquiry moved to ``status``"""
+    inquiry = Inquiry.objects.select_related('property').filter(pk=inquiry_id).first()
+    # A later transition has its own job; only report the one this job was queued for
+    if inquiry is None or inquiry.status != status or not inquiry.email:
+        return
+    send_mail(
+        f'[{_site_name()}] Your inquiry about {inquiry.property.title}',
+        f'Hi {inquiry.name},\n\nYour inquiry is now marked "{inquiry.get_status_display()}".',
+        None,
+        [inquiry.email],
+    )
+
+
+@task('favorite.notify_seller')
+def notify_seller_of_favorite(property_id):
+    """Let the seller know someone saved their listing"""
+    listing = Property.objects.select_related('seller').filter(pk=property_id).first()
+    if listing is None or not listing.seller.email:
+        return
+    send_mail(
+        f'[{_site_name()}] Someone saved {listing.title}',
+        f'Your listing "{listing.title}" was added to a buyer\'s favorites.',
+        None,
+        [listing.seller.email],
+    )
+
+
+@task('property.build_media', max_attempts=3)
+def build_property_media(property_id):
+    """Resize the listing's images into card, gallery and thumbnail derivatives"""
+    media.build_media(property_id)
@@ -1,3 +1,1918 @@
-from django.test import TestCase
+import csv
+import datetime
+import http.server
+import io
+import json
+import tempfile
+import threading
+import types
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, quote, urlsplit
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Prefetch, Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+import numpy as np
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import benchmarks, imaging, media, search, signals, synthetic, taskqueue
+from .authentication import token_cache, user_cache
+from .cache import LIST_GENERATION, response_cache
+from .cards import RowMapper, values_for
+from .export import INQUIRY_EXPORT_FIELDS, PROPERTY_EXPORT_FIELDS
+from .facets import facet_counts
+from .favorites import favorite_cache, toggle_favorite
+from .fieldsets import Fieldset
+from .geo import encode_geohash, geohash_cover
+from .models import (
+    Agency, UserProfile, Property, Inquiry, Favorite, Review, Transaction, PlatformStats, RequestProfile, Task
+)
+from .pagination import MergedQuerySet
+from .renderers import ORJSONRenderer
+from .search import get_search_backend
+from .serializers import FavoriteSerializer, PropertyListSerializer
+from .similarity import SimilarityIndex, _Index, similarity_index
+from .view_counter import ViewCountBuffer
+
+FAKE_VERIFIER_CALLS = []
+
+
+def fake_verify_token(id_token):
+    """Offline stand-in for firebase_config.verify_firebase_token"""
+    FAKE_VERIFIER_CALLS.append(id_token)
+    if id_token.startswith('valid-'):
+        return {'uid': id_token[len('valid-'):], 'exp': 4102444800}
+    return None
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        # Throttle history and cached responses live in the caches
+        for cache in caches.all():
+            cache.clear()
+        token_cache.clear()
+        user_cache.clear()
+        FAKE_VERIFIER_CALLS.clear()
+        similarity_index.reset()
+        self.client = APIClient()
+
+
+def make_property(seller, **fields):
+    values = {
+        'title': 'Garden house', 'description': 'Quiet street', 'property_type': 'house',
+        'listing_type': 'sale', 'price': '250000.00', 'location': 'Westlands',
+        'city': 'Nairobi', 'state': 'Nairobi', 'zip_code': '00100', 'country': 'Kenya',
+        'bedrooms': 3, 'bathrooms': '2.0', 'total_area': 1800,
+    }
+    values.update(fields)
+    return Property.objects.create(seller=seller, **values)
+
+
+@override_settings(FIREBASE_TOKEN_VERIFIER='properties.tests.fake_verify_token')
+class FirebaseAuthenticationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('buyer', email='buyer@example.com')
+        UserProfile.objects.create(user=self.user, firebase_uid='abc')
+        self.property = make_property(User.objects.create_user('seller'))
+
+    def inquire(self, token):
+        return self.client.post('/api/inquiries/', {
+            'property': str(self.property.pk), 'name': 'Buyer', 'email': 'buyer@example.com',
+            'phone': '123', 'message': 'Interested',
+        }, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_inquiry_is_attached_to_authenticated_user(self):
+        response = self.inquire('valid-abc')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Inquiry.objects.get().user, self.user)
+
+    def test_verified_tokens_and_users_are_cached(self):
+        self.client.get('/api/inquiries/', HTTP_AUTHORIZATION='Bearer valid-abc')
+        with self.assertNumQueries(1):  # the inbox count; no profile lookup
+            response = self.client.get('/api/inquiries/', HTTP_AUTHORIZATION='Bearer valid-abc')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(FAKE_VERIFIER_CALLS, ['valid-abc'])
+
+    def test_invalid_token_is_rejected(self):
+        response = self.inquire('forged')
+        self.assertEqual(response.status_code, 401)
+
+    def test_unknown_uid_stays_anonymous(self):
+        response = self.inquire('valid-nobody')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(Inquiry.objects.get().user)
+
+    def test_profile_change_refreshes_cached_user(self):
+        self.inquire('valid-nobody')
+        other = User.objects.create_user('late')
+        UserProfile.objects.create(user=other, firebase_uid='nobody')
+        self.inquire('valid-nobody')
+        self.assertEqual(Inquiry.objects.filter(user=other).count(), 1)
+
+
+class QueryBudgetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = synthetic.generate(scale=1, seed=0)
+
+    def test_synthetic_data_matches_scale(self):
+        counts = self.data.counts()
+        for name, count in synthetic.BASE_COUNTS.items():
+            self.assertEqual(counts[name], count)
+        self.assertEqual(Property.objects.exclude(geohash='').count(), len(self.data.properties))
+
+    def test_endpoints_stay_within_query_budgets(self):
+        target_values = benchmarks.targets(self.data)
+        with benchmarks.benchmark_settings():
+            for endpoint in benchmarks.ENDPOINTS:
+                with self.subTest(endpoint.name):
+                    result = benchmarks.run_endpoint(endpoint, target_values, repeat=1)
+                    self.assertLessEqual(result['queries'], endpoint.budget)
+
+    def test_serializers_stay_within_query_budgets(self):
+        for case in benchmarks.SERIALIZER_CASES:
+            with self.subTest(case.name):
+                result = benchmarks.run_serializer(case, repeat=1)
+                self.assertLessEqual(result['queries'], case.budget)
+
+    def test_compare_flags_extra_queries_and_slowdowns(self):
+        baseline = [{'kind': 'endpoint', 'name': 'a', 'queries': 2, 'median_ms': 10.0}]
+        self.assertEqual(benchmarks.compare(baseline, baseline), [])
+        slower = [{'kind': 'endpoint', 'name': 'a', 'queries': 3, 'median_ms': 20.0}]
+        self.assertEqual(len(benchmarks.compare(slower, baseline)), 2)
+
+
+class AgencyQueryCountTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.agencies = [
+            Agency.objects.create(name=f'Agency {i}', email=f'agency{i}@example.com', phone='1',
+                                  verification_status='verified')
+            for i in range(3)
+        ]
+        self.seller = User.objects.create_user('seller')
+        for i, agency in enumerate(self.agencies):
+            for j in range(i + 1):
+                agent = User.objects.create_user(f'agent{i}-{j}', first_name='Agent')
+                UserProfile.objects.create(user=agent, firebase_uid=f'agent{i}-{j}', agency=agency, is_agent=True)
+                make_property(self.seller, agency=agency, agent=agent)
+
+    def assertCounts(self, agency, agents, properties):
+        agency.refresh_from_db()
+        self.assertEqual((agency.agents_count, agency.properties_count), (agents, properties))
+
+    def test_list_and_detail_queries_do_not_grow_with_agencies(self):
+        with self.assertNumQueries(2):  # count + page
+            response = self.client.get('/api/agencies/')
+        self.assertEqual([a['agents_count'] for a in response.data['results']], [1, 2, 3])
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/agencies/{self.agencies[2].pk}/')
+        self.assertEqual(response.data['properties_count'], 3)
+
+    def test_sub_resources_are_paginated_with_fixed_queries(self):
+        agency = self.agencies[2]
+        with self.assertNumQueries(3):  # agency + count + page
+            response = self.client.get(f'/api/agencies/{agency.pk}/properties/?page_size=2')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/agencies/{agency.pk}/agents/')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['results'][0]['user_name'], 'Agent ')
+
+    def test_property_detail_does_not_count_agency_relations(self):
+        property_obj = Property.objects.filter(agency=self.agencies[0]).get()
+        response = self.client.get(f'/api/properties/{property_obj.pk}/')
+        self.assertEqual(response.data['agency']['agents_count'], 1)
+        self.assertEqual(response.data['agency']['properties_count'], 1)
+
+    def test_counts_follow_moves_and_deletes(self):
+        first, second = self.agencies[0], self.agencies[1]
+        property_obj = Property.objects.filter(agency=second).first()
+        property_obj.agency = first
+        property_obj.save()
+        profile = UserProfile.objects.filter(agency=second).first()
+        profile.agency = None
+        profile.save()
+        self.assertCounts(first, 1, 2)
+        self.assertCounts(second, 1, 1)
+
+        property_obj.delete()
+        UserProfile.objects.get(agency=first).user.delete()
+        self.assertCounts(first, 0, 1)
+
+    def test_recount_repairs_drift(self):
+        Agency.objects.update(agents_count=0, properties_count=99)
+        Agency.recount()
+        for i, agency in enumerate(self.agencies):
+            self.assertCounts(agency, i + 1, i + 1)
+
+
+class ValuesSerializationTests(APITestCase):
+    """Cards rendered from values() rows (properties.cards) match the serializers byte for byte"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = synthetic.generate(scale=0.5, seed=3)
+        cls.targets = benchmarks.targets(cls.data)
+        listing = Property.objects.filter(status='available').first()
+        Property.objects.filter(pk=listing.pk).update(
+            featured_image_url='https://img.example.com/a.jpg', agent=None, agency=None,
+            media={'images': [{'source': 'https://img.example.com/a.jpg', 'width': 2000, 'height': 1000,
+                               'variants': {name: {'width': width, 'height': width // 2, 'webp': f'{name}.webp',
+                                                   'jpeg': f'{name}.jpg'}
+                                            for name, width in (('thumb', 320), ('card', 640), ('gallery', 1280))}}]},
+        )
+        Favorite.objects.get_or_create(user=cls.targets['favoriter'], property=listing)
+
+    def render_both(self, path, user=None):
+        """``path``'s response body with the fast path off, then on"""
+        self.client.force_authenticate(user)
+        bodies = []
+        for fast in (False, True):
+            for cache in caches.all():
+                cache.clear()
+            with override_settings(FAST_LIST_SERIALIZATION=fast):
+                response = self.client.get(path)
+            self.assertEqual(response.status_code, 200, path)
+            bodies.append(response.content)
+        return bodies
+
+    def test_endpoints_render_the_same(self):
+        favoriter = self.targets['favoriter']
+        paths = [
+            '/api/properties/?page_size=100',
+            '/api/properties/?ordering=-price&city__iexact=Nairobi',
+            '/api/properties/?near=-1.2864,36.8172&radius_km=25',
+            '/api/properties/?search=garden',
+            '/api/properties/search/?q=modern&listing=sale',
+            '/api/properties/?fields=id,title,agent_name,featured_image,is_favorite',
+            '/api/properties/?fields=id,seller_name&expand=agency',
+            '/api/properties/{property}/similar/',
+            '/api/properties/{property}/similar/?fields=id,favorites_count',
+            '/api/agencies/{agency}/properties/',
+            '/api/agencies/{agency}/properties/?fields=id,price,is_favorite',
+        ]
+        for path in paths:
+            path = path.format(**self.targets)
+            for user in (None, favoriter):
+                with self.subTest(path=path, user=user):
+                    slow, fast = self.render_both(path, user)
+                    self.assertEqual(fast, slow)
+        slow, fast = self.render_both('/api/favorites/?page_size=100', favoriter)
+        self.assertEqual(fast, slow)
+
+    def test_cursor_pages_render_the_same(self):
+        favoriter = self.targets['favoriter']
+        for path in ('/api/properties/?cursor=&page_size=5&ordering=-price', '/api/favorites/?cursor=&page_size=2'):
+            for _ in range(3):
+                with self.subTest(path=path):
+                    slow, fast = self.render_both(path, favoriter)
+                    self.assertEqual(fast, slow)
+                path = self.client.get(path).data['next']
+
+    def test_serializers_render_the_same(self):
+        favorite_ids = frozenset(Favorite.objects.values_list('property_id', flat=True)[:20])
+        instances = list(Property.objects.for_listing())
+        rows = list(values_for(Property.objects.with_favorites_count(), PropertyListSerializer))
+        context = {'favorite_ids': favorite_ids}
+        self.assertEqual(
+            PropertyListSerializer(rows, many=True, context=context).data,
+            PropertyListSerializer(instances, many=True, context=context).data,
+        )
+        self.assertTrue(any(card['featured_image'] for card in PropertyListSerializer(rows, many=True).data))
+        self.assertTrue(any(card['agent_name'] is None for card in PropertyListSerializer(rows, many=True).data))
+
+        favorites = Favorite.objects.prefetch_related(Prefetch('property', queryset=Property.objects.for_listing()))
+        rows = list(values_for(Favorite.objects.with_property_favorites_count(), FavoriteSerializer))
+        self.assertEqual(FavoriteSerializer(rows, many=True).data, FavoriteSerializer(favorites, many=True).data)
+
+
+    def test_value_fields_read_their_field_columns(self):
+        fieldset = Fieldset(frozenset({'seller_name', 'featured_image', 'favorites_count'}), frozenset())
+        columns = PropertyListSerializer.field_columns
+        self.assertEqual(
+            RowMapper(PropertyListSerializer, fieldset).columns,
+            ('id', *columns['featured_image'], *columns['seller_name'], 'favorites_count'),
+        )
+
+        class Serializer(PropertyListSerializer):
+            field_columns = {}
+
+        with self.assertRaisesMessage(ImproperlyConfigured, 'Serializer.featured_image needs an entry in field_columns'):
+            RowMapper(Serializer)
+
+
+class ViewCountBufferTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        seller = User.objects.create_user('seller')
+        self.properties = [make_property(seller) for _ in range(3)]
+        self.buffer = ViewCountBuffer(flush_interval=0, max_pending=10)
+
+    def views(self):
+        return [Property.objects.get(pk=p.pk).views_count for p in self.properties]
+
+    def test_views_are_buffered_until_flushed(self):
+        first, second, third = self.properties
+        for property_obj, views in ((first, 3), (second, 3), (third, 1)):
+            for _ in range(views):
+                self.buffer.increment(property_obj.pk)
+        self.assertEqual(self.views(), [0, 0, 0])
+        self.assertEqual(self.buffer.pending(first.pk), 3)
+
+        with self.assertNumQueries(4):  # one UPDATE per distinct delta, in a transaction
+            self.assertEqual(self.buffer.flush(), 7)
+        self.assertEqual(self.views(), [3, 3, 1])
+        self.assertEqual(self.buffer.pending_total(), 0)
+
+    def test_full_buffer_flushes_itself(self):
+        buffer = ViewCountBuffer(flush_interval=0, max_pending=2)
+        buffer.increment(self.properties[0].pk)
+        self.assertEqual(self.views(), [0, 0, 0])
+        buffer.increment(self.properties[1].pk)
+        self.assertEqual(self.views(), [1, 1, 0])
+
+    def test_failed_flush_keeps_the_views(self):
+        self.buffer.increment(self.properties[0].pk, by=2)
+        with mock.patch.object(ViewCountBuffer, '_write', side_effect=DatabaseError):
+            with self.assertLogs('properties.view_counter', 'ERROR'):
+                self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending(self.properties[0].pk), 2)
+        self.buffer.flush()
+        self.assertEqual(self.views(), [2, 0, 0])
+
+    def test_increment_view_reports_pending_views(self):
+        property_obj = self.properties[0]
+        with mock.patch('properties.views.view_counter', self.buffer):
+            self.client.post(f'/api/properties/{property_obj.pk}/increment_view/')
+            response = self.client.post(f'/api/properties/{property_obj.pk}/increment_view/')
+        self.assertEqual(response.data['views_count'], 2)
+        self.assertEqual(self.views(), [0, 0, 0])
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        seller = User.objects.create_user('seller')
+        self.title_match = make_property(seller, title='Riverside villa', description='Four bedrooms')
+        self.body_match = make_property(seller, title='Family home', description='Short walk to the riverside park')
+        self.other = make_property(seller, title='City flat', description='Top floor')
+
+    def titles(self, query):
+        response = self.client.get(f'/api/properties/?search={query}')
+        return [card['title'] for card in response.data['results']]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.titles('riverside'), ['Riverside villa', 'Family home'])
+
+    def test_every_term_must_match_and_the_last_may_be_a_prefix(self):
+        self.assertEqual(self.titles('riverside par'), ['Family home'])
+        self.assertEqual(self.titles('riverside+flat'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.other.title = 'Riverside studio'
+        self.other.save()
+        self.assertEqual(self.titles('studio'), ['Riverside studio'])
+        self.title_match.delete()
+        self.assertEqual(self.titles('riverside'), ['Riverside studio', 'Family home'])
+
+    def test_rebuild_indexes_every_listing(self):
+        backend = get_search_backend()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {backend.table}')
+        self.assertEqual(self.titles('riverside'), [])
+        self.assertEqual(backend.rebuild(), 3)
+        caches['responses'].clear()  # rebuild() does not touch the cached pages
+        self.assertEqual(self.titles('riverside'), ['Riverside villa', 'Family home'])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs PostgreSQL')
+@override_settings(PROPERTY_SEARCH_BACKEND='properties.search.PostgresSearchBackend')
+class PostgresSearchTests(SearchTests):
+    def setUp(self):
+        search._backend = None
+        self.addCleanup(setattr, search, '_backend', None)
+        super().setUp()
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        seller = User.objects.create_user('seller')
+        # Pairs of equal prices, so pages split ties on the ordering value
+        self.properties = [make_property(seller, price=f'{100000 + (i // 2) * 1000}.00') for i in range(7)]
+
+    def walk(self, path):
+        """The ids on each page, following ``next`` links from ``path``"""
+        pages = []
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            pages.append([card['id'] for card in response.data['results']])
+            path = response.data['next']
+        return pages, response
+
+    def test_next_links_visit_every_row_once_across_ties(self):
+        pages, _ = self.walk('/api/properties/?cursor=&page_size=2&ordering=-price')
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        expected = sorted(self.properties, key=lambda p: (-float(p.price), -p.pk.int))
+        self.assertEqual(sum(pages, []), [str(p.pk) for p in expected])
+
+    def test_previous_links_return_the_earlier_pages(self):
+        pages, last = self.walk('/api/properties/?cursor=&page_size=3&ordering=price')
+        previous = last.data['previous']
+        for page in reversed(pages[:-1]):
+            response = self.client.get(previous)
+            self.assertEqual([card['id'] for card in response.data['results']], page)
+            previous = response.data['previous']
+        self.assertIsNone(previous)
+
+    def test_cursor_for_another_ordering_is_rejected(self):
+        response = self.client.get('/api/properties/?cursor=&page_size=2&ordering=-price')
+        cursor = parse_qs(urlsplit(response.data['next']).query)['cursor'][0]
+        response = self.client.get(f'/api/properties/?cursor={cursor}&page_size=2&ordering=views_count')
+        self.assertEqual(response.status_code, 404)
+
+    def test_orderings_a_cursor_cannot_carry_are_rejected(self):
+        for query in ('ordering=title', 'ordering=-price,created_at', 'near=-1.28,36.82&radius_km=5',
+                      'search=garden'):
+            with self.subTest(query):
+                response = self.client.get(f'/api/properties/?cursor=&{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ordering', response.data)
+        user = User.objects.create_user('buyer')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get('/api/inquiries/?cursor=&ordering=status').status_code, 400)
+        self.assertEqual(self.client.get('/api/inquiries/?cursor=').status_code, 200)
+
+
+NAIROBI_CBD = (-1.2864, 36.8172)
+PLACES = {
+    'Westlands': (-1.2676, 36.8108),  # ~2.2 km from the CBD
+    'Karen': (-1.3197, 36.7073),  # ~12.7 km
+    'Mombasa': (-4.0435, 39.6682),  # ~440 km
+}
+
+
+class GeoTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        seller = User.objects.create_user('seller')
+        self.places = {
+            name: make_property(seller, title=name, latitude=latitude, longitude=longitude, price=f'{price}.00')
+            for price, (name, (latitude, longitude)) in zip((100000, 200000, 300000), PLACES.items())
+        }
+        make_property(seller, title='Unmapped')
+
+
+class GeoFilterTests(GeoTestCase):
+    def test_geohash_is_stored_on_save(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        westlands = Property.objects.get(title='Westlands')
+        self.assertEqual(westlands.geohash, encode_geohash(*PLACES['Westlands']))
+        self.assertEqual(Property.objects.get(title='Unmapped').geohash, '')
+        westlands.latitude, westlands.longitude = PLACES['Mombasa']
+        westlands.save(update_fields=['latitude', 'longitude'])
+        westlands.refresh_from_db()
+        self.assertEqual(westlands.geohash, encode_geohash(*PLACES['Mombasa']))
+
+    def test_radius_keeps_nearby_listings_nearest_first(self):
+        near = '{},{}'.format(*NAIROBI_CBD)
+        response = self.client.get(f'/api/properties/?near={near}&radius_km=5')
+        self.assertEqual([card['title'] for card in response.data['results']], ['Westlands'])
+        self.assertAlmostEqual(response.data['results'][0]['distance_km'], 2.2, delta=0.1)
+        response = self.client.get(f'/api/properties/?near={near}&radius_km=20')
+        self.assertEqual([card['title'] for card in response.data['results']], ['Westlands', 'Karen'])
+        response = self.client.get(f'/api/properties/?near={near}&radius_km=20&ordering=-price')
+        self.assertEqual([card['title'] for card in response.data['results']], ['Karen', 'Westlands'])
+
+    def test_bbox_keeps_listings_inside_the_box(self):
+        response = self.client.get('/api/properties/?bbox=36.75,-1.30,36.85,-1.25')
+        self.assertEqual([card['title'] for card in response.data['results']], ['Westlands'])
+        response = self.client.get('/api/properties/?bbox=30,-5,40,0&ordering=price')
+        self.assertEqual([card['title'] for card in response.data['results']], ['Westlands', 'Karen', 'Mombasa'])
+
+    def test_cover_spans_the_antimeridian(self):
+        cells = geohash_cover(-1, 179, 1, -179)
+        self.assertTrue(any(encode_geohash(0, 179.5).startswith(cell) for cell in cells))
+        self.assertTrue(any(encode_geohash(0, -179.5).startswith(cell) for cell in cells))
+        self.assertFalse(any(encode_geohash(0, 0).startswith(cell) for cell in cells))
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in ('near=1', 'near=95,0', 'near=0,0&radius_km=900', 'bbox=1,2,3', 'bbox=0,10,1,5'):
+            with self.subTest(query):
+                self.assertEqual(self.client.get(f'/api/properties/?{query}').status_code, 400)
+
+
+class ClusterTests(GeoTestCase):
+    def clusters(self, query):
+        response = self.client.get(f'/api/properties/clusters/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_nearby_listings_share_a_cell_at_low_zoom(self):
+        data = self.clusters('zoom=5')
+        self.assertEqual(sorted(cluster['count'] for cluster in data['clusters']), [1, 2])
+        nairobi = next(cluster for cluster in data['clusters'] if cluster['count'] == 2)
+        self.assertEqual(len(nairobi['key']), data['precision'])
+        self.assertAlmostEqual(nairobi['latitude'], (PLACES['Westlands'][0] + PLACES['Karen'][0]) / 2)
+        self.assertEqual((nairobi['min_price'], nairobi['max_price']), ('100000.00', '200000.00'))
+
+    def test_cells_split_as_zoom_grows(self):
+        data = self.clusters('zoom=14')
+        self.assertEqual([cluster['count'] for cluster in data['clusters']], [1, 1, 1])
+        self.assertGreater(data['precision'], self.clusters('zoom=5')['precision'])
+
+    def test_list_filters_apply(self):
+        data = self.clusters('zoom=5&price__gte=150000')
+        self.assertEqual(sorted(cluster['count'] for cluster in data['clusters']), [1, 1])
+        data = self.clusters('zoom=5&bbox=36.5,-1.5,37,-1')
+        self.assertEqual([cluster['count'] for cluster in data['clusters']], [2])
+
+    def test_zoom_is_required(self):
+        for query in ('', 'zoom=x', 'zoom=23'):
+            with self.subTest(query):
+                self.assertEqual(self.client.get(f'/api/properties/clusters/?{query}').status_code, 400)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user('seller', first_name='Sam')
+        self.agency = Agency.objects.create(name='Acme', email='acme@example.com', phone='1',
+                                            verification_status='verified')
+        self.property = make_property(self.seller, agency=self.agency)
+        self.list_url = '/api/properties/'
+        self.detail_url = f'/api/properties/{self.property.pk}/'
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertCache(self, url, state):
+        self.assertEqual(self.get(url)['X-Cache'], state, url)
+
+    def test_anonymous_lists_are_cached_until_a_listing_changes(self):
+        self.assertCache(self.list_url, 'MISS')
+        self.assertCache(self.list_url, 'HIT')
+        self.assertCache(f'{self.list_url}?page_size=5', 'MISS')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.property.title = 'Renamed'
+            self.property.save()
+        response = self.get(self.list_url)
+        self.assertEqual((response['X-Cache'], response.data['results'][0]['title']), ('MISS', 'Renamed'))
+
+    def test_signed_in_clients_are_not_served_from_the_list_cache(self):
+        self.get(self.list_url)
+        self.client.force_authenticate(self.seller)
+        self.assertNotIn('X-Cache', self.get(self.list_url))
+
+    def test_favorites_invalidate_lists_and_the_detail_page(self):
+        self.get(self.list_url)
+        self.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.seller, property=self.property)
+        self.assertEqual(self.get(self.list_url).data['results'][0]['favorites_count'], 1)
+        self.assertCache(self.detail_url, 'MISS')
+
+    def test_detail_document_follows_what_it_embeds(self):
+        self.assertCache(self.detail_url, 'MISS')
+        self.assertCache(self.detail_url, 'HIT')
+        self.get(self.list_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(property=self.property, reviewer=self.seller, rating=5, comment='Lovely')
+        self.assertCache(self.detail_url, 'MISS')
+        self.assertCache(self.list_url, 'HIT')  # reviews are not on the cards
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.first_name = 'Samuel'
+            self.seller.save()
+        response = self.get(self.detail_url)
+        self.assertEqual((response['X-Cache'], response.data['seller']['first_name']), ('MISS', 'Samuel'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agency.name = 'Acme Homes'
+            self.agency.save()
+        response = self.get(self.detail_url)
+        self.assertEqual((response['X-Cache'], response.data['agency']['name']), ('MISS', 'Acme Homes'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.last_login = self.property.created_at
+            self.seller.save(update_fields=['last_login'])
+        self.assertCache(self.detail_url, 'HIT')
+
+    def test_generations_only_grow(self):
+        self.assertEqual(response_cache.generations(['scope:a']), [0])
+        response_cache.bump('scope:a')
+        response_cache.bump('scope:a', 'scope:b')
+        self.assertEqual(response_cache.generations(['scope:a', 'scope:b']), [2, 1])
+        caches['responses'].clear()  # culling entries leaves the counters alone
+        self.assertEqual(response_cache.generations(['scope:a', 'scope:b']), [2, 1])
+
+    def test_signed_in_clients_share_detail_documents_only_in_a_shared_cache(self):
+        self.assertCache(self.detail_url, 'MISS')
+        self.client.force_authenticate(self.seller)
+        self.assertCache(self.detail_url, 'MISS')
+        self.assertCache(self.detail_url, 'MISS')
+        with override_settings(RESPONSE_CACHE_SHARED=True):
+            self.assertCache(self.detail_url, 'HIT')
+
+
+class PlatformStatsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user('seller')
+        UserProfile.objects.create(user=self.seller, firebase_uid='seller')
+        PlatformStats.refresh()
+
+    def assertMatchesRecount(self):
+        stats = PlatformStats.current()
+        self.assertEqual({name: getattr(stats, name) for name in PlatformStats.COUNTER_FIELDS}, PlatformStats.compute())
+
+    def test_deltas_follow_creates_transitions_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            agency = Agency.objects.create(name='Acme', email='acme@example.com', phone='1')
+            sale = make_property(self.seller, agency=agency)
+            rent = make_property(self.seller, listing_type='rent')
+            Inquiry.objects.create(property=sale, name='A', email='a@example.com', message='Hi')
+            Review.objects.create(property=rent, reviewer=self.seller, rating=4, comment='Fine')
+            deal = Transaction.objects.create(property=sale, seller=self.seller, transaction_type='sale',
+                                              offer_price='1.00', final_price='1.00')
+        self.assertMatchesRecount()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            agency.verification_status = 'verified'
+            agency.save()
+            sale.status = 'sold'
+            sale.save()
+            rent.listing_type = 'sale'
+            rent.save()
+            rent.save()  # a second save of the same instance is not a transition
+            deal.status = 'completed'
+            deal.save()
+        self.assertEqual(PlatformStats.current().for_sale, 1)
+        self.assertMatchesRecount()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.delete()
+            agency.delete()
+            self.seller.profile.delete()
+        self.assertMatchesRecount()
+
+    def test_deltas_are_applied_after_the_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_property(self.seller)
+            self.assertEqual(PlatformStats.current().total_properties, 0)
+        self.assertEqual(PlatformStats.current().total_properties, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                make_property(self.seller)
+                raise DatabaseError('rolled back')
+        self.assertMatchesRecount()
+
+    def test_instances_loaded_with_only_still_move_the_counters(self):
+        agency = Agency.objects.create(name='Acme', email='acme@example.com', phone='1')
+        property_obj = make_property(self.seller)
+        partial = Property.objects.only('id', 'title').get(pk=property_obj.pk)
+        partial.status = 'sold'
+        partial.agency = agency
+        PlatformStats.refresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            partial.save()
+        self.assertEqual(PlatformStats.current().available_properties, 0)
+        agency.refresh_from_db()
+        self.assertEqual(agency.properties_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Property.objects.defer('status', 'listing_type', 'agency').get(pk=property_obj.pk).delete()
+        agency.refresh_from_db()
+        self.assertEqual(agency.properties_count, 0)
+        self.assertMatchesRecount()
+
+    def test_handlers_do_not_depend_on_each_other(self):
+        agency = Agency.objects.create(name='Acme', email='acme@example.com', phone='1')
+        property_obj = make_property(self.seller)
+        buyer = User.objects.create_user('buyer')
+        UserProfile.objects.create(user=buyer, firebase_uid='buyer')
+        Inquiry.objects.create(property=property_obj, name='A', email='a@example.com', message='Hi')
+        PlatformStats.refresh()
+        handlers = signals.TRACKED_SAVE_HANDLERS[Property]
+        with mock.patch.dict(signals.TRACKED_SAVE_HANDLERS, {Property: handlers[::-1]}), \
+                self.captureOnCommitCallbacks(execute=True):
+            property_obj = Property.objects.get(pk=property_obj.pk)
+            property_obj.status, property_obj.agency, property_obj.seller = 'sold', agency, buyer
+            property_obj.save()
+        agency.refresh_from_db()
+        self.assertEqual(agency.properties_count, 1)
+        self.assertEqual(UserProfile.objects.get(user=buyer).inquiries_received_count, 1)
+        self.assertMatchesRecount()
+
+
+class SimilarityTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user('seller')
+        self.base = self.listing('Base', price='250000.00', total_area=1800)
+        self.close = self.listing('Close', price='260000.00', total_area=1850)
+        self.far = self.listing('Far', price='2500000.00', total_area=9000, bedrooms=8)
+        self.other_city = self.listing('Other city', price='250000.00', total_area=1800, city='Mombasa')
+        self.rental = self.listing('Rental', listing_type='rent')
+        self.sold = self.listing('Sold', status='sold')
+        self.index = SimilarityIndex(background=False)
+
+    def listing(self, title, **fields):
+        return make_property(self.seller, title=title, **fields)
+
+    def titles(self, property_obj, index=None):
+        ids = (index or self.index).similar(property_obj, k=5)
+        titles = dict(Property.objects.filter(pk__in=ids).values_list('pk', 'title'))
+        return [titles[pk] for pk in ids]
+
+    def test_nearest_first_within_the_listing_type(self):
+        self.assertEqual(self.titles(self.base), ['Close', 'Other city', 'Far'])
+        self.assertEqual(self.titles(self.rental), [])
+
+    def test_endpoint_returns_ranked_cards(self):
+        response = self.client.get(f'/api/properties/{self.base.pk}/similar/')
+        self.assertEqual([card['title'] for card in response.data], ['Close', 'Other city', 'Far'])
+
+    def test_writes_in_this_process_update_the_index_in_place(self):
+        self.titles(self.base, similarity_index)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.price, self.far.total_area, self.far.bedrooms = '251000.00', 1800, 3
+            self.far.save()
+            self.close.status = 'sold'
+            self.close.save()
+        with mock.patch.object(SimilarityIndex, 'build') as build:
+            self.assertEqual(self.titles(self.base, similarity_index), ['Far', 'Other city'])
+        build.assert_not_called()
+
+    def test_writes_from_other_processes_trigger_a_rebuild(self):
+        self.assertEqual(self.titles(self.base), ['Close', 'Other city', 'Far'])
+        Property.objects.filter(pk=self.close.pk).update(status='sold')  # no signals, as in another process
+        self.assertEqual(self.titles(self.base), ['Close', 'Other city', 'Far'])
+        self.index.bump_generation()
+        self.assertEqual(self.titles(self.base), ['Other city', 'Far'])
+
+    def test_stale_index_keeps_serving_while_it_rebuilds(self):
+        index = SimilarityIndex()
+        self.titles(self.base, index)
+        rebuilt = threading.Event()
+        index.bump_generation()
+        with mock.patch.object(index, '_rebuild', side_effect=rebuilt.set):
+            self.assertEqual(self.titles(self.base, index), ['Close', 'Other city', 'Far'])
+            self.assertTrue(rebuilt.wait(5))
+
+    def test_writes_during_a_build_are_replayed(self):
+        self.sold.status = 'available'
+
+        def build_during_write(rows):
+            self.index.upsert(self.sold)  # committed after the rows were read
+            return _Index(rows)
+
+        with mock.patch('properties.similarity._Index', side_effect=build_during_write):
+            self.index.build()
+        self.assertIn('Sold', self.titles(self.base))
+
+
+IMPORT_COLUMNS = [
+    'id', 'title', 'description', 'property_type', 'listing_type', 'status', 'price', 'location', 'city',
+    'state', 'zip_code', 'country', 'latitude', 'longitude', 'bedrooms', 'bathrooms', 'total_area',
+    'property_features', 'seller', 'agency',
+]
+
+
+def import_row(**fields):
+    row = {
+        'id': str(uuid.uuid4()), 'title': 'Imported house', 'description': 'From the feed',
+        'property_type': 'house', 'listing_type': 'sale', 'status': 'available', 'price': '300000',
+        'location': 'Kilimani', 'city': 'Nairobi', 'state': 'Nairobi', 'zip_code': '00100', 'country': 'Kenya',
+        'latitude': '-1.29', 'longitude': '36.78', 'bedrooms': '3', 'bathrooms': '2', 'total_area': '1500',
+        'property_features': 'garden|parking', 'seller': 'seller@example.com', 'agency': '',
+    }
+    row.update(fields)
+    return row
+
+
+class ImportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user('seller', email='seller@example.com')
+        self.agency = Agency.objects.create(name='Acme', email='acme@example.com', phone='1')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write_csv(self, rows):
+        path = self.directory / 'listings.csv'
+        with open(path, 'w', newline='', encoding='utf-8') as handle:
+            writer = csv.DictWriter(handle, IMPORT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return str(path)
+
+    def write_jsonl(self, rows):
+        path = self.directory / 'listings.jsonl'
+        path.write_text(''.join(json.dumps(row) + '\n' for row in rows), encoding='utf-8')
+        return str(path)
+
+    def run_import(self, path, *args):
+        """The import's rejected rows, by line"""
+        errors_file = self.directory / 'errors.jsonl'
+        call_command('import_properties', path, *args, '--batch-size=2', f'--errors-file={errors_file}',
+                     stdout=io.StringIO())
+        return {entry['line']: entry['errors'] for entry in map(json.loads, errors_file.read_text().splitlines())}
+
+    def test_csv_rows_are_imported_and_bad_rows_reported(self):
+        rows = [
+            import_row(agency='acme@example.com'),
+            import_row(title='Second', agency=str(self.agency.pk)),
+            import_row(price='lots'),
+            import_row(seller='nobody@example.com'),
+            import_row(status='gone'),
+        ]
+        errors = self.run_import(self.write_csv(rows))
+        self.assertEqual(sorted(errors), [4, 5, 6])
+        self.assertIn('price', errors[4])
+        self.assertEqual(errors[5], {'seller': ['Unknown seller "nobody@example.com".']})
+        self.assertIn('status', errors[6])
+        imported = Property.objects.get(pk=rows[0]['id'])
+        self.assertEqual((imported.seller, imported.agency), (self.seller, self.agency))
+        self.assertEqual(imported.property_features, ['garden', 'parking'])
+        self.assertEqual(Property.objects.count(), 2)
+
+    def test_jsonl_rows_are_imported(self):
+        rows = [import_row(property_features=['pool']), import_row(seller='seller')]
+        path = self.write_jsonl(rows[:1] + [{'title': 'No seller'}] + rows[1:])
+        with open(path, 'a', encoding='utf-8') as handle:
+            handle.write('{not json\n')
+        errors = self.run_import(path)
+        self.assertEqual(sorted(errors), [2, 4])
+        self.assertIn('Unreadable row', errors[4]['row'][0])
+        self.assertEqual(Property.objects.get(pk=rows[0]['id']).property_features, ['pool'])
+        self.assertTrue(Property.objects.filter(pk=rows[1]['id']).exists())
+
+    def test_jsonl_rows_must_be_objects(self):
+        row = import_row()
+        path = self.write_jsonl([row])
+        with open(path, 'a', encoding='utf-8') as handle:
+            handle.write('[1, 2]\n"x"\nnull\n')
+        errors = self.run_import(path)
+        self.assertEqual(errors, {line: {'row': ['Expected a JSON object.']} for line in (2, 3, 4)})
+        self.assertTrue(Property.objects.filter(pk=row['id']).exists())
+
+    def test_duplicate_ids_in_a_batch_are_reported(self):
+        first, other = import_row(title='First'), import_row(title='Other')
+        duplicate = dict(first, title='Duplicate')
+        errors = self.run_import(self.write_csv([first, duplicate, other]))
+        self.assertEqual(errors, {3: {'id': ['Duplicate id; another row in this batch has the same one.']}})
+        self.assertEqual(Property.objects.get(pk=first['id']).title, 'First')
+        self.assertEqual(Property.objects.count(), 2)
+
+        errors = self.run_import(self.write_csv([dict(first, title='Renamed'), duplicate]), '--update')
+        self.assertEqual(errors, {2: {'id': ['Duplicate id; another row in this batch has the same one.']}})
+        self.assertEqual(Property.objects.get(pk=first['id']).title, 'Duplicate')
+
+    def test_existing_ids_need_update(self):
+        row = import_row()
+        self.run_import(self.write_csv([row]))
+        row.update(title='Renamed', status='sold')
+        errors = self.run_import(self.write_csv([row]))
+        self.assertEqual(errors, {2: {'id': ['Property already exists; pass --update to overwrite it.']}})
+        self.assertEqual(Property.objects.get(pk=row['id']).title, 'Imported house')
+
+        self.assertEqual(self.run_import(self.write_csv([row]), '--update'), {})
+        updated = Property.objects.get(pk=row['id'])
+        self.assertEqual((updated.title, updated.status), ('Renamed', 'sold'))
+        self.assertEqual(PlatformStats.current().available_properties, 0)
+
+    def test_update_moves_inquiries_to_the_new_seller(self):
+        buyer = User.objects.create_user('buyer2', email='buyer2@example.com')
+        UserProfile.objects.create(user=self.seller, firebase_uid='seller')
+        UserProfile.objects.create(user=buyer, firebase_uid='buyer2')
+        row, kept = import_row(), import_row(title='Kept')
+        self.run_import(self.write_csv([row, kept]))
+        for listing_id, status in ((row['id'], 'new'), (row['id'], 'contacted'), (kept['id'], 'new')):
+            Inquiry.objects.create(property_id=listing_id, name='B', email='b@example.com', message='Hi',
+                                   status=status)
+
+        row['seller'] = 'buyer2@example.com'
+        self.assertEqual(self.run_import(self.write_csv([row, kept]), '--update'), {})
+        self.assertEqual(set(Inquiry.objects.filter(property_id=row['id']).values_list('seller', flat=True)),
+                         {buyer.pk})
+        counts = dict(UserProfile.objects.values_list('user_id', 'inquiries_received_count'))
+        self.assertEqual(counts, {self.seller.pk: 1, buyer.pk: 2})
+        self.assertEqual(UserProfile.objects.get(user=buyer).new_inquiries_count, 1)
+
+    def test_dry_run_writes_nothing(self):
+        errors = self.run_import(self.write_csv([import_row(), import_row(seller='')]), '--dry-run')
+        self.assertEqual(errors, {3: {'seller': ['This field is required.']}})
+        self.assertFalse(Property.objects.exists())
+
+    def test_derived_data_is_refreshed(self):
+        make_property(self.seller)
+        similarity_index.similar(Property.objects.get())
+        PlatformStats.refresh()
+        before = response_cache.generations([LIST_GENERATION])
+        rows = [import_row(title='Lakeside cottage', agency='acme@example.com'), import_row(status='sold')]
+        self.run_import(self.write_csv(rows))
+
+        imported = Property.objects.get(pk=rows[0]['id'])
+        self.assertEqual(imported.geohash, encode_geohash(-1.29, 36.78))
+        self.assertEqual(self.client.get('/api/properties/?search=lakeside').data['count'], 1)
+        self.agency.refresh_from_db()
+        self.assertEqual(self.agency.properties_count, 1)
+        self.assertEqual(PlatformStats.current().total_properties, 3)
+        self.assertEqual(PlatformStats.current().available_properties, 2)
+        self.assertFalse(similarity_index.is_built)
+        self.assertNotEqual(response_cache.generations([LIST_GENERATION]), before)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user('seller')
+        start = timezone.make_aware(datetime.datetime(2024, 1, 1))
+        self.properties = []
+        for i, city in enumerate(('Nairobi', 'Mombasa', 'Nairobi')):
+            property_obj = make_property(self.seller, title=f'Listing {i}', city=city, property_features=['pool'])
+            # updated_at is auto_now, so only update() can backdate it
+            Property.objects.filter(pk=property_obj.pk).update(updated_at=start + datetime.timedelta(days=i))
+            self.properties.append(property_obj)
+
+    def export(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, path)
+        return b''.join(response.streaming_content).decode()
+
+    def ndjson(self, path):
+        return [json.loads(line) for line in self.export(path).splitlines()]
+
+    def test_ndjson_rows_come_in_update_order(self):
+        rows = self.ndjson('/api/properties/export/')
+        self.assertEqual([row['title'] for row in rows], ['Listing 0', 'Listing 1', 'Listing 2'])
+        self.assertEqual(list(rows[0]), PROPERTY_EXPORT_FIELDS)
+        self.assertEqual((rows[0]['price'], rows[0]['property_features']), ('250000.00', ['pool']))
+        self.assertEqual(rows[0]['updated_at'], '2024-01-01T00:00:00Z')
+
+    def test_csv_has_a_header_and_json_lists(self):
+        response = self.client.get('/api/properties/export/?output=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="properties.csv"')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(json.loads(rows[0]['property_features']), ['pool'])
+        self.assertEqual(rows[0]['monthly_rent'], '')
+
+    def test_updated_since_resumes_from_the_last_row(self):
+        rows = self.ndjson('/api/properties/export/?updated_since=2024-01-02')
+        self.assertEqual([row['title'] for row in rows], ['Listing 1', 'Listing 2'])
+        since = quote(rows[-1]['updated_at'])
+        rows = self.ndjson(f'/api/properties/export/?updated_since={since}')
+        self.assertEqual([row['title'] for row in rows], ['Listing 2'])
+        # Rows sharing the last updated_at are sent again, in id order
+        Property.objects.filter(pk=self.properties[1].pk).update(
+            updated_at=timezone.make_aware(datetime.datetime(2024, 1, 3)))
+        rows = self.ndjson(f'/api/properties/export/?updated_since={since}')
+        self.assertEqual([row['id'] for row in rows], sorted(str(p.pk) for p in self.properties[1:]))
+
+    def test_bad_parameters_are_rejected(self):
+        for query in ('updated_since=yesterday', 'updated_since=2024-13-01', 'output=xml'):
+            with self.subTest(query):
+                self.assertEqual(self.client.get(f'/api/properties/export/?{query}').status_code, 400)
+
+    def test_list_filters_apply(self):
+        rows = self.ndjson('/api/properties/export/?city__iexact=nairobi')
+        self.assertEqual([row['title'] for row in rows], ['Listing 0', 'Listing 2'])
+
+    def test_inquiry_export_covers_the_users_inbox(self):
+        buyer = User.objects.create_user('buyer')
+        stranger = User.objects.create_user('stranger')
+        listing = self.properties[0]
+        sent = Inquiry.objects.create(property=listing, user=buyer, name='B', email='b@example.com', message='Hi')
+        Inquiry.objects.create(property=listing, user=stranger, name='S', email='s@example.com', message='Hi',
+                               status='contacted')
+        self.assertIn(self.client.get('/api/inquiries/export/').status_code, (401, 403))
+
+        self.client.force_authenticate(buyer)
+        rows = self.ndjson('/api/inquiries/export/')
+        self.assertEqual([row['id'] for row in rows], [str(sent.pk)])
+        self.assertEqual(list(rows[0]), INQUIRY_EXPORT_FIELDS)
+        self.assertEqual(rows[0]['property_title'], 'Listing 0')
+
+        self.client.force_authenticate(self.seller)
+        self.assertEqual(len(self.ndjson('/api/inquiries/export/')), 2)
+        rows = self.ndjson('/api/inquiries/export/?status=contacted')
+        self.assertEqual([row['name'] for row in rows], ['S'])
+
+
+@override_settings(FIREBASE_TOKEN_VERIFIER='properties.tests.fake_verify_token',
+                   METRICS_TOKEN='scrape-secret', METRICS_ALLOWED_IPS=[])
+class MetricsAccessTests(APITestCase):
+    def test_scraper_token_is_allowed(self):
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('fabhomes_http_requests_total', response.content.decode())
+
+    def test_staff_are_allowed_by_session_or_firebase_token(self):
+        staff = User.objects.create_user('ops', is_staff=True)
+        UserProfile.objects.create(user=staff, firebase_uid='ops')
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer valid-ops').status_code, 200)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 200)
+
+    def test_everyone_else_is_refused(self):
+        member = User.objects.create_user('member')
+        UserProfile.objects.create(user=member, firebase_uid='member')
+        for authorization in ('', 'Bearer wrong-secret', 'Bearer valid-member', 'Basic scrape-secret'):
+            with self.subTest(authorization):
+                response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION=authorization)
+                self.assertEqual(response.status_code, 403)
+        # The test client connects from 127.0.0.1, which is no longer trusted by default
+        self.assertEqual(self.client.get('/api/metrics/', REMOTE_ADDR='127.0.0.1').status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_listed_addresses_are_opt_in(self):
+        self.assertEqual(self.client.get('/api/metrics/', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get('/api/metrics/', REMOTE_ADDR='10.0.0.6').status_code, 403)
+
+
+@override_settings(FIREBASE_TOKEN_VERIFIER='properties.tests.fake_verify_token')
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        make_property(User.objects.create_user('seller'))
+
+    def profile_settings(self, **overrides):
+        values = {'PROFILING_DIR': self.directory, 'PROFILING_VIEWS': [], 'PROFILING_SAMPLE_RATE': 0.0}
+        values.update(overrides)
+        return self.settings(**values)
+
+    def test_nothing_is_profiled_by_default(self):
+        with self.profile_settings():
+            response = self.client.get('/api/properties/')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_sample_rate_picks_requests_at_random(self):
+        with self.profile_settings(PROFILING_SAMPLE_RATE=0.25), \
+                mock.patch('properties.profiling.random.random', side_effect=[0.1, 0.3, 0.2]):
+            profiled = ['X-Profile-Id' in self.client.get('/api/properties/') for _ in range(3)]
+        self.assertEqual(profiled, [True, False, True])
+        profile = RequestProfile.objects.first()
+        self.assertEqual((profile.trigger, profile.view, profile.status_code), ('sample', 'PropertyViewSet.list', 200))
+        self.assertTrue((self.directory / profile.file_name).exists())
+
+    def test_listed_views_are_always_profiled(self):
+        with self.profile_settings(PROFILING_VIEWS=['AgencyViewSet.list']):
+            self.assertNotIn('X-Profile-Id', self.client.get('/api/properties/'))
+            response = self.client.get('/api/agencies/')
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((profile.trigger, profile.view), ('view', 'AgencyViewSet.list'))
+        self.assertGreaterEqual(profile.query_count, 1)
+
+    def test_header_is_honoured_for_staff_only(self):
+        staff = User.objects.create_user('ops', is_staff=True)
+        UserProfile.objects.create(user=staff, firebase_uid='ops')
+        UserProfile.objects.create(user=User.objects.create_user('member'), firebase_uid='member')
+        with self.profile_settings():
+            refused = self.client.get('/api/properties/', HTTP_X_PROFILE='1', HTTP_AUTHORIZATION='Bearer valid-member')
+            response = self.client.get('/api/properties/', HTTP_X_PROFILE='1', HTTP_AUTHORIZATION='Bearer valid-ops')
+        self.assertNotIn('X-Profile-Id', refused)
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((profile.trigger, profile.user), ('header', staff))
+
+    def test_only_the_newest_profiles_are_kept(self):
+        with self.profile_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_FILES=2):
+            for _ in range(4):
+                self.assertIn('X-Profile-Id', self.client.get('/api/properties/'))
+        # Rows and files are rotated together
+        self.assertEqual(
+            sorted(RequestProfile.objects.values_list('file_name', flat=True)),
+            sorted(path.name for path in self.directory.iterdir()),
+        )
+        self.assertEqual(RequestProfile.objects.count(), 2)
+
+
+class PropertyDetailTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.agency = Agency.objects.create(name='Acme', email='acme@example.com', phone='1')
+        self.seller = User.objects.create_user('seller', first_name='Sam')
+        UserProfile.objects.create(user=self.seller, firebase_uid='seller', phone='555', agency=self.agency)
+        self.agent = User.objects.create_user('agent', first_name='Ann')
+        UserProfile.objects.create(user=self.agent, firebase_uid='agent', is_agent=True, agency=self.agency)
+        self.property = make_property(self.seller, agent=self.agent, agency=self.agency)
+        self.url = f'/api/properties/{self.property.pk}/'
+
+        base = timezone.make_aware(datetime.datetime(2024, 1, 1))
+        for day in range(7):
+            reviewer = User.objects.create_user(f'reviewer{day}', first_name='Reviewer', last_name=str(day))
+            review = Review.objects.create(property=self.property, reviewer=reviewer, rating=4, comment='Nice')
+            Review.objects.filter(pk=review.pk).update(created_at=base + datetime.timedelta(days=day))
+            if day < 3:
+                Favorite.objects.create(user=reviewer, property=self.property)
+        for status in ('new', 'new', 'contacted'):
+            Inquiry.objects.create(property=self.property, name='B', email='b@example.com', message='Hi',
+                                   status=status)
+
+    def test_detail_is_assembled_in_two_queries(self):
+        with self.assertNumQueries(2):  # the listing with its people and agency, then its reviews
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        data = response.data
+        self.assertEqual((data['inquiries_count'], data['favorites_count']), (2, 3))
+        self.assertEqual([review['reviewer_name'] for review in data['reviews']],
+                         [f'Reviewer {day}' for day in (6, 5, 4, 3, 2)])
+        self.assertEqual(data['seller']['profile']['phone'], '555')
+        self.assertTrue(data['agent']['profile']['is_agent'])
+        self.assertEqual(data['agency']['agents_count'], 2)
+
+    def test_cached_document_is_served_without_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(f'{self.url}?fields=id,title')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(set(response.data), {'id', 'title'})
+
+    def test_inquiry_changes_refresh_the_count(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            inquiry = self.property.inquiries.filter(status='new').first()
+            inquiry.status = 'contacted'
+            inquiry.save()
+        response = self.client.get(self.url)
+        self.assertEqual((response['X-Cache'], response.data['inquiries_count']), ('MISS', 1))
+
+    def test_agent_profile_changes_refresh_the_document(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = self.agent.profile
+            profile.phone = '777'
+            profile.save()
+        response = self.client.get(self.url)
+        self.assertEqual((response['X-Cache'], response.data['agent']['profile']['phone']), ('MISS', '777'))
+
+
+class FacetTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        seller = User.objects.create_user('seller')
+        listings = [
+            ('Nairobi', 'house', 'sale', 'fully_furnished', 3, '250000.00'),
+            ('Nairobi', 'house', 'sale', 'unfurnished', 4, '2500000.00'),
+            ('Nairobi', 'apartment', 'rent', 'fully_furnished', 1, '50000.00'),
+            ('nairobi', 'apartment', 'sale', 'partially_furnished', 2, '90000.00'),
+            ('Nairobi', 'land', 'sale', 'unfurnished', 0, '60000000.00'),
+            ('Mombasa', 'house', 'rent', 'fully_furnished', 3, '75000.00'),
+        ]
+        for city, property_type, listing_type, furnishing, bedrooms, price in listings:
+            make_property(seller, city=city, property_type=property_type, listing_type=listing_type,
+                          furnishing=furnishing, bedrooms=bedrooms, price=price)
+        self.filtered = Property.objects.filter(city__iexact='nairobi')
+
+    def facets(self, query):
+        response = self.client.get(f'/api/properties/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['facets']
+
+    def test_value_counts_match_the_filtered_listings(self):
+        facets = self.facets('facets=property_type,listing_type,furnishing,city&city__iexact=nairobi')
+        for name in ('property_type', 'listing_type', 'furnishing'):
+            with self.subTest(name):
+                expected = {
+                    value: self.filtered.filter(**{name: value}).count()
+                    for value in self.filtered.values_list(name, flat=True).distinct()
+                }
+                self.assertEqual({entry['value']: entry['count'] for entry in facets[name]}, expected)
+        self.assertEqual(facets['property_type'][0], {'value': 'apartment', 'count': 2})
+        self.assertEqual(facets['city'], [{'value': 'Nairobi', 'count': 5}])
+
+    def test_city_counts_match_what_picking_the_city_returns(self):
+        facets = self.facets('facets=city')
+        self.assertEqual(facets['city'], [{'value': 'Nairobi', 'count': 5}, {'value': 'Mombasa', 'count': 1}])
+        for entry in facets['city']:
+            with self.subTest(entry['value']):
+                response = self.client.get(f'/api/properties/?city__iexact={entry["value"]}')
+                self.assertEqual(response.data['count'], entry['count'])
+
+    def test_bucket_counts_match_the_filtered_listings(self):
+        facets = self.facets('facets=true&city__iexact=nairobi')
+        for name, entries in (('bedrooms', facets['bedrooms']), ('price', facets['price'])):
+            for entry in entries:
+                with self.subTest(name=name, bucket=entry['value']):
+                    bounds = {f'{name}__gte': entry['min']}
+                    if entry['max'] is not None:
+                        bounds[f'{name}__lt'] = entry['max']
+                    self.assertEqual(entry['count'], self.filtered.filter(**bounds).count())
+        self.assertEqual(sum(entry['count'] for entry in facets['price']), 5)
+
+    def test_each_facet_is_grouped_on_its_own(self):
+        # A single GROUP BY over every facet would return one row per combination
+        with self.assertNumQueries(1):
+            counts = facet_counts(Property.objects.all())
+        self.assertEqual(sum(entry['count'] for entry in counts['city']), 6)
+        self.assertEqual(sum(entry['count'] for entry in counts['bedrooms']), 6)
+
+    def test_facets_cost_one_extra_query(self):
+        with self.assertNumQueries(2):
+            self.client.get('/api/properties/?page_size=2&city__iexact=nairobi')
+        caches['responses'].clear()
+        with self.assertNumQueries(3):
+            self.client.get('/api/properties/?page_size=2&city__iexact=nairobi&facets=true')
+
+    def test_unknown_facets_are_rejected(self):
+        response = self.client.get('/api/properties/?facets=city,colour')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('colour', str(response.data['facets']))
+
+
+def urlconf(name, patterns):
+    """A URLconf module serving ``patterns`` under /api/, for ROOT_URLCONF"""
+    module = types.ModuleType(name)
+    module.urlpatterns = [path('api/', include(patterns))]
+    return module
+
+
+class AsyncReadViewTests(APITestCase):
+    """The async read views (ASYNC_READ_VIEWS) answer like the viewsets, in as many queries"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from . import async_views, urls
+        sync_patterns = [pattern for pattern in urls.urlpatterns if pattern not in async_views.urlpatterns]
+        cls.sync_urls = urlconf('sync_urls', sync_patterns)
+        cls.async_urls = urlconf('async_urls', async_views.urlpatterns + sync_patterns)
+
+    def setUp(self):
+        super().setUp()
+        self.agency = Agency.objects.create(name='Acme', email='acme@example.com', phone='1',
+                                            verification_status='verified')
+        self.seller = User.objects.create_user('seller', first_name='Sam')
+        UserProfile.objects.create(user=self.seller, firebase_uid='seller', agency=self.agency)
+        self.properties = [
+            make_property(self.seller, title=f'Garden house {i}', price=f'{100000 + i * 1000}.00', agency=self.agency)
+            for i in range(5)
+        ]
+        Review.objects.create(property=self.properties[0], reviewer=self.seller, rating=5, comment='Lovely')
+        Favorite.objects.create(user=self.seller, property=self.properties[1])
+
+    def fetch(self, urls, url):
+        caches['responses'].clear()  # both sides build their response from the database
+        with self.settings(ROOT_URLCONF=urls), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, len(queries)
+
+    def assertSameResponse(self, url, queries, async_queries=None):
+        sync_response, sync_count = self.fetch(self.sync_urls, url)
+        async_response, async_count = self.fetch(self.async_urls, url)
+        self.assertEqual(sync_response.status_code, 200)
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(async_response.json(), sync_response.json())
+        expected = queries if async_queries is None else async_queries
+        self.assertEqual((sync_count, async_count), (queries, expected))
+        return async_response
+
+    def test_property_reads_match_the_viewsets(self):
+        detail = f'/api/properties/{self.properties[0].pk}/'
+        for url, queries in (
+            ('/api/properties/?page_size=2', 2),  # count and page, gathered
+            ('/api/properties/?page_size=2&page=last', 2),
+            ('/api/properties/?page_size=2&page=2&ordering=-price', 2),
+            ('/api/properties/?page_size=2&facets=city,bedrooms', 3),
+            ('/api/properties/?cursor=&page_size=2&ordering=price', 1),
+            ('/api/properties/search/?q=garden&page_size=2', 2),
+            (detail, 2),  # the listing and its reviews
+            (f'{detail}?fields=id,title,reviews', 2),
+        ):
+            with self.subTest(url):
+                self.assertSameResponse(url, queries)
+
+    def test_empty_pages_match_the_viewsets(self):
+        # The viewset skips the page query once the count is 0; the async view has sent both already
+        response = self.assertSameResponse('/api/properties/?city__iexact=nowhere', 1, async_queries=2)
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_cursor_pages_match_the_viewsets(self):
+        response = self.assertSameResponse('/api/properties/?cursor=&page_size=2&ordering=-price', 1)
+        next_url = response.json()['next']
+        self.assertSameResponse(next_url[next_url.index('/api/'):], 1)
+
+    def test_signed_in_reads_match_the_viewsets(self):
+        self.client.force_authenticate(self.seller)
+        response = self.assertSameResponse('/api/properties/?page_size=5&fields=id,is_favorite', 3)
+        flagged = {card['id'] for card in response.json()['results'] if card['is_favorite']}
+        self.assertEqual(flagged, {str(self.properties[1].pk)})
+
+    def test_agency_reads_match_the_viewsets(self):
+        base = f'/api/agencies/{self.agency.pk}/'
+        for url, queries in (
+            ('/api/agencies/', 2),
+            (base, 1),
+            (f'{base}properties/?page_size=2', 3),
+            (f'{base}agents/', 3),
+        ):
+            with self.subTest(url):
+                self.assertSameResponse(url, queries)
+
+
+@override_settings(TASK_WORKER_IN_PROCESS=False)
+class FavoriteTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('buyer')
+        seller = User.objects.create_user('seller')
+        self.properties = [make_property(seller, title=f'Listing {i}') for i in range(3)]
+        self.client.force_authenticate(self.user)
+
+    def toggle(self, property_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/favorites/toggle/', {'property_id': str(property_id)}, format='json')
+
+    def test_toggling_twice_adds_then_removes(self):
+        listing = self.properties[0]
+        response = self.toggle(listing.pk)
+        self.assertEqual((response.status_code, response.data['is_favorite']), (201, True))
+        self.assertTrue(Favorite.objects.filter(user=self.user, property=listing).exists())
+        response = self.toggle(listing.pk)
+        self.assertEqual((response.status_code, response.data['is_favorite']), (200, False))
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_unknown_properties_are_not_found(self):
+        self.assertEqual(self.toggle(uuid.uuid4()).status_code, 404)
+        self.assertEqual(self.toggle('not-a-uuid').status_code, 404)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_warm_set_picks_the_statement_that_succeeds(self):
+        listing = self.properties[0]
+        favorite_cache.get(self.user.pk)
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(toggle_favorite(self.user.pk, listing.pk))
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(toggle_favorite(self.user.pk, listing.pk))
+
+    def test_stale_set_falls_back_to_the_other_statement(self):
+        listing = self.properties[0]
+        favorite_cache.get(self.user.pk)  # empty, and about to be stale
+        Favorite.objects.bulk_create([Favorite(user=self.user, property=listing)])
+        # The insert is ignored as a duplicate, so the favorite is removed instead
+        with self.assertNumQueries(2):
+            self.assertFalse(toggle_favorite(self.user.pk, listing.pk))
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_toggles_patch_the_cached_set(self):
+        favorite_cache.get(self.user.pk)
+        self.toggle(self.properties[0].pk)
+        self.toggle(self.properties[1].pk)
+        self.toggle(self.properties[0].pk)
+        self.assertEqual(favorite_cache.peek(self.user.pk), {self.properties[1].pk})
+
+    def test_toggles_refresh_cached_pages(self):
+        listing = self.properties[0]
+        anonymous = APIClient()
+        anonymous.get('/api/properties/')
+        anonymous.get(f'/api/properties/{listing.pk}/')
+        self.toggle(listing.pk)
+        cards = {card['id']: card for card in anonymous.get('/api/properties/').data['results']}
+        self.assertEqual(cards[str(listing.pk)]['favorites_count'], 1)
+        response = anonymous.get(f'/api/properties/{listing.pk}/')
+        self.assertEqual((response['X-Cache'], response.data['favorites_count']), ('MISS', 1))
+
+    def test_other_writes_drop_the_cached_set(self):
+        favorite_cache.get(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, property=self.properties[2])
+        self.assertIsNone(favorite_cache.peek(self.user.pk))
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/favorites/status/?ids={self.properties[2].pk}')
+        self.assertEqual(response.data, {str(self.properties[2].pk): True})
+
+    def test_batch_status_echoes_ids_as_sent(self):
+        favorite_cache.get(self.user.pk)
+        self.toggle(self.properties[0].pk)
+        first, second = str(self.properties[0].pk).upper(), str(self.properties[1].pk)
+        with self.assertNumQueries(0):  # the set is cached
+            response = self.client.get(f'/api/favorites/status/?ids={first},{second}')
+        self.assertEqual(response.data, {first: True, second: False})
+        response = self.client.post('/api/favorites/status/', {'property_ids': [first, second]}, format='json')
+        self.assertEqual(response.data, {first: True, second: False})
+
+    def test_batch_status_errors_name_the_parameter_sent(self):
+        too_many = [str(uuid.uuid4()) for _ in range(101)]
+        for body in ({}, {'property_ids': 'abc'}, {'property_ids': []}, {'property_ids': ['abc']},
+                     {'property_ids': too_many}):
+            with self.subTest(body=str(body)[:40]):
+                response = self.client.post('/api/favorites/status/', body, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.data), ['property_ids'])
+        for query in ('', 'ids=abc', f'ids={",".join(too_many)}'):
+            with self.subTest(query=query[:40]):
+                response = self.client.get(f'/api/favorites/status/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.data), ['ids'])
+
+    def test_batch_status_requires_sign_in(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(f'/api/favorites/status/?ids={self.properties[0].pk}')
+        self.assertIn(response.status_code, (401, 403))
+
+
+TASK_CALLS = []
+
+
+@taskqueue.task('tests.record')
+def record_task(value):
+    TASK_CALLS.append(value)
+
+
+@taskqueue.task('tests.fail', max_attempts=2)
+def failing_task():
+    raise RuntimeError('boom')
+
+
+@override_settings(TASK_WORKER_IN_PROCESS=False, TASK_RETRY_BASE_DELAY=5.0, TASK_RETRY_MAX_DELAY=60.0,
+                   TASK_LOCK_TIMEOUT=600)
+class TaskQueueTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        TASK_CALLS.clear()
+        self.outcomes = taskqueue.stats.outcomes()
+
+    def outcome_delta(self, name, outcome):
+        return taskqueue.stats.outcomes().get((name, outcome), 0) - self.outcomes.get((name, outcome), 0)
+
+    def test_claims_ready_jobs_in_order_and_once(self):
+        jobs = [taskqueue.enqueue(record_task, value=i) for i in range(3)]
+        taskqueue.enqueue(record_task, delay=60, value='later')
+        first = taskqueue.claim('worker-a', 2)
+        self.assertEqual([job.pk for job in first], [jobs[0].pk, jobs[1].pk])
+        self.assertTrue(all(job.status == 'running' and job.attempts == 1 for job in first))
+        self.assertTrue(first[0].locked_by.startswith('worker-a:'))
+        second = taskqueue.claim('worker-b', 2)
+        self.assertEqual([job.pk for job in second], [jobs[2].pk])
+        self.assertNotEqual(second[0].locked_by, first[0].locked_by)
+        self.assertEqual(taskqueue.claim('worker-c', 2), [])
+
+    def test_successful_jobs_are_marked_done(self):
+        job = taskqueue.enqueue(record_task, value='hello')
+        self.assertEqual(taskqueue.run_batch('worker', 10), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(TASK_CALLS, ['hello'])
+        self.assertEqual(self.outcome_delta('tests.record', 'done'), 1)
+
+    def test_failures_back_off_then_give_up(self):
+        job = taskqueue.enqueue(failing_task)
+        before = timezone.now()
+        with self.assertLogs('properties.taskqueue', 'WARNING'):
+            taskqueue.run_batch('worker', 10)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('queued', 1, ''))
+        self.assertEqual(job.last_error, 'RuntimeError: boom')
+        delay = (job.run_at - before).total_seconds()
+        self.assertTrue(5.0 <= delay <= 5.5 + 1, delay)
+        self.assertEqual(taskqueue.claim('worker', 10), [])  # not due yet
+
+        Task.objects.filter(pk=job.pk).update(run_at=before)
+        with self.assertLogs('properties.taskqueue', 'ERROR'):
+            taskqueue.run_batch('worker', 10)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))  # max_attempts=2
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual((self.outcome_delta('tests.fail', 'retried'), self.outcome_delta('tests.fail', 'failed')),
+                         (1, 1))
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        for attempts, base in ((1, 5.0), (2, 10.0), (3, 20.0), (10, 60.0)):
+            with self.subTest(attempts=attempts):
+                self.assertTrue(base <= taskqueue.backoff(attempts) <= base * 1.1)
+
+    def test_stale_jobs_are_reclaimed_and_the_old_owner_is_ignored(self):
+        taskqueue.enqueue(record_task, value='slow')
+        stalled, = taskqueue.claim('worker-a', 10)
+        self.assertEqual(taskqueue.claim('worker-b', 10), [])  # still locked
+        Task.objects.filter(pk=stalled.pk).update(locked_at=timezone.now() - datetime.timedelta(seconds=601))
+        reclaimed, = taskqueue.claim('worker-b', 10)
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (stalled.pk, 2))
+
+        # worker-a finishes late: the row belongs to worker-b now
+        with self.assertLogs('properties.taskqueue', 'WARNING') as logs:
+            self.assertFalse(taskqueue.run_task(stalled))
+        self.assertIn('reclaimed', logs.output[0])
+        job = Task.objects.get(pk=stalled.pk)
+        self.assertEqual((job.status, job.locked_by), ('running', reclaimed.locked_by))
+        self.assertEqual(self.outcome_delta('tests.record', 'lost'), 1)
+
+        self.assertTrue(taskqueue.run_task(reclaimed))
+        self.assertEqual(Task.objects.get(pk=stalled.pk).status, 'done')
+        self.assertEqual(TASK_CALLS, ['slow', 'slow'])
+
+    def test_unknown_tasks_fail_without_retrying(self):
+        job = Task.objects.create(name='tests.missing')
+        taskqueue.run_batch('worker', 10)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ('failed', 'Unknown task'))
+
+
+class InboxTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user('seller')
+        UserProfile.objects.create(user=self.seller, firebase_uid='seller')
+        self.buyer = User.objects.create_user('buyer')
+        UserProfile.objects.create(user=self.buyer, firebase_uid='buyer')
+        self.listing = make_property(self.seller)
+        self.own_listing = make_property(self.buyer)
+
+    def inquire(self, listing, user=None, status='new', day=1):
+        inquiry = Inquiry.objects.create(property=listing, user=user, name='B', email='b@example.com',
+                                         message='Hi', status=status)
+        created_at = timezone.make_aware(datetime.datetime(2024, 1, day))
+        Inquiry.objects.filter(pk=inquiry.pk).update(created_at=created_at)
+        return inquiry
+
+    def assertInbox(self, user, received, new):
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual((profile.inquiries_received_count, profile.new_inquiries_count), (received, new))
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get('/api/inquiries/counts/').data, {'received': received, 'new': new})
+
+    def test_inbox_merges_sent_and_received_without_duplicates(self):
+        inquiries = [
+            self.inquire(self.listing, self.buyer, day=1),
+            self.inquire(self.own_listing, self.seller, day=2),
+            self.inquire(self.own_listing, None, status='contacted', day=3),
+            self.inquire(self.own_listing, self.buyer, status='closed', day=4),  # sent and received
+            self.inquire(self.listing, None, day=5),  # someone else's
+        ]
+        self.client.force_authenticate(self.buyer)
+        ids, url = [], '/api/inquiries/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 4)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, [str(inquiry.pk) for inquiry in reversed(inquiries[:4])])
+
+        response = self.client.get('/api/inquiries/?status=closed')
+        self.assertEqual([row['id'] for row in response.data['results']], [str(inquiries[3].pk)])
+
+    def test_merged_queryset_counts_and_slices_like_the_or_query(self):
+        for day in range(1, 8):
+            self.inquire(self.listing if day % 2 else self.own_listing, self.buyer if day % 3 else None,
+                         status=('new', 'contacted')[day % 2], day=day)
+        user = self.buyer
+        expected = list(Inquiry.objects.filter(Q(user=user) | Q(seller=user)).order_by('-created_at', 'pk'))
+        merged = MergedQuerySet(Inquiry.objects.all(), [Q(user=user), Q(seller=user, status='new'),
+                                                        Q(seller=user, status='contacted')],
+                                ordering=['-created_at', 'pk'])
+        self.assertEqual(merged.count(), len(expected))
+        self.assertEqual(list(merged[0:3]), expected[0:3])
+        self.assertEqual(list(merged[3:10]), expected[3:])
+
+    def test_counters_follow_creates_status_changes_and_deletes(self):
+        first = self.inquire(self.listing)
+        self.inquire(self.listing)
+        self.assertInbox(self.seller, 2, 2)
+        first.status = 'contacted'
+        first.save()
+        self.assertInbox(self.seller, 2, 1)
+        first.delete()
+        self.assertInbox(self.seller, 1, 1)
+        self.assertInbox(self.buyer, 0, 0)
+
+    def test_counters_follow_a_change_of_seller(self):
+        self.inquire(self.listing)
+        self.inquire(self.listing, status='closed')
+        self.listing.seller = self.buyer
+        self.listing.save()
+        self.assertEqual(set(self.listing.inquiries.values_list('seller', flat=True)), {self.buyer.pk})
+        self.assertInbox(self.seller, 0, 0)
+        self.assertInbox(self.buyer, 2, 1)
+
+    def test_moving_an_inquiry_to_another_listing_moves_it_to_that_seller(self):
+        inquiry = self.inquire(self.listing, self.buyer)
+        self.client.force_authenticate(self.buyer)
+        detail = self.client.get(f'/api/properties/{self.listing.pk}/').data
+        self.assertEqual(detail['inquiries_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/inquiries/{inquiry.pk}/', {'property': str(self.own_listing.pk)})
+        self.assertEqual(response.status_code, 200)
+        inquiry.refresh_from_db()
+        self.assertEqual(inquiry.seller, self.buyer)
+        self.assertInbox(self.seller, 0, 0)
+        self.assertInbox(self.buyer, 1, 1)
+        self.client.force_authenticate(self.seller)
+        self.assertEqual(self.client.get('/api/inquiries/').data['count'], 0)
+        self.assertEqual(self.client.get(f'/api/properties/{self.listing.pk}/').data['inquiries_count'], 0)
+
+    def test_profiles_created_later_count_earlier_inquiries(self):
+        late = User.objects.create_user('late')
+        listing = make_property(late)
+        self.inquire(listing)
+        self.inquire(listing, status='contacted')
+        self.client.force_authenticate(late)
+        # Without a profile the counts are computed on the fly
+        self.assertEqual(self.client.get('/api/inquiries/counts/').data, {'received': 2, 'new': 1})
+        profile = UserProfile.objects.create(user=late, firebase_uid='late')
+        self.assertEqual((profile.inquiries_received_count, profile.new_inquiries_count), (2, 1))
+        self.assertInbox(late, 2, 1)
+
+
+def image_bytes(color, size=(800, 600)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class RedirectingHandler(http.server.BaseHTTPRequestHandler):
+    """Serves an image at /image.png and redirects every other path to ``self.server.location``"""
+
+    def do_GET(self):
+        if self.path == '/image.png':
+            body = image_bytes('red', (10, 10))
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(302)
+            self.send_header('Location', self.server.location)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class MediaFetchTests(APITestCase):
+    def test_other_schemes_are_refused(self):
+        for url in ('ftp://example.com/a.jpg', 'file:///etc/passwd', 'gopher://example.com/', 'example.com/a.jpg'):
+            with self.subTest(url):
+                with self.assertRaisesRegex(media.BlockedURL, 'not an http or https URL'):
+                    media.fetch(url)
+
+    def test_non_public_addresses_are_refused(self):
+        for url in ('http://127.0.0.1/a.jpg', 'http://localhost:8080/a.jpg', 'http://[::1]/a.jpg',
+                    'http://10.1.2.3/a.jpg', 'https://192.168.0.10/a.jpg', 'http://169.254.169.254/latest/',
+                    'http://[::ffff:127.0.0.1]/a.jpg', 'http://0.0.0.0/a.jpg'):
+            with self.subTest(url):
+                with self.assertRaisesRegex(media.BlockedURL, 'non-public address'):
+                    media.fetch(url)
+
+    def test_names_resolving_to_private_addresses_are_refused(self):
+        private = [(2, 1, 6, '', ('10.0.0.7', 80))]
+        with mock.patch('properties.media.socket.getaddrinfo', return_value=private) as getaddrinfo, \
+                mock.patch('properties.media.socket.socket') as socket_class:
+            with self.assertRaises(media.BlockedURL):
+                media.fetch('http://images.example.com/a.jpg')
+        getaddrinfo.assert_called_once()
+        socket_class.assert_not_called()
+
+    def serve(self, location):
+        server = http.server.HTTPServer(('127.0.0.1', 0), RedirectingHandler)
+        server.location = location
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    def test_redirects_are_checked_like_the_first_request(self):
+        # Treat the test server as public; what it redirects to is checked as usual
+        with mock.patch('properties.media._is_public', side_effect=lambda address: address == '127.0.0.1'):
+            base = self.serve('http://169.254.169.254/latest/meta-data/')
+            self.assertEqual(media.fetch(f'{base}/image.png')[:8], b'\x89PNG\r\n\x1a\n')
+            with self.assertRaisesRegex(media.BlockedURL, '169.254.169.254'):
+                media.fetch(f'{base}/redirect')
+
+            # urllib itself would follow this one with its FTP handler
+            base = self.serve('ftp://files.internal/secret')
+            with self.assertRaisesRegex(media.BlockedURL, 'not an http or https URL'):
+                media.fetch(f'{base}/redirect')
+
+    def test_stored_files_are_read_from_inside_the_root(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(MEDIA_ROOT=f'{root}/media',
+                                                                       MEDIA_MAX_SOURCE_BYTES=16):
+            self.addCleanup(setattr, media, '_storage', None)
+            media._storage = None
+            storage = media.get_media_storage()
+            Path(root, 'secret.txt').write_bytes(b'secret')
+            url = storage.save('properties/1/originals/a.png', b'\x89PNG', 'image/png')
+            self.assertEqual(media.fetch(url), b'\x89PNG')
+
+            for name in ('../secret.txt', 'properties/../../secret.txt', '/etc/hostname', 'properties/1'):
+                with self.subTest(name):
+                    with self.assertRaisesRegex(media.BlockedURL, 'not a stored file'):
+                        media.fetch(storage.base_url + name)
+
+            url = storage.save('properties/1/originals/big.png', b'x' * 17, 'image/png')
+            with self.assertRaisesRegex(imaging.InvalidImage, 'larger than 16 bytes'):
+                media.fetch(url)
+
+
+class BuildManifestTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=directory.name, MEDIA_BASE_URL='http://media.test')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        media._storage = None
+        self.addCleanup(setattr, media, '_storage', None)
+
+        # Render in threads rather than spawned processes
+        pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        patcher = mock.patch('properties.media.get_pool', return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.originals = {
+            'https://img.example.com/front.png': image_bytes('red'),
+            'https://img.example.com/garden.png': image_bytes('green', (600, 800)),
+            'https://img.example.com/broken.png': b'not an image',
+        }
+        self.fetched = []
+        patcher = mock.patch('properties.media.fetch', side_effect=self.fake_fetch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_fetch(self, url):
+        self.fetched.append(url)
+        if url not in self.originals:
+            raise media.BlockedURL(f'{url} resolves to a non-public address (10.0.0.1)')
+        return self.originals[url]
+
+    def listing(self, featured, *others, manifest=None):
+        return Property(featured_image_url=featured, image_urls=list(others), media=manifest)
+
+    def test_images_get_variants_in_source_order(self):
+        manifest = media.build_manifest(self.listing(
+            'https://img.example.com/front.png', 'https://img.example.com/garden.png'))
+        front, garden = manifest['images']
+        self.assertEqual((front['source'], front['width'], front['height']),
+                         ('https://img.example.com/front.png', 800, 600))
+        self.assertEqual(garden['variants']['card']['width'], 600)  # never upscaled
+        self.assertTrue(garden['variants']['thumb']['webp'].startswith('http://media.test/media/properties/'))
+
+    def test_unchanged_images_are_reused(self):
+        first = media.build_manifest(self.listing('https://img.example.com/front.png'))
+        self.fetched.clear()
+        second = media.build_manifest(self.listing(
+            'https://img.example.com/front.png', 'https://img.example.com/garden.png', manifest=first))
+        self.assertEqual(self.fetched, ['https://img.example.com/garden.png'])
+        self.assertEqual(second['images'][0], first['images'][0])
+
+        self.fetched.clear()
+        media.build_manifest(self.listing('https://img.example.com/front.png', manifest=first), force=True)
+        self.assertEqual(self.fetched, ['https://img.example.com/front.png'])
+
+    def test_failures_are_recorded_and_retried(self):
+        manifest = media.build_manifest(self.listing(
+            'https://img.example.com/front.png', 'https://img.example.com/broken.png', 'http://10.0.0.1/x.png'))
+        front, broken, blocked = manifest['images']
+        self.assertIn('variants', front)
+        self.assertEqual(set(broken), {'source', 'error'})
+        self.assertIn('non-public address', blocked['error'])
+
+        self.fetched.clear()
+        media.build_manifest(self.listing(
+            'https://img.example.com/front.png', 'https://img.example.com/broken.png', 'http://10.0.0.1/x.png',
+            manifest=manifest))
+        self.assertEqual(self.fetched, ['https://img.example.com/broken.png', 'http://10.0.0.1/x.png'])
+
+
+class RendererTests(TestCase):
+    """ORJSONRenderer writes the bytes JSONRenderer would, or hands over to it"""
+
+    def assertSameBytes(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_payloads_render_the_same(self):
+        when = datetime.datetime(2024, 5, 17, 9, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+        payloads = {
+            'decimals': [Decimal('250000.00'), Decimal('0.1'), Decimal('-3'), Decimal('1E+2'), Decimal('12.345')],
+            'datetimes': [when, when.replace(microsecond=0),
+                          when.astimezone(datetime.timezone(datetime.timedelta(hours=3))),
+                          when.replace(tzinfo=None), when.date(), when.time(), datetime.timedelta(hours=2)],
+            'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'lazy': gettext_lazy('Verified'),
+            'numpy': [np.int64(7), np.float32(1.5), np.float64(0.25), np.bool_(True), np.arange(3)],
+            'floats': [0.1, -0.0, 2.5, 1e16, 1e-05, 1.5e300, 123456.789],
+            'ints': [0, -1, 2 ** 63 - 1, 2 ** 70],
+            'strings': ['Café – 🏠', 'line\u2028break\u2029', '"quoted"\\', '\x00\t\n', '</script>'],
+            'nested': {'empty': {}, 'list': [], 'tuple': (1, 'a', None), 'flags': [True, False, None]},
+            'int_keys': {1: 'one'},
+        }
+        for name, payload in payloads.items():
+            with self.subTest(name):
+                self.assertSameBytes({name: payload})
+        self.assertSameBytes(payloads)
+        self.assertSameBytes([payloads])
+
+    def test_non_finite_numbers(self):
+        for value in (Decimal('NaN'), Decimal('-Infinity'), np.float32('inf')):
+            with self.subTest(value=value):
+                for renderer in (ORJSONRenderer(), JSONRenderer()):
+                    with self.assertRaises(ValueError):
+                        renderer.render({'value': value})
+        # Python floats are written as null, where JSONRenderer raises (see properties.renderers)
+        self.assertEqual(ORJSONRenderer().render({'value': float('nan')}), b'{"value":null}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({'value': float('nan')})
+
+    def test_indented_output_is_left_to_json(self):
+        data = {'price': Decimal('1.5'), 'when': datetime.date(2024, 5, 17)}
+        self.assertEqual(ORJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+
+class FieldsetTests(APITestCase):
+    """?fields= and ?expand= on listing cards and the detail endpoint"""
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user('seller', email='seller@example.com',
+                                               first_name='Sam', last_name='Seller')
+        self.agency = Agency.objects.create(name='Acme', email='acme@example.com', phone='1',
+                                            verification_status='verified')
+        self.property = make_property(self.seller, agency=self.agency)
+
+    def test_unknown_names_are_rejected(self):
+        detail = f'/api/properties/{self.property.pk}/'
+        for url, param in (
+            ('/api/properties/?fields=id,nope', 'fields'),
+            ('/api/properties/?fields=id&expand=seller,owner', 'expand'),
+            ('/api/properties/search/?q=garden&fields=password', 'fields'),
+            (f'/api/agencies/{self.agency.pk}/properties/?expand=nope', 'expand'),
+            (f'{detail}?fields=title,nope', 'fields'),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.data), [param])
+                self.assertIn('Unknown field(s)', response.data[param])
+
+        response = self.client.get('/api/properties/?fields=id,nope&expand=owner')
+        self.assertEqual(set(response.data), {'fields', 'expand'})
+        self.assertIn('nope. Choose from id, title', response.data['fields'])
+
+    def listing_sql(self, url):
+        """The query that loaded the cards for ``url``, and the response"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT "properties_property"."id"')]
+        self.assertEqual(len(selects), 1, selects)
+        return selects[0], response
+
+    def test_expand_joins_only_what_it_renders(self):
+        sql, response = self.listing_sql('/api/properties/?fields=id,title&expand=agency')
+        card = response.data['results'][0]
+        self.assertEqual(set(card), {'id', 'title', 'agency'})
+        self.assertEqual(card['agency']['name'], 'Acme')
+        self.assertIn('JOIN "properties_agency"', sql)
+        self.assertIn('"properties_agency"."description"', sql)
+        self.assertNotIn('"auth_user"', sql)
+        self.assertNotIn('"properties_property"."description"', sql)
+
+        sql, response = self.listing_sql('/api/properties/?fields=id,seller_name&expand=agency')
+        self.assertEqual(response.data['results'][0]['seller_name'], 'Sam Seller')
+        self.assertIn('"auth_user"."first_name"', sql)
+        self.assertNotIn('"auth_user"."password"', sql)
+        self.assertNotIn('"properties_property"."title"', sql)
+
+    def test_fields_without_expand_skip_the_joins(self):
+        sql, response = self.listing_sql('/api/properties/?fields=id,title,price')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'price'})
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('"properties_property"."description"', sql)
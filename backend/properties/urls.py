@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
@@ -11,4 +12,9 @@ router.register(r'agencies', views.AgencyViewSet, basename='agency')
 urlpatterns = [
     path('', include(router.urls)),
     path('analytics/', views.analytics, name='analytics'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    from .async_views import urlpatterns as async_urlpatterns
+    urlpatterns = async_urlpatterns + urlpatterns
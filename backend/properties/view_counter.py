@@ -0,0 +1,132 @@
+"""
+Write-behind buffer for property view counts.
+
+Page views are collected in a process-local counter and written in batches
+with atomic ``F()`` updates, so popular listings don't serialize on row locks
+and concurrent hits never lose increments.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCountBuffer:
+    """Collects view increments and flushes them on a timer, on size, or on shutdown"""
+
+    def __init__(self, flush_interval=None, max_pending=None):
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._pending = Counter()
+        self._in_flight = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 5.0)
+
+    @property
+    def max_pending(self):
+        if self._max_pending is not None:
+            return self._max_pending
+        return getattr(settings, 'VIEW_COUNT_MAX_PENDING', 1000)
+
+    def increment(self, property_id, by=1):
+        """Record ``by`` views for a property without touching the database"""
+        with self._lock:
+            self._pending[property_id] += by
+            size = len(self._pending)
+        self._ensure_flusher()
+        if size >= self.max_pending:
+            self.flush()
+
+    def pending(self, property_id):
+        """Views recorded for a property that are not yet in ``views_count``"""
+        with self._lock:
+            return self._pending[property_id] + self._in_flight[property_id]
+
+    def pending_total(self):
+        with self._lock:
+            return sum(self._pending.values()) + sum(self._in_flight.values())
+
+    def flush(self):
+        """Write all buffered views; returns the number of views written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, Counter()
+                self._in_flight = batch
+            if not batch:
+                return 0
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception('Flushing %d buffered property views failed', len(batch))
+                with self._lock:
+                    self._pending.update(batch)
+                    self._in_flight = Counter()
+                return 0
+            with self._lock:
+                self._in_flight = Counter()
+            return sum(batch.values())
+
+    def discard(self):
+        """Drop buffered views without writing them, e.g. before a test database goes away"""
+        with self._lock:
+            self._pending = Counter()
+
+    def shutdown(self):
+        """Stop the background flusher and write whatever is still buffered"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=max(self.flush_interval, 1))
+        self._thread = None
+        self.flush()
+
+    def _write(self, batch):
+        from .models import Property
+
+        # One UPDATE per distinct delta keeps the statement count small on hot pages
+        by_delta = defaultdict(list)
+        for property_id, delta in batch.items():
+            by_delta[delta].append(property_id)
+
+        with transaction.atomic():
+            for delta, property_ids in by_delta.items():
+                Property.objects.filter(pk__in=property_ids).update(
+                    views_count=F('views_count') + delta
+                )
+
+    def _ensure_flusher(self):
+        if self._thread is not None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='view-count-flusher', daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+
+view_counter = ViewCountBuffer()
@@ -1,38 +1,104 @@
+import uuid
+
+from django.conf import settings
 from django.shortcuts import render
-from django.db.models import Q, Count, Avg
+from django.http import HttpResponse, HttpResponseForbidden
+from django.db import transaction
+from django.db.models import Q, F, Count, Avg, Min, Max, Prefetch
+from django.db.models.functions import Substr
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 
 from .models import (
     Agency, UserProfile, Property, Inquiry,
-    Favorite, Review, Transaction
+    Favorite, Review, Transaction, PlatformStats
 )
 from .serializers import (
     AgencySerializer, UserProfileSerializer, PropertyListSerializer,
-    PropertyDetailSerializer, PropertyCreateUpdateSerializer,
+    PropertyDetailSerializer, PropertyCreateUpdateSerializer, PropertyClusterSerializer,
     InquiryListSerializer, InquiryDetailSerializer, InquiryCreateSerializer,
-    FavoriteSerializer, ReviewSerializer, TransactionSerializer
+    FavoriteSerializer, ReviewSerializer, TransactionSerializer, RECENT_REVIEWS
 )
-from firebase_config import verify_firebase_token
+from .cache import cached_response, detail_generation, property_dependencies, response_cache
+from .cards import fast_path, in_bulk, values_for
+from .favorites import favorite_ids_for, toggle_favorite
+from .facets import facet_counts, requested_facets
+from .fieldsets import requested_fieldset, restrict, wanted
+from .export import INQUIRY_EXPORT_FIELDS, PROPERTY_EXPORT_FIELDS, export_response
+from .geo import GeoFilter, precision_for_zoom
+from .imaging import InvalidImage
+from .media import store_original
+from .metrics import metrics_registry, scrape_allowed
+from .taskqueue import enqueue
+from .tasks import notify_inquirer_of_status, notify_seller_of_favorite, notify_seller_of_inquiry
+from .pagination import ListPagination, MergedQuerySet, StandardResultsSetPagination
+from .similarity import similarity_index
+from .search import PropertySearchFilter, RelevanceOrderingFilter, get_search_backend
+from .view_counter import view_counter
+
+
+# PropertyViewSet actions whose listing cards carry ``is_favorite`` for signed-in users
+FAVORITE_FLAG_ACTIONS = ('list', 'search', 'similar')
+# PropertyViewSet actions that accept ?fields= and ?expand= (see properties.fieldsets)
+FIELDSET_ACTIONS = FAVORITE_FLAG_ACTIONS + ('retrieve',)
+# Loaded whatever the fieldset, for keyset pagination's cursors
+LISTING_ORDER_COLUMNS = ('created_at', 'price', 'views_count')
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 12
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+def listing_queryset(fieldset=None):
+    """
+    The queryset behind listing cards. For the fast path (see properties.cards)
+    it only adds the favorites count, and ``card_rows`` picks the columns once
+    filters have run. Otherwise it is Property.objects.for_listing(), cut down
+    to what a ``?fields=``/``?expand=`` fieldset reads.
+    """
+    if fast_path(fieldset):
+        queryset = Property.objects.all()
+        return queryset.with_favorites_count() if wanted(fieldset, 'favorites_count') else queryset
+    if fieldset is None:
+        return Property.objects.for_listing()
+    queryset = restrict(Property.objects.all(), PropertyListSerializer, fieldset, keep=LISTING_ORDER_COLUMNS)
+    if wanted(fieldset, 'favorites_count'):
+        queryset = queryset.with_favorites_count()
+    return queryset
+
+
+def card_rows(queryset, fieldset=None):
+    """
+    A filtered ``listing_queryset`` as values() rows for the fast path.
+    Annotations and extra selects (distance_km, search_rank) stay selected,
+    so the rows can still be ordered by them.
+    """
+    if not fast_path(fieldset):
+        return queryset
+    keep = LISTING_ORDER_COLUMNS + tuple(queryset.query.annotations) + tuple(queryset.query.extra_select)
+    return values_for(queryset, PropertyListSerializer, fieldset, keep=keep)
+
+
+def card_context(request, fieldset, context=None):
+    """Serializer context for listing cards: the fieldset, and favorite ids when ``is_favorite`` is wanted"""
+    context = {'request': request} if context is None else context
+    context['fieldset'] = fieldset
+    if wanted(fieldset, 'is_favorite'):
+        context['favorite_ids'] = favorite_ids_for(request)
+    return context
+
+
+MAX_STATUS_IDS = 100
 
 
 class PropertyViewSet(viewsets.ModelViewSet):
     """
     Property listing viewset with search, filter, and sorting capabilities
     """
-    pagination_class = StandardResultsSetPagination
+    pagination_class = ListPagination
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, PropertySearchFilter, RelevanceOrderingFilter, GeoFilter]
     
     filterset_fields = {
         'property_type': ['exact'],
@@ -51,9 +117,18 @@ class PropertyViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
 
     def get_queryset(self):
-        queryset = Property.objects.select_related(
-            'seller', 'agent', 'agency'
-        ).prefetch_related('inquiries', 'favorited_by', 'reviews')
+        # similar loads its own listing in full, and its cards through listing_queryset
+        if self.action in ('list', 'search'):
+            queryset = listing_queryset(self.get_fieldset())
+        else:
+            queryset = Property.objects.for_listing()
+        if self.action == 'retrieve':
+            queryset = queryset.with_new_inquiries_count().select_related(
+                'seller__profile', 'agent__profile'
+            ).prefetch_related(
+                Prefetch('reviews', queryset=Review.objects.select_related('reviewer')[:RECENT_REVIEWS],
+                         to_attr='recent_reviews')
+            )
         
         # Filter by featured if requested
         if self.request.query_params.get('featured') == 'true':
@@ -61,6 +136,63 @@ class PropertyViewSet(viewsets.ModelViewSet):
         
         return queryset
 
+    @cached_response()
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        return self.add_facets(request, response, lambda: self.filter_queryset(Property.objects.all()))
+
+    def add_facets(self, request, response, filtered):
+        """Attach ``facets`` to a paginated response when the request asks for them"""
+        names = requested_facets(request)
+        if names and isinstance(response.data, dict):
+            response.data['facets'] = facet_counts(filtered(), names)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        The detail document is assembled in two queries (the listing with its
+        people and agency, then its recent reviews) and cached for every client
+        (only anonymous ones when RESPONSE_CACHE_SHARED is off) until the
+        listing, its reviews, inquiries or favorites, its seller or agent, or
+        its agency change. ``views_count`` may lag by up to
+        PROPERTY_DETAIL_CACHE_TIMEOUT seconds. ``?fields=`` is applied to the
+        cached document.
+        """
+        fieldset = self.get_fieldset()
+
+        def load():
+            instance = self.get_object()
+            return instance, property_dependencies(instance)
+
+        data, hit = response_cache.document(
+            request, 'property-detail', detail_generation(kwargs[self.lookup_url_kwarg or self.lookup_field]),
+            load, lambda instance: self.get_serializer(instance).data,
+            timeout=getattr(settings, 'PROPERTY_DETAIL_CACHE_TIMEOUT', 300),
+        )
+        response = Response(data if fieldset is None else fieldset.trim(data))
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+    def paginate_queryset(self, queryset):
+        if self.action in ('list', 'search'):
+            queryset = card_rows(queryset, self.get_fieldset())
+        return super().paginate_queryset(queryset)
+
+    def get_fieldset(self):
+        """The request's ``?fields=``/``?expand=`` Fieldset, or None (see properties.fieldsets)"""
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = (
+                requested_fieldset(self.request, self.get_serializer_class())
+                if self.action in FIELDSET_ACTIONS else None
+            )
+        return self._fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in FAVORITE_FLAG_ACTIONS:
+            card_context(self.request, self.get_fieldset(), context)
+        return context
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return PropertyDetailSerializer
@@ -94,28 +226,41 @@ class PropertyViewSet(viewsets.ModelViewSet):
     def increment_view(self, request, pk=None):
         """Increment property view count"""
         property_obj = self.get_object()
-        property_obj.increment_views()
-        return Response({'views_count': property_obj.views_count})
+        view_counter.increment(property_obj.pk)
+        return Response({
+            'views_count': property_obj.views_count + view_counter.pending(property_obj.pk)
+        })
 
     @action(detail=False, methods=['get'])
+    @cached_response()
     def search(self, request):
         """Advanced search endpoint"""
+        queryset = self.search_queryset(request, self.get_queryset())
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+            return self.add_facets(
+                request, response, lambda: self.search_queryset(request, Property.objects.all())
+            )
+        
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    def search_queryset(self, request, queryset):
+        """``queryset`` narrowed by the ``search`` action's text query and filters"""
         query = request.query_params.get('q', '')
         property_type = request.query_params.get('type')
         listing_type = request.query_params.get('listing')
         min_price = request.query_params.get('min_price')
         max_price = request.query_params.get('max_price')
         city = request.query_params.get('city')
-        
-        queryset = self.get_queryset()
-        
+
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query) |
-                Q(location__icontains=query)
+            queryset = get_search_backend().search(queryset, query).order_by(
+                '-search_rank', '-created_at'
             )
-        
         if property_type:
             queryset = queryset.filter(property_type=property_type)
         if listing_type:
@@ -126,47 +271,141 @@ class PropertyViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(price__lte=max_price)
         if city:
             queryset = queryset.filter(city__iexact=city)
-        
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return GeoFilter().filter_queryset(request, queryset, self)
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """Map marker clusters for a viewport (``bbox``) at a zoom level"""
+        try:
+            zoom = int(request.query_params.get('zoom', ''))
+        except ValueError:
+            raise ValidationError({'zoom': 'A zoom level between 0 and 22 is required.'})
+        if not 0 <= zoom <= 22:
+            raise ValidationError({'zoom': 'A zoom level between 0 and 22 is required.'})
+        precision = precision_for_zoom(zoom)
+
+        # Same filters as the list; the geohash prefix is the per-zoom grid key
+        queryset = self.filter_queryset(Property.objects.all())
+        cells = (
+            queryset.order_by()
+            .exclude(geohash='')
+            .annotate(cell=Substr('geohash', 1, precision))
+            .values('cell')
+            .annotate(
+                count=Count('pk'),
+                latitude=Avg('latitude'),
+                longitude=Avg('longitude'),
+                min_price=Min('price'),
+                max_price=Max('price'),
+            )
+            .order_by('cell')
+        )
+        return Response({
+            'zoom': zoom,
+            'precision': precision,
+            'clusters': PropertyClusterSerializer(cells, many=True).data,
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream every listing matching the list filters as NDJSON or CSV"""
+        queryset = self.filter_queryset(Property.objects.all())
+        return export_response(request, queryset, PROPERTY_EXPORT_FIELDS, 'properties')
 
     @action(detail=True, methods=['get'])
+    @cached_response(detail=True)
     def similar(self, request, pk=None):
-        """Get similar properties"""
+        """Get similar properties, nearest first"""
         property_obj = self.get_object()
-        similar = Property.objects.filter(
-            property_type=property_obj.property_type,
-            city=property_obj.city,
-            listing_type=property_obj.listing_type,
-            status='available'
-        ).exclude(id=property_obj.id)[:5]
+        ids = similarity_index.similar(property_obj, k=5)
+        fieldset = self.get_fieldset()
+        similar = in_bulk(card_rows(listing_queryset(fieldset), fieldset), ids)
         
-        serializer = PropertyListSerializer(similar, many=True)
+        serializer = PropertyListSerializer(
+            [similar[i] for i in ids if i in similar], many=True, context=self.get_serializer_context()
+        )
         return Response(serializer.data)
 
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated],
+            parser_classes=[MultiPartParser])
+    def images(self, request, pk=None):
+        """
+        Upload listing photos (multipart ``image`` parts). Originals are stored
+        as sent and appended to image_urls. The first upload becomes the
+        featured image when there is none, or when ``featured=true``. Resized
+        derivatives are built in the background.
+        """
+        instance = self.get_object()
+        if not (request.user.is_staff or request.user.pk in (instance.seller_id, instance.agent_id)):
+            return Response(
+                {'detail': 'Only the seller or agent can add images to this listing'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        files = request.FILES.getlist('image')
+        if not files:
+            raise ValidationError({'image': 'Attach at least one image.'})
+        limit = getattr(settings, 'MEDIA_MAX_UPLOAD_BYTES', 15 * 1024 * 1024)
+        for upload in files:
+            if upload.size > limit:
+                raise ValidationError({'image': f'{upload.name} is larger than {limit // (1024 * 1024)} MB.'})
+
+        urls = []
+        for upload in files:
+            try:
+                urls.append(store_original(instance.pk, upload.read()))
+            except InvalidImage:
+                raise ValidationError({'image': f'{upload.name} is not a JPEG, PNG, WebP or GIF image.'})
+
+        instance.image_urls = list(dict.fromkeys(list(instance.image_urls or []) + urls))
+        if request.data.get('featured') in ('1', 'true') or not instance.featured_image_url:
+            instance.featured_image_url = urls[0]
+        instance.save(update_fields=['featured_image_url', 'image_urls', 'updated_at'])
+        return Response(
+            {'featured_image_url': instance.featured_image_url, 'image_urls': instance.image_urls},
+            status=status.HTTP_201_CREATED
+        )
+
 
 class InquiryViewSet(viewsets.ModelViewSet):
     """
     Inquiry/Lead management viewset
     """
-    pagination_class = StandardResultsSetPagination
+    pagination_class = ListPagination
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['property', 'status', 'inquiry_type']
     ordering = ['-created_at']
 
     def get_queryset(self):
-        if self.request.user.is_authenticated:
-            return Inquiry.objects.filter(
-                Q(user=self.request.user) |
-                Q(property__seller=self.request.user)
+        if not self.request.user.is_authenticated:
+            return Inquiry.objects.none()
+        queryset = Inquiry.objects.filter(Q(user=self.request.user) | Q(seller=self.request.user))
+        if self.action == 'retrieve':
+            return queryset.select_related('user__profile').prefetch_related(
+                Prefetch('property', queryset=Property.objects.for_listing())
             )
-        return Inquiry.objects.none()
+        return queryset.annotate(property_title=F('property__title'))
+
+    def inbox_conditions(self, user):
+        """
+        The branches of the inbox UNION: inquiries the user sent, and those on
+        their listings split by status, so each branch reads one range of the
+        (user, -created_at) or (seller, status, -created_at) index in order
+        """
+        if self.request.query_params.get('status'):
+            received = [Q(seller=user)]
+        else:
+            received = [Q(seller=user, status=value) for value, _ in Inquiry.STATUS_CHOICES]
+        return [Q(user=user)] + received
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(Inquiry.objects.all())
+        inbox = MergedQuerySet(queryset, self.inbox_conditions(request.user)).annotate(property_title=F('property__title'))
+        page = self.paginate_queryset(inbox)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -176,22 +415,14 @@ class InquiryViewSet(viewsets.ModelViewSet):
         return InquiryListSerializer
 
     def create(self, request, *args, **kwargs):
-        """Create inquiry - get token from header if user is authenticated"""
+        """Create inquiry - attach the user when the request is authenticated"""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        user = None
-        auth_header = request.headers.get('Authorization')
-        if auth_header:
-            decoded_token = verify_firebase_token(auth_header)
-            if decoded_token:
-                try:
-                    user_profile = UserProfile.objects.get(firebase_uid=decoded_token['uid'])
-                    user = user_profile.user
-                except UserProfile.DoesNotExist:
-                    pass
-        
-        serializer.save(user=user)
+        user = request.user if request.user.is_authenticated else None
+        with transaction.atomic():
+            inquiry = serializer.save(user=user)
+            enqueue(notify_seller_of_inquiry, inquiry_id=str(inquiry.pk))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['patch'])
@@ -206,12 +437,33 @@ class InquiryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        inquiry.status = new_status
-        inquiry.save()
+        if inquiry.status != new_status:
+            inquiry.status = new_status
+            with transaction.atomic():
+                inquiry.save()
+                enqueue(notify_inquirer_of_status, inquiry_id=str(inquiry.pk), status=new_status)
         
         serializer = InquiryDetailSerializer(inquiry)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def export(self, request):
+        """Stream the user's inquiries (sent and received) as NDJSON or CSV"""
+        queryset = self.filter_queryset(self.get_queryset())
+        return export_response(request, queryset, INQUIRY_EXPORT_FIELDS, 'inquiries')
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def counts(self, request):
+        """Inquiries received on the user's listings, and how many are still new"""
+        counts = UserProfile.objects.filter(user=request.user).values(
+            'inquiries_received_count', 'new_inquiries_count'
+        ).first()
+        if counts is None:
+            counts = Inquiry.objects.filter(seller=request.user).aggregate(
+                inquiries_received_count=Count('pk'), new_inquiries_count=Count('pk', filter=Q(status='new'))
+            )
+        return Response({'received': counts['inquiries_received_count'], 'new': counts['new_inquiries_count']})
+
 
 class FavoriteViewSet(viewsets.ModelViewSet):
     """
@@ -219,10 +471,15 @@ class FavoriteViewSet(viewsets.ModelViewSet):
     """
     serializer_class = FavoriteSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = ListPagination
 
     def get_queryset(self):
-        return Favorite.objects.filter(user=self.request.user)
+        favorites = Favorite.objects.filter(user=self.request.user)
+        if self.action == 'list' and fast_path():
+            return values_for(favorites.with_property_favorites_count(), FavoriteSerializer)
+        return favorites.prefetch_related(
+            Prefetch('property', queryset=Property.objects.for_listing())
+        )
 
     @action(detail=False, methods=['post'])
     def toggle(self, request):
@@ -234,29 +491,58 @@ class FavoriteViewSet(viewsets.ModelViewSet):
                 {'detail': 'property_id is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
         try:
-            property_obj = Property.objects.get(id=property_id)
-            favorite, created = Favorite.objects.get_or_create(
-                user=request.user,
-                property=property_obj
-            )
-            
-            if not created:
-                favorite.delete()
-                return Response(
-                    {'detail': 'Property removed from favorites', 'is_favorite': False}
-                )
-            
+            property_id = uuid.UUID(str(property_id))
+        except ValueError:
             return Response(
-                {'detail': 'Property added to favorites', 'is_favorite': True},
-                status=status.HTTP_201_CREATED
+                {'detail': 'Property not found'},
+                status=status.HTTP_404_NOT_FOUND
             )
-        except Property.DoesNotExist:
+        
+        with transaction.atomic():
+            added = toggle_favorite(request.user.pk, property_id)
+            if added:
+                enqueue(notify_seller_of_favorite, property_id=str(property_id))
+        if added is None:
             return Response(
                 {'detail': 'Property not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        if not added:
+            return Response(
+                {'detail': 'Property removed from favorites', 'is_favorite': False}
+            )
+        return Response(
+            {'detail': 'Property added to favorites', 'is_favorite': True},
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['get', 'post'], url_path='status')
+    def batch_status(self, request):
+        """
+        Favorite flags for up to MAX_STATUS_IDS properties, from ``?ids=a,b`` or a
+        POSTed ``property_ids`` list; ids are echoed back as sent
+        """
+        if request.method == 'POST':
+            field = 'property_ids'
+            ids = request.data.get(field)
+            if not isinstance(ids, list):
+                raise ValidationError({field: 'A list of property ids is required.'})
+        else:
+            field = 'ids'
+            ids = [value for value in request.query_params.get(field, '').split(',') if value]
+        # Errors are reported under the parameter the client sent
+        if not ids:
+            raise ValidationError({field: 'At least one property id is required.'})
+        if len(ids) > MAX_STATUS_IDS:
+            raise ValidationError({field: f'At most {MAX_STATUS_IDS} ids per request.'})
+        try:
+            parsed = [uuid.UUID(str(value)) for value in ids]
+        except ValueError:
+            raise ValidationError({field: 'Property ids must be UUIDs.'})
+
+        favorite_ids = favorite_ids_for(request)
+        return Response({str(value): property_id in favorite_ids for value, property_id in zip(ids, parsed)})
 
 
 class AgencyViewSet(viewsets.ReadOnlyModelViewSet):
@@ -273,33 +559,35 @@ class AgencyViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=True, methods=['get'])
     def properties(self, request, pk=None):
-        """Get all properties listed by an agency"""
+        """Get the available properties listed by an agency, paginated"""
         agency = self.get_object()
-        properties = agency.properties.filter(status='available')
-        serializer = PropertyListSerializer(properties, many=True)
-        return Response(serializer.data)
+        fieldset = requested_fieldset(request, PropertyListSerializer)
+        properties = card_rows(listing_queryset(fieldset).filter(agency=agency, status='available'), fieldset)
+        page = self.paginate_queryset(properties)
+        serializer = PropertyListSerializer(page, many=True, context=card_context(request, fieldset))
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['get'])
     def agents(self, request, pk=None):
-        """Get all agents in an agency"""
+        """Get the agents in an agency, paginated"""
         agency = self.get_object()
-        agents = agency.agents.all()
-        serializer = UserProfileSerializer(agents, many=True)
-        return Response(serializer.data)
+        agents = agency.agents.select_related('user').order_by('user__first_name', 'user__last_name', 'pk')
+        page = self.paginate_queryset(agents)
+        serializer = UserProfileSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
 def analytics(request):
-    """Get platform analytics"""
-    return Response({
-        'total_properties': Property.objects.count(),
-        'total_inquiries': Inquiry.objects.count(),
-        'available_properties': Property.objects.filter(status='available').count(),
-        'for_sale': Property.objects.filter(listing_type='sale', status='available').count(),
-        'for_rent': Property.objects.filter(listing_type='rent', status='available').count(),
-        'total_users': UserProfile.objects.count(),
-        'verified_agencies': Agency.objects.filter(verification_status='verified').count(),
-        'total_reviews': Review.objects.count(),
-        'completed_transactions': Transaction.objects.filter(status='completed').count(),
-    })
+    """Get platform analytics from the maintained PlatformStats snapshot"""
+    stats = PlatformStats.current()
+    data = {name: getattr(stats, name) for name in PlatformStats.COUNTER_FIELDS}
+    data['as_of'] = stats.as_of
+    return Response(data)
+
 
+def metrics(request):
+    """Per-view request, latency and SQL metrics in Prometheus text format"""
+    if not scrape_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')